@@ -0,0 +1,304 @@
+"""Measures end-to-end rex latency on synthetic repositories.
+
+Run from the repository root:
+
+    python benchmarks/benchmark.py --output results.json
+    python benchmarks/benchmark.py --baseline results.json
+
+Each measurement is the median of several runs. When a baseline from an earlier
+run is given, the run fails if any measurement regressed by more than the
+threshold.
+"""
+
+import json
+import os
+import platform
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import median
+from subprocess import DEVNULL, check_call, check_output, run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from git_rex import git
+from git_rex.bash import BashScript
+from git_rex.messages import extract_scripts
+from git_rex.python import PythonScript
+
+RESULTS_VERSION = 1
+IDENTITY = {
+    "GIT_AUTHOR_NAME": "Benchmark Runner",
+    "GIT_AUTHOR_EMAIL": "benchmark-runner@example.com",
+    "GIT_COMMITTER_NAME": "Benchmark Runner",
+    "GIT_COMMITTER_EMAIL": "benchmark-runner@example.com",
+}
+SCRIPT_COMMIT_MESSAGE = """Benchmark commit
+
+```bash
+echo 'Line appended by rex-commit' >> file.txt
+```
+"""
+REX = [sys.executable, "-c", "import git_rex ; git_rex.main()"]
+
+
+def measure(
+    fn: Callable[[], object],
+    *,
+    repeat: int,
+    setup: Optional[Callable[[], object]] = None,
+) -> float:
+    """The median time fn takes, in seconds, running setup untimed before each."""
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = perf_counter()
+        fn()
+        durations.append(perf_counter() - start)
+    return median(durations)
+
+
+def quiet(*args: str) -> None:
+    check_call(args, stdout=DEVNULL)
+
+
+def init_repo(path: Path) -> None:
+    path.mkdir()
+    os.chdir(path)
+    quiet("git", "init", "--quiet", "--initial-branch=main")
+
+
+def write_files(count: int, prefix: str) -> None:
+    """Writes count small files, a hundred to a directory."""
+    for i in range(count):
+        directory = Path(f"{prefix}{i // 100}")
+        directory.mkdir(exist_ok=True)
+        (directory / f"file{i}.txt").write_text(f"Contents of file {i}\n")
+
+
+def commit_all(message: str) -> None:
+    quiet("git", "add", "-A")
+    quiet("git", "commit", "--quiet", "--allow-empty", "-m", message)
+
+
+def write_history(commits: int) -> None:
+    """Commits a long linear history quickly, with git fast-import."""
+    stream = []
+    for i in range(commits):
+        message = f"Commit {i}\n".encode()
+        contents = f"Version {i}\n".encode()
+        stream += [
+            b"commit refs/heads/main\n",
+            b"committer Benchmark Runner <benchmark-runner@example.com> %d +0000\n"
+            % (1_600_000_000 + i),
+            b"data %d\n%s" % (len(message), message),
+            b"M 100644 inline history.txt\n",
+            b"data %d\n%s\n" % (len(contents), contents),
+        ]
+    run(["git", "fast-import", "--quiet"], input=b"".join(stream), check=True)
+
+
+def modify_files(count: int, prefix: str) -> None:
+    for i in range(count):
+        with open(f"{prefix}{i // 100}/file{i}.txt", "a") as f:
+            f.write("Modified\n")
+
+
+def run_benchmarks(root: Path, *, scale: float, repeat: int) -> Dict[str, float]:
+    tracked = max(1, int(5000 * scale))
+    untracked = max(1, int(2000 * scale))
+    history = max(2, int(1000 * scale))
+    blocks = max(1, int(50 * scale))
+    modified = max(1, int(200 * scale))
+    results = {}
+
+    def record(name: str, seconds: float) -> None:
+        results[name] = seconds
+        print(f"{seconds * 1000:10.2f} ms  {name}", file=sys.stderr)
+
+    record("startup", measure(lambda: quiet(*REX, "--help"), repeat=repeat))
+
+    init_repo(root / "tracked")
+    write_files(tracked, "dir")
+    commit_all("Many tracked files")
+    record(
+        f"clean check ({tracked} tracked files)",
+        measure(git.is_clean_repo, repeat=repeat),
+    )
+
+    def unstage_and_modify() -> None:
+        quiet("git", "reset", "--quiet")
+        modify_files(modified, "dir")
+
+    record(
+        f"stage changes ({modified} modified files)",
+        measure(git.stage_changes, repeat=repeat, setup=unstage_and_modify),
+    )
+    quiet("git", "reset", "--quiet", "--hard")
+
+    def modify_and_stage() -> None:
+        modify_files(1, "dir")
+        git.stage_changes()
+
+    record(
+        "commit",
+        measure(lambda: git.commit("Commit"), repeat=repeat, setup=modify_and_stage),
+    )
+    record(
+        "commit (plumbing)",
+        measure(
+            lambda: git.commit_index("Commit"), repeat=repeat, setup=modify_and_stage
+        ),
+    )
+    quiet("git", "reset", "--quiet", "--hard")
+    base = git.Commit("HEAD").hash
+    Path("file.txt").write_text("First line\n")
+    commit_all(SCRIPT_COMMIT_MESSAGE)
+    script_commit = git.Commit("HEAD").hash
+    record(
+        f"git rex end to end ({tracked} tracked files)",
+        measure(
+            lambda: quiet(*REX, "--no-cache", script_commit),
+            repeat=repeat,
+            setup=lambda: quiet("git", "reset", "--quiet", "--hard", base),
+        ),
+    )
+
+    init_repo(root / "untracked")
+    commit_all("Initial commit")
+    write_files(untracked, "untracked")
+    record(
+        f"clean check ({untracked} untracked files)",
+        measure(git.is_clean_repo, repeat=repeat),
+    )
+
+    init_repo(root / "history")
+    write_history(history)
+    quiet("git", "reset", "--quiet", "--hard")
+    record(
+        "message fetch",
+        measure(lambda: git.Commit(f"HEAD~{history // 2}").message, repeat=repeat),
+    )
+    record(
+        f"expand range ({history} commits)",
+        measure(
+            lambda: git.expand_revisions([f"main~{history - 1}..main"]), repeat=repeat
+        ),
+    )
+    record(
+        f"list scripts ({history} commits)",
+        measure(lambda: quiet(*REX, "--list"), repeat=repeat),
+    )
+
+    message = "Many blocks\n" + "".join(
+        f"\n```bash\necho {i} >> file.txt\n```\n" for i in range(blocks)
+    )
+    record(
+        f"extract scripts ({blocks} blocks)",
+        measure(lambda: extract_scripts(message), repeat=repeat),
+    )
+    os.chdir(root / "tracked")
+    record(
+        "bash block overhead",
+        measure(lambda: BashScript(1, ("true",)).execute(), repeat=repeat),
+    )
+    record(
+        "python block overhead",
+        measure(lambda: PythonScript(1, ("pass",)).execute(), repeat=repeat),
+    )
+    return results
+
+
+def regressions(
+    results: Dict[str, float],
+    baseline: Dict[str, float],
+    *,
+    threshold: float,
+    min_delta: float = 0.005,
+) -> List[str]:
+    """Describes each measurement more than threshold slower than the baseline.
+
+    Differences under min_delta seconds are ignored, as they are mostly noise.
+
+    >>> regressions({"a": 1.5, "b": 1.1}, {"a": 1.0, "b": 1.0}, threshold=0.25)
+    ['a: 1500.00 ms, baseline 1000.00 ms (+50%)']
+    """
+    found = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if seconds > before * (1 + threshold) and seconds - before > min_delta:
+            found.append(
+                f"{name}: {seconds * 1000:.2f} ms, baseline {before * 1000:.2f} ms"
+                f" (+{(seconds / before - 1) * 100:.0f}%)"
+            )
+    return found
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0], allow_abbrev=False)
+    parser.add_argument("--output", metavar="file", help="Write results as JSON")
+    parser.add_argument(
+        "--baseline", metavar="file", help="Compare against results in file"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Fraction slower than the baseline that fails the run (default: 0.25)",
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiply the size of the synthetic repositories (default: 1)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs per measurement (default: 5)"
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            parser.error(f"baseline was run with --scale {baseline.get('scale')}")
+    output = os.path.abspath(args.output) if args.output else None
+
+    os.environ.update(IDENTITY)
+    cwd = os.getcwd()
+    with TemporaryDirectory() as temp_dir:
+        try:
+            results = run_benchmarks(
+                Path(temp_dir), scale=args.scale, repeat=args.repeat
+            )
+        finally:
+            os.chdir(cwd)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(
+                {
+                    "version": RESULTS_VERSION,
+                    "scale": args.scale,
+                    "python": platform.python_version(),
+                    "git": check_output(["git", "--version"], text=True).strip(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    if baseline:
+        found = regressions(results, baseline["results"], threshold=args.threshold)
+        for regression in found:
+            print(f"regression: {regression}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Reexecutes commits from Python, without starting a git rex process per commit.
+
+Unlike the command line, the API never changes the process's working
+directory, exits, or keeps state outside the Repository handles it returns:
+each handle has its own metadata cache and git cat-file processes, reused
+across calls until it is closed. Problems are raised as exceptions, such as
+git.UnstagedChanges, git.GitFailure, ScriptFailed, or those of messages for
+commit messages rex cannot execute.
+
+Python code blocks run inside the calling process, so while one runs, the
+process's working directory is the repository's.
+"""
+
+import os
+from time import perf_counter
+from types import TracebackType
+from typing import List, Optional, Sequence, Type
+
+from . import cache, git
+from .bash import UserCodeError
+from .cache import CacheSettings
+from .messages import Script, extract_scripts, script_paths
+from .resources import ResourceLimits, ResourceUsage
+
+
+class BlockResult:
+    """How one code block ran: its exit code, how long it took, and what it used.
+
+    usage is None if the block failed.
+    """
+
+    def __init__(
+        self,
+        *,
+        first_lineno: int,
+        syntax: str,
+        exit_code: int,
+        duration: float,
+        usage: Optional[ResourceUsage],
+    ):
+        self.first_lineno = first_lineno
+        self.syntax = syntax
+        self.exit_code = exit_code
+        self.duration = duration
+        self.usage = usage
+
+
+class ReexecuteResult:
+    """The outcome of reexecuting a commit.
+
+    commit_hash is the new commit, or None if it was not committed. blocks is
+    empty if the result was reused from the cache.
+    """
+
+    def __init__(
+        self,
+        *,
+        commit_hash: Optional[str],
+        tree: str,
+        blocks: List[BlockResult],
+        changed_paths: List[str],
+        from_cache: bool,
+    ):
+        self.commit_hash = commit_hash
+        self.tree = tree
+        self.blocks = blocks
+        self.changed_paths = changed_paths
+        self.from_cache = from_cache
+
+
+class ScriptFailed(Exception):
+    """A code block exited with a nonzero status; it is the last of blocks."""
+
+    def __init__(self, blocks: List[BlockResult]):
+        self.blocks = blocks
+
+    @property
+    def exit_code(self) -> int:
+        return self.blocks[-1].exit_code
+
+
+class Repository:
+    """A handle on a repository's working tree, for reexecuting commits in it.
+
+    Use it as a context manager, or call close, to stop its git processes.
+    """
+
+    def __init__(self, path: str = "."):
+        workspace = git.Workspace(os.path.abspath(path))
+        try:
+            with git.active(workspace):
+                top_level = str(git.top_level())
+        finally:
+            workspace.close()
+        self.path = top_level
+        self._workspace = git.Workspace(top_level)
+
+    def __enter__(self) -> "Repository":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._workspace.close()
+
+    def reexecute(
+        self,
+        rev: str,
+        *,
+        no_commit: bool = False,
+        plumbing: bool = False,
+        use_cache: Optional[bool] = None,
+        limits: Optional[ResourceLimits] = None,
+        verbose: bool = False,
+    ) -> ReexecuteResult:
+        """Runs the scripts in rev's message on HEAD, and commits the result.
+
+        As on the command line, the working tree must have no uncommitted
+        changes (except staged ones, with no_commit) in the paths the scripts
+        change. With no_commit, changes are staged, and the message stored for
+        the next git commit. With plumbing, commit hooks are skipped. The
+        result cache is used if use_cache is true, or if it is None and
+        rex.cache is set.
+        """
+        # Config, and so the cache settings, may have changed since the last call
+        self._workspace.metadata.clear()
+        with git.active(self._workspace):
+            original_commit = git.Commit(rev)
+            scripts = extract_scripts(original_commit.message)
+            paths = script_paths(scripts)
+            if no_commit:
+                is_clean = git.no_unstaged_changes(paths)
+            else:
+                is_clean = git.is_clean_repo(paths)
+            if not is_clean:
+                raise git.UnstagedChanges()
+
+            settings = CacheSettings.from_config(
+                git.config_values(r"^rex\."), use_cache=use_cache, refresh=False
+            )
+            input_tree = git.write_tree()
+            key = cache.cache_key(scripts, input_tree, settings.env_names)
+            cached_tree = cache.lookup(key) if settings.enabled else None
+            blocks: List[BlockResult] = []
+            if cached_tree:
+                git.switch_tree(input_tree, cached_tree)
+                result_tree = cached_tree
+            else:
+                blocks = self._run(scripts, limits=limits, verbose=verbose)
+                git.stage_changes(paths)
+                result_tree = git.write_tree()
+                if settings.enabled:
+                    cache.store(key, result_tree, input_tree)
+
+            if no_commit:
+                git.store_commit_message(original_commit.message)
+            elif plumbing:
+                git.commit_index(original_commit.message, author=original_commit.author)
+            else:
+                git.commit_with_meta_from(original_commit)
+            changed = git.git(
+                "diff-tree", "-r", "-z", "--name-only", input_tree, result_tree
+            )
+            return ReexecuteResult(
+                commit_hash=None if no_commit else git.head(),
+                tree=result_tree,
+                blocks=blocks,
+                changed_paths=[path for path in changed.decode().split("\0") if path],
+                from_cache=cached_tree is not None,
+            )
+
+    def _run(
+        self,
+        scripts: Sequence[Script],
+        *,
+        limits: Optional[ResourceLimits],
+        verbose: bool,
+    ) -> List[BlockResult]:
+        blocks = []
+        for script in scripts:
+            start = perf_counter()
+            try:
+                usage = script.execute(verbose=verbose, limits=limits, cwd=self.path)
+            except UserCodeError as e:
+                blocks.append(
+                    BlockResult(
+                        first_lineno=script.first_lineno,
+                        syntax=script.syntax,
+                        exit_code=e.resultcode,
+                        duration=perf_counter() - start,
+                        usage=None,
+                    )
+                )
+                raise ScriptFailed(blocks) from None
+            blocks.append(
+                BlockResult(
+                    first_lineno=script.first_lineno,
+                    syntax=script.syntax,
+                    exit_code=0,
+                    duration=usage.wall,
+                    usage=usage,
+                )
+            )
+        return blocks
@@ -1,8 +1,19 @@
 import os
-from subprocess import DEVNULL, call
-from typing import Tuple
+import sys
+from functools import lru_cache
+from shlex import quote
+from subprocess import PIPE
+from tempfile import TemporaryDirectory
+from time import time
+from typing import List, Optional, Tuple
 
-TEMP_REX_SCRIPT = ".git/REX_SCRIPT"
+from .process import Process
+from .resources import TIMEOUT_EXIT_CODE, ResourceLimits, ResourceUsage, run
+from .timings import CommandTiming, durations
+
+SCRIPT_NAME = "REX_SCRIPT"
+# Timing commands needs {fd}> redirections (bash 4.1) and $EPOCHREALTIME (bash 5)
+TIMINGS_BASH_VERSION = 5
 
 
 class UserCodeError(Exception):
@@ -10,8 +21,44 @@ class UserCodeError(Exception):
         self.resultcode = resultcode
 
 
-def script_preamble(first_lineno: int, verbose: bool) -> str:
+class UnsupportedBashVersion(Exception):
+    def __init__(self, version: str):
+        self.version = version
+
+
+@lru_cache(maxsize=None)
+def bash_version() -> str:
+    """The version of bash that scripts run with, as $BASH_VERSION reports it."""
+    p = Process(["bash", "-c", "echo $BASH_VERSION"], stdout=PIPE)
+    stdout, _ = p.communicate()
+    return stdout.decode("utf-8", errors="replace").strip()
+
+
+def check_timings_supported() -> None:
+    """Raises UnsupportedBashVersion if bash is too old to time commands.
+
+    macOS still ships bash 3.2 as /bin/bash.
+    """
+    version = bash_version()
+    major = version.split(".", 1)[0]
+    if not major.isdigit() or int(major) < TIMINGS_BASH_VERSION:
+        raise UnsupportedBashVersion(version)
+
+
+def script_preamble(
+    first_lineno: int, verbose: bool, timings_file: Optional[str] = None
+) -> str:
+    timing = []
+    if timings_file:
+        timing = [
+            "exec {REX_TIMINGS_FD}>%s" % quote(timings_file).replace("%", "%%"),
+            # Record when each command starts, hiding the trap from set -x
+            """trap '{ printf "%%s %%d %%s\\0" "$EPOCHREALTIME" """
+            """"$((LINENO+(%(offset)d)))" "$BASH_COMMAND" >&$REX_TIMINGS_FD ; } """
+            "2>/dev/null' DEBUG",
+        ]
     preamble = [
+        *timing,
         "set -eo pipefail",
         # Trap errors to output a failure message
         "trap '("
@@ -28,9 +75,14 @@ def script_preamble(first_lineno: int, verbose: bool) -> str:
 
 
 class BashScript:
-    def __init__(self, first_lineno: int, script: Tuple[str, ...]):
+    syntax = "bash"
+
+    def __init__(
+        self, first_lineno: int, script: Tuple[str, ...], *, paths: Tuple[str, ...] = ()
+    ):
         self.first_lineno = first_lineno
         self.script = script
+        self.paths = paths  # Pathspecs it declares it changes; empty if unbounded
 
     def __repr__(self):
         return (
@@ -43,13 +95,84 @@ class BashScript:
             for (lineno, line) in enumerate(self.script, start=self.first_lineno)
         )
 
-    def execute(self, *, verbose: bool = False) -> None:
+    def execute(
+        self,
+        *,
+        verbose: bool = False,
+        timings: Optional[List[CommandTiming]] = None,
+        limits: Optional[ResourceLimits] = None,
+        cwd: Optional[str] = None,
+    ) -> ResourceUsage:
+        """Runs the script, appending how long each command took to timings.
+
+        Returns the resources the script used. The script is written to a private
+        temporary directory, rather than the git directory, so that runs in
+        linked worktrees and concurrent runs work. It runs in cwd, if given,
+        rather than the current directory.
+        """
+        with TemporaryDirectory(prefix="git-rex-") as temp_dir:
+            script_file = os.path.join(temp_dir, SCRIPT_NAME)
+            if timings is None:
+                return self._execute(
+                    script_file,
+                    verbose=verbose,
+                    timings_file=None,
+                    limits=limits,
+                    cwd=cwd,
+                )
+            check_timings_supported()
+            timings_file = os.path.join(temp_dir, "timings")
+            try:
+                return self._execute(
+                    script_file,
+                    verbose=verbose,
+                    timings_file=timings_file,
+                    limits=limits,
+                    cwd=cwd,
+                )
+            finally:
+                timings.extend(self._read_timings(timings_file, end=time()))
+
+    def _execute(
+        self,
+        script_file: str,
+        *,
+        verbose: bool,
+        timings_file: Optional[str],
+        limits: Optional[ResourceLimits],
+        cwd: Optional[str],
+    ) -> ResourceUsage:
+        with open(script_file, "w") as f:
+            preamble = script_preamble(self.first_lineno, verbose, timings_file)
+            print(preamble, file=f)
+            print("\n".join(self.script), file=f)
+        resultcode, usage, timed_out = run(
+            ["bash", script_file], limits=limits, cwd=cwd
+        )
+        if timed_out:
+            assert limits and limits.timeout is not None
+            timeout = limits.timeout
+            print(
+                f"error: {self.first_lineno}: script timed out after {timeout:g}s",
+                file=sys.stderr,
+            )
+            raise UserCodeError(TIMEOUT_EXIT_CODE)
+        if resultcode != 0:
+            raise UserCodeError(resultcode)
+        return usage
+
+    def _read_timings(self, timings_file: str, *, end: float) -> List[CommandTiming]:
         try:
-            with open(TEMP_REX_SCRIPT, "w") as f:
-                print(script_preamble(self.first_lineno, verbose), file=f)
-                print("\n".join(self.script), file=f)
-            resultcode = call(["bash", TEMP_REX_SCRIPT], stdin=DEVNULL)
-            if resultcode != 0:
-                raise UserCodeError(resultcode)
-        finally:
-            os.remove(TEMP_REX_SCRIPT)
+            with open(timings_file, "rb") as f:
+                records = f.read().decode("utf-8", errors="replace").split("\0")
+        except FileNotFoundError:
+            return []
+        starts = []
+        for record in records:
+            started, _, rest = record.partition(" ")
+            lineno, _, command = rest.partition(" ")
+            if not started:
+                continue
+            if int(lineno) >= self.first_lineno:  # Skip the preamble
+                starts.append((float(started), int(lineno), command))
+        return durations(starts, end)
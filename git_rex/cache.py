@@ -0,0 +1,284 @@
+"""Caches the trees scripts produce, keyed by the scripts and the tree they ran on.
+
+Each result is stored in the git object database as a parentless commit of the
+resulting tree, referenced by refs/rex/cache/<key>. The number of hits, and
+when each entry was last hit, are kept in rex/cache-usage.json in the common
+git directory. Misses write nothing, so the cache costs little when it is cold.
+"""
+
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from hashlib import sha1
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from . import git
+from .messages import Script
+
+log = getLogger(__name__)
+
+CACHE_REFS = "refs/rex/cache/"
+KEY_VERSION = "git-rex result cache 1"
+CACHE_IDENTITY = {
+    "GIT_AUTHOR_NAME": "git-rex",
+    "GIT_AUTHOR_EMAIL": "git-rex@localhost",
+    "GIT_COMMITTER_NAME": "git-rex",
+    "GIT_COMMITTER_EMAIL": "git-rex@localhost",
+}
+
+
+class CacheSettings:
+    def __init__(self, *, enabled: bool, refresh: bool, env_names: List[str]):
+        self.enabled = enabled
+        self.refresh = refresh
+        self.env_names = env_names
+
+    @classmethod
+    def from_config(
+        cls, config: Dict[str, str], *, use_cache: Optional[bool], refresh: bool
+    ) -> "CacheSettings":
+        """Reads settings from rex.cache and rex.cacheEnv, and the command line.
+
+        The cache is off unless rex.cache, use_cache or refresh turns it on;
+        use_cache=False turns it off regardless.
+        """
+        if use_cache is None:
+            use_cache = refresh or not git.is_false(config.get("rex.cache", "false"))
+        return cls(
+            enabled=use_cache,
+            refresh=refresh,
+            env_names=config.get("rex.cacheenv", "").split(),
+        )
+
+
+def cache_key(
+    scripts: Sequence[Script], input_tree: str, env_names: Iterable[str]
+) -> str:
+    """Hashes everything that determines the tree the scripts will produce.
+
+    Fields are length-prefixed so that no two inputs serialize the same way.
+    """
+    key = sha1()
+
+    def add(field: str) -> None:
+        data = field.encode("utf-8")
+        key.update(b"%d:%s," % (len(data), data))
+
+    add(KEY_VERSION)
+    add(input_tree)
+    for name in sorted(env_names):
+        add(name)
+        add(os.environ.get(name, ""))
+    for script in scripts:
+        add(script.syntax)
+        add("\n".join(script.script))
+        if script.paths:  # Only changes to these paths are staged
+            add("paths " + ",".join(script.paths))
+    return key.hexdigest()
+
+
+def usage_file() -> Path:
+    return git.common_dir() / "rex" / "cache-usage.json"
+
+
+def read_usage() -> Dict[str, Any]:
+    try:
+        with open(usage_file()) as f:
+            usage: Dict[str, Any] = json.load(f)
+    except (FileNotFoundError, ValueError):
+        usage = {}
+    usage.setdefault("hits", 0)
+    usage.setdefault("last_used", {})
+    return usage
+
+
+def write_usage(usage: Dict[str, Any]) -> None:
+    """Replaces the usage file atomically, so readers never see it half-written."""
+    path = usage_file()
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}")
+    with open(temp_path, "w") as f:
+        json.dump(usage, f)
+    os.replace(temp_path, path)
+
+
+@contextmanager
+def updating_usage() -> Iterator[Dict[str, Any]]:
+    """Reads the usage for the body to change, then writes it back.
+
+    Holds a lock throughout, so concurrent runs do not lose each other's updates.
+    """
+    path = usage_file()
+    path.parent.mkdir(exist_ok=True)
+    with open(path.with_name(f"{path.name}.lock"), "ab") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        usage = read_usage()
+        yield usage
+        write_usage(usage)
+
+
+def record_hit(key: str) -> None:
+    """Counts a hit, and dates the use of key's entry."""
+    with updating_usage() as usage:
+        usage["hits"] += 1
+        usage["last_used"][key] = int(time.time())
+
+
+def lookup(key: str) -> Optional[str]:
+    """Returns the cached result tree for key, if any."""
+    try:
+        result_tree = git.object_reader().resolve(f"{CACHE_REFS}{key}^{{tree}}")
+    except git.ObjectNotFound:
+        return None
+    record_hit(key)
+    return result_tree
+
+
+def store(key: str, result_tree: str, input_tree: str) -> None:
+    try:
+        entry = git.git(
+            "commit-tree",
+            result_tree,
+            input=f"git-rex cached result\n\nInput tree: {input_tree}\n".encode(),
+            env=CACHE_IDENTITY,
+        )
+        git.git("update-ref", f"{CACHE_REFS}{key}", entry.decode("ascii").strip())
+    except git.GitFailure as e:
+        log.warning("Could not cache script results: %s", e.message)
+
+
+class CacheEntry:
+    def __init__(self, key: str, commit_hash: str, last_used: int):
+        self.key = key
+        self.commit_hash = commit_hash
+        self.last_used = last_used
+
+
+def entries() -> List[CacheEntry]:
+    """All cache entries, most recently used first.
+
+    Entries never used in this repository, such as imported ones, are dated by
+    when they were created.
+    """
+    last_used = read_usage()["last_used"]
+    refs = git.git(
+        "for-each-ref",
+        "--format=%(refname:lstrip=3) %(objectname) %(committerdate:unix)",
+        CACHE_REFS,
+    )
+    cache_entries = []
+    for line in refs.decode("ascii").splitlines():
+        key, commit_hash, created = line.split()
+        cache_entries.append(
+            CacheEntry(key, commit_hash, last_used.get(key, int(created)))
+        )
+    return sorted(cache_entries, key=lambda entry: entry.last_used, reverse=True)
+
+
+def disk_usage(cache_entries: Sequence[CacheEntry]) -> int:
+    """Bytes used by objects the entries reference, but no branch tip does.
+
+    This approximates the space evicting the entries would free, without the
+    cost of walking the whole history.
+    """
+    if not cache_entries:
+        return 0
+    entry_commits = "".join(f"{entry.commit_hash}\n" for entry in cache_entries)
+    branch_trees = git.git(
+        "for-each-ref", "--format=^%(objectname)^{tree}", "refs/heads/", "refs/remotes/"
+    )
+    objects = git.git(
+        "rev-list",
+        "--objects",
+        "--no-object-names",
+        "--stdin",
+        input=entry_commits.encode("ascii") + branch_trees,
+    )
+    sizes = git.git("cat-file", "--batch-check=%(objectsize:disk)", input=objects)
+    return sum(int(size) for size in sizes.split())
+
+
+def evict(*, max_size: Optional[int], max_age_days: Optional[float]) -> int:
+    """Deletes least-recently-used entries to meet the limits given.
+
+    Returns the number of entries deleted. The space they used is reclaimed the
+    next time git garbage-collects the repository.
+    """
+    all_entries = entries()
+    kept = all_entries
+    if max_age_days is not None:
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        kept = [entry for entry in kept if entry.last_used >= cutoff]
+    if max_size is not None and disk_usage(kept) > max_size:
+        # Binary search for the most recently used entries that fit
+        fits, too_big = 0, len(kept)
+        while too_big - fits > 1:
+            middle = (fits + too_big) // 2
+            if disk_usage(kept[:middle]) <= max_size:
+                fits = middle
+            else:
+                too_big = middle
+        kept = kept[:fits]
+
+    kept_keys = {entry.key for entry in kept}
+    evicted = [entry for entry in all_entries if entry.key not in kept_keys]
+    if evicted:
+        git.git(
+            "update-ref",
+            "--stdin",
+            input="".join(
+                f"delete {CACHE_REFS}{entry.key} {entry.commit_hash}\n"
+                for entry in evicted
+            ).encode("ascii"),
+        )
+    # Also forgets keys with no entry, such as those of entries deleted by hand
+    with updating_usage() as usage:
+        last_used = usage["last_used"]
+        usage["last_used"] = {
+            key: last_used[key] for key in kept_keys if key in last_used
+        }
+    return len(evicted)
+
+
+def export_bundle(filename: str) -> None:
+    git.git("bundle", "create", "--quiet", filename, f"--glob={CACHE_REFS}")
+
+
+def import_bundle(filename: str) -> int:
+    """Adds the entries in a bundle to the cache, returning how many were new."""
+    before = len(entries())
+    git.git("fetch", "--quiet", filename, f"+{CACHE_REFS}*:{CACHE_REFS}*")
+    return len(entries()) - before
+
+
+def parse_size(size: str) -> int:
+    """Parses a size in bytes, with an optional k, m or g suffix, like git config.
+
+    >>> parse_size("500m")
+    524288000
+    """
+    multiplier = 1
+    suffix = size[-1:].lower()
+    if suffix in ("k", "m", "g"):
+        multiplier = 1024 ** (" kmg".index(suffix))
+        size = size[:-1]
+    return int(size) * multiplier
+
+
+def format_size(size: int) -> str:
+    """Formats a size in bytes for humans.
+
+    >>> format_size(3565158)
+    '3.4 MiB'
+    """
+    value = float(size)
+    for unit in ("bytes", "KiB", "MiB"):
+        if value < 1024:
+            break
+        value /= 1024
+    else:
+        unit = "GiB"
+    return f"{value:.0f} {unit}" if unit == "bytes" else f"{value:.1f} {unit}"
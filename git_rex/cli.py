@@ -0,0 +1,953 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import groupby
+from logging import getLogger
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from . import (
+    cache,
+    git,
+    index,
+    output,
+    process,
+    profile,
+    rebase,
+    server,
+    verify,
+    worktree,
+)
+from .bash import TIMINGS_BASH_VERSION, UnsupportedBashVersion, UserCodeError
+from .cache import CacheSettings
+from .editor import EditorError, EditorUnset, spawn_editor
+from .git import UnstagedChanges
+from .log_config import configure_logging, set_verbosity
+from .messages import (
+    NoExecutableCodeFound,
+    NoScriptBlockFound,
+    Script,
+    UnexpectedCodeBlock,
+    UnsupportedCodeAttribute,
+    UnsupportedCodeSyntax,
+    UnterminatedCodeBlock,
+    cleanup_message,
+    extract_scripts,
+    script_paths,
+    strip_whitespace,
+    summarize_scripts,
+)
+from .resources import ResourceLimits
+from .timings import CommandTiming, report_slowest
+
+log = getLogger(__name__)
+T = TypeVar("T")
+
+# Enough to run all the startup queries at once
+STARTUP_THREADS = 4
+# Files changed outside the scripts' declared paths listed in the warning
+MAX_PATHS_SHOWN = 5
+
+DEFAULT_COMMIT_TEMPLATE = """Automated commit created with git-rex
+
+The following commands were executed:
+
+# Enter your script here. It will be executed, and all files created
+# or changed committed to your repository.
+```bash
+
+```
+
+# Please enter the commit message for your changes. Lines starting
+# with '#', except those in script sections, will be ignored, and an
+# empty commit message, or one with no script commands to execute,
+# aborts the commit.
+"""
+
+
+class InvocationError(Exception):
+    pass
+
+
+def get_message_to_execute(commit: Optional[git.Commit], *, edit: bool) -> str:
+    with profile.span("read message"):
+        message = (
+            commit.message if commit else DEFAULT_COMMIT_TEMPLATE if edit else None
+        )
+    if message is None:
+        raise InvocationError()
+
+    if edit:
+        with profile.span("edit message"):
+            # A private directory, so concurrent runs do not share the file, but
+            # the name git uses, so editors recognize it as a commit message
+            with TemporaryDirectory(prefix="rex-", dir=git.git_dir()) as temp_dir:
+                raw_edited_message = spawn_editor(
+                    message, filename=os.path.join(temp_dir, "COMMIT_EDITMSG")
+                )
+        return cleanup_message(raw_edited_message)
+    else:
+        return message
+
+
+def run_scripts(
+    scripts: Sequence[Script],
+    *,
+    verbose: bool,
+    time_commands: bool,
+    limits: ResourceLimits,
+    report_usage: bool,
+) -> None:
+    timings: Optional[List[CommandTiming]] = [] if time_commands else None
+    try:
+        for script in scripts:
+            label = f"{script.first_lineno}: {script.syntax} script"
+            with profile.span(f"{script.syntax} script", line=script.first_lineno):
+                with output.captured(label):
+                    usage = script.execute(
+                        verbose=verbose, timings=timings, limits=limits
+                    )
+            if report_usage:
+                print(f"usage: {label}: {usage}", file=sys.stderr)
+    finally:
+        if timings is not None:
+            report_slowest(timings, sys.stderr)
+    paths = script_paths(scripts)
+    with profile.span("stage changes"):
+        git.stage_changes(paths)
+    if paths:
+        warn_of_changes_outside(paths)
+
+
+def warn_of_changes_outside(paths: Sequence[str]) -> None:
+    """Warns of changes the scripts' declared paths left unstaged."""
+    with profile.span("scope check"):
+        outside = git.changed_paths_outside(paths)
+    if outside:
+        shown = ", ".join(outside[:MAX_PATHS_SHOWN])
+        if len(outside) > MAX_PATHS_SHOWN:
+            shown += f" and {len(outside) - MAX_PATHS_SHOWN} more"
+        log.warning(
+            "Files outside the scripts' paths (%s) were changed, but not staged: %s",
+            ",".join(paths),
+            shown,
+        )
+
+
+def run_scripts_with_cache(
+    scripts: Sequence[Script],
+    *,
+    verbose: bool,
+    time_commands: bool,
+    limits: ResourceLimits,
+    report_usage: bool,
+    cache_settings: CacheSettings,
+) -> None:
+    with profile.span("cache lookup"):
+        input_tree = git.write_tree()
+        key = cache.cache_key(scripts, input_tree, cache_settings.env_names)
+        result_tree = None if cache_settings.refresh else cache.lookup(key)
+    if result_tree:
+        log.info("Reusing cached result %s of scripts", result_tree)
+        with profile.span("checkout cached result"):
+            git.switch_tree(input_tree, result_tree)
+    else:
+        run_scripts(
+            scripts,
+            verbose=verbose,
+            time_commands=time_commands,
+            limits=limits,
+            report_usage=report_usage,
+        )
+        with profile.span("cache store"):
+            cache.store(key, git.write_tree(), input_tree)
+
+
+def execute_scripts(
+    scripts: Sequence[Script],
+    *,
+    verbose: bool,
+    time_commands: bool,
+    limits: ResourceLimits,
+    report_usage: bool,
+    cache_settings: CacheSettings,
+) -> None:
+    """Runs scripts, or reuses their cached result, and stages the changes."""
+    if cache_settings.enabled:
+        run_scripts_with_cache(
+            scripts,
+            verbose=verbose,
+            time_commands=time_commands,
+            limits=limits,
+            report_usage=report_usage,
+            cache_settings=cache_settings,
+        )
+    else:
+        run_scripts(
+            scripts,
+            verbose=verbose,
+            time_commands=time_commands,
+            limits=limits,
+            report_usage=report_usage,
+        )
+
+
+def commit(
+    commit_message: str,
+    original_commit: Optional[git.Commit],
+    *,
+    no_commit: bool,
+    plumbing: bool,
+) -> None:
+    is_unchanged = original_commit and original_commit.message == commit_message
+    if no_commit:
+        git.store_commit_message(commit_message)
+    elif plumbing and original_commit and is_unchanged:
+        git.commit_index(commit_message, author=original_commit.author)
+    elif plumbing:
+        git.commit_index(strip_whitespace(commit_message))
+    elif original_commit and is_unchanged:
+        git.commit_with_meta_from(original_commit)
+    else:
+        git.commit(commit_message)
+
+
+def parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        description="Reapplies a commit by running commands from the commit message",
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "commits",
+        nargs="*",
+        metavar="commit",
+        help="commit, or range of commits, to reexecute",
+    )
+    parser.add_argument(
+        "--rebase",
+        metavar="upstream",
+        help="Rebase the current branch onto upstream, reexecuting commit scripts",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="List the commits with scripts in their messages, instead of"
+        " reexecuting them; ranges are scanned newest first, as by git log",
+    )
+    parser.add_argument(
+        "--stdin",
+        action="store_true",
+        help="Read additional NUL-separated commits from standard input",
+    )
+    parser.add_argument(
+        "-e", "--edit", action="store_true", help="Edit commit message before executing"
+    )
+    parser.add_argument(
+        "-n",
+        "--no-commit",
+        action="store_true",
+        help="Execute commands and stage changes, but do not commit them",
+    )
+    parser.add_argument(
+        "--isolated",
+        action="store_true",
+        help="Reexecute in a temporary worktree, then update the current branch,"
+        " leaving the working tree and index untouched",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check that each commit's scripts, run on its parent, reproduce its"
+        " tree, instead of reexecuting them; commits are checked in parallel",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        metavar="n",
+        help="Verify up to n commits at once (default: rex.verifyJobs,"
+        " or the number of CPUs)",
+    )
+    parser.add_argument(
+        "--plumbing",
+        action="store_true",
+        help="Commit with git plumbing commands, skipping commit hooks",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse cached script results, and store new ones (default: rex.cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither reuse nor store cached script results",
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Execute scripts even if their results are cached, updating the cache",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="file",
+        help="Write a Chrome trace of where time was spent to file,"
+        " and summarize it on stderr",
+    )
+    parser.add_argument(
+        "--count-processes",
+        action="store_true",
+        help="Report how many processes rex started, and how long they ran,"
+        " by command",
+    )
+    parser.add_argument(
+        "--capture-output",
+        action="store_true",
+        help="Write script output to .git/rex/output.log (or output-<pid>.log, if"
+        " another run is using it), showing only progress, and the last lines of"
+        " output if a script fails",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="seconds",
+        help="Fail any script running longer than this (default: rex.timeout)",
+    )
+    parser.add_argument(
+        "--resource-usage",
+        action="store_true",
+        help="Report the CPU time, memory and I/O each script used",
+    )
+    parser.add_argument(
+        "--time-commands",
+        action="store_true",
+        help="Time each command in the scripts, and report the slowest",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="Output each command before executing it;"
+        " repeat to also output rex's own diagnostics",
+    )
+    return parser
+
+
+def cache_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="git rex cache",
+        description="Maintains the cache of script results",
+        allow_abbrev=False,
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+    commands.add_parser(
+        "stats", help="Show the number and size of entries, and how often they were hit"
+    )
+    evict = commands.add_parser(
+        "evict",
+        help="Delete least-recently-used entries",
+        description="Deletes least-recently-used entries until the limits are met",
+    )
+    evict.add_argument(
+        "--max-size",
+        type=cache.parse_size,
+        help="maximum size, e.g. 500m (default: rex.cacheMaxSize)",
+    )
+    evict.add_argument(
+        "--max-age",
+        type=float,
+        metavar="DAYS",
+        help="evict entries unused for longer than this (default: rex.cacheMaxAge)",
+    )
+    export = commands.add_parser("export", help="Write all entries to a bundle file")
+    export.add_argument("file")
+    import_ = commands.add_parser("import", help="Add the entries in a bundle file")
+    import_.add_argument("file")
+    return parser
+
+
+def index_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="git rex index",
+        description="Maintains and queries an index of the scripts in history",
+        allow_abbrev=False,
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+    commands.add_parser(
+        "update",
+        help="Index commits added since the last update",
+        description="Indexes the commits reachable from any ref or HEAD,"
+        " reading only those added since the last update",
+    )
+    show = commands.add_parser(
+        "show", help="Show the fingerprint of each script in a commit"
+    )
+    show.add_argument("commit")
+    find = commands.add_parser(
+        "find",
+        help="List indexed commits, newest first",
+        description="Updates the index, then lists the matching commits, newest first",
+    )
+    query = find.add_mutually_exclusive_group(required=True)
+    query.add_argument(
+        "--command",
+        dest="command_name",
+        metavar="NAME",
+        help="commits with scripts that run NAME",
+    )
+    query.add_argument(
+        "--same-as",
+        metavar="COMMIT",
+        help="commits sharing a script with COMMIT, ignoring comments and whitespace",
+    )
+    query.add_argument(
+        "--fingerprint", help="commits with a script with this fingerprint"
+    )
+    find.add_argument(
+        "--no-update", action="store_true", help="query the index as it is"
+    )
+    return parser
+
+
+def server_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="git rex server",
+        description="Manages a warm server that runs git rex in this repository",
+        allow_abbrev=False,
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+    start = commands.add_parser(
+        "start",
+        help="Start the server in the background",
+        description="Starts the server in the background, if it is not running",
+    )
+    start.add_argument(
+        "--idle-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="stop after this long without requests"
+        f" (default: rex.serverIdleTimeout, or {server.DEFAULT_IDLE_TIMEOUT:.0f})",
+    )
+    commands.add_parser("stop", help="Stop the server")
+    commands.add_parser("status", help="Show whether the server is running")
+    return parser
+
+
+def config_number(config: Dict[str, str], name: str, parse: Callable[[str], T]) -> T:
+    try:
+        return parse(config[name])
+    except ValueError:
+        raise git.GitFailure(
+            f"bad numeric config value '{config[name]}' for '{name}'"
+        ) from None
+
+
+def rex_cache(argv: List[str]) -> None:
+    args = cache_parser().parse_args(argv)
+    if args.command == "stats":
+        usage = cache.read_usage()
+        entries = cache.entries()
+        print(f"entries:  {len(entries)}")
+        print(f"size:     {cache.format_size(cache.disk_usage(entries))}")
+        print(f"hits:     {usage['hits']}")
+    elif args.command == "evict":
+        config = git.config_values(r"^rex\.cachemax")
+        max_size, max_age = args.max_size, args.max_age
+        if max_size is None and "rex.cachemaxsize" in config:
+            max_size = config_number(config, "rex.cachemaxsize", cache.parse_size)
+        if max_age is None and "rex.cachemaxage" in config:
+            max_age = config_number(config, "rex.cachemaxage", float)
+        if max_size is None and max_age is None:
+            cache_parser().error("evict needs --max-size or --max-age")
+        evicted = cache.evict(max_size=max_size, max_age_days=max_age)
+        print(f"Evicted {evicted} cache entries")
+    elif args.command == "export":
+        cache.export_bundle(args.file)
+    elif args.command == "import":
+        imported = cache.import_bundle(args.file)
+        print(f"Imported {imported} new cache entries")
+
+
+def rex_index(argv: List[str]) -> None:
+    args = index_parser().parse_args(argv)
+    with closing(index.connect()) as db:
+        if args.command == "update":
+            read, indexed = index.update(db)
+            print(f"Indexed {indexed} commits with scripts, of {read} new commits")
+        elif args.command == "show":
+            commit_hash = git.object_reader().resolve_commit(args.commit)
+            for script in index.commit_scripts(db, commit_hash):
+                print(f"{script.first_lineno}:{script.syntax} {script.fingerprint}")
+        elif args.command == "find":
+            if not args.no_update:
+                index.update(db)
+            if args.command_name is not None:
+                hashes = index.commits_running(db, args.command_name)
+            elif args.same_as is not None:
+                commit_hash = git.object_reader().resolve_commit(args.same_as)
+                fingerprints = (
+                    script.fingerprint
+                    for script in index.commit_scripts(db, commit_hash)
+                )
+                hashes = index.commits_with_fingerprints(
+                    db, fingerprints, exclude=commit_hash
+                )
+            else:
+                hashes = index.commits_with_fingerprints(
+                    db, [args.fingerprint], exclude=None
+                )
+            for commit_hash in hashes:
+                print(commit_hash)
+
+
+def rex_server(argv: List[str]) -> None:
+    args = server_parser().parse_args(argv)
+    if args.command == "start":
+        idle_timeout = args.idle_timeout
+        if idle_timeout is None:
+            config = git.config_values(r"^rex\.serveridletimeout$")
+            idle_timeout = server.DEFAULT_IDLE_TIMEOUT
+            if "rex.serveridletimeout" in config:
+                idle_timeout = config_number(config, "rex.serveridletimeout", float)
+        started = server.start(idle_timeout=idle_timeout)
+        print(f"Server running (pid {started.pid})")
+    elif args.command == "stop":
+        print("Server stopped" if server.stop() else "No server running")
+    elif args.command == "status":
+        running = server.status()
+        if running is None:
+            print("No server running")
+        else:
+            print(f"pid:      {running.pid}")
+            print(f"uptime:   {time.time() - running.started:.0f}s")
+            print(f"requests: {running.requests}")
+
+
+def read_stdin_revisions() -> List[str]:
+    revs = (rev.strip() for rev in sys.stdin.read().split("\0"))
+    return [rev for rev in revs if rev]
+
+
+def reexecute(
+    original_commit: Optional[git.Commit],
+    *,
+    edit: bool,
+    verbose: bool,
+    time_commands: bool,
+    limits: ResourceLimits,
+    report_usage: bool,
+    no_commit: bool,
+    plumbing: bool,
+    cache_settings: CacheSettings,
+) -> None:
+    commit_message = get_message_to_execute(original_commit, edit=edit)
+    with profile.span("extract scripts"):
+        scripts = extract_scripts(commit_message)
+
+    execute_scripts(
+        scripts,
+        verbose=verbose,
+        time_commands=time_commands,
+        limits=limits,
+        report_usage=report_usage,
+        cache_settings=cache_settings,
+    )
+    with profile.span("commit"):
+        commit(commit_message, original_commit, no_commit=no_commit, plumbing=plumbing)
+
+
+def rex() -> None:
+    if sys.argv[1:2] == ["cache"]:
+        rex_cache(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["index"]:
+        rex_index(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["server"]:
+        rex_server(sys.argv[2:])
+        return
+
+    args = parser().parse_args()
+    set_verbosity(args.verbose)
+    if args.count_processes:
+        process.enable()
+    try:
+        rex_profiled(args)
+    finally:
+        if args.count_processes:
+            process.print_summary(sys.stderr)
+
+
+def rex_profiled(args: Namespace) -> None:
+    if not args.profile:
+        rex_commits(args)
+        return
+
+    trace_file = os.path.abspath(args.profile)  # Before changing directory
+    profile.enable()
+    try:
+        with profile.span("rex"):
+            rex_commits(args)
+    finally:
+        profile.write_trace(trace_file)
+        profile.print_summary(sys.stderr)
+
+
+def list_scripts(revs: List[str]) -> None:
+    """Prints the code blocks, or the problem with them, of each commit in revs.
+
+    Commits without code blocks are skipped. With no revs, lists all of HEAD.
+    Consecutive single commits are read by one git log, however many there are.
+    """
+    try:
+        if not revs:
+            print_script_summaries(git.log_messages("HEAD"))
+        for is_range, group in groupby(revs, key=git.is_range):
+            if is_range:
+                # One at a time, as git log applies every range's exclusions to all
+                for rev in group:
+                    print_script_summaries(git.log_messages(rev))
+            else:
+                print_script_summaries(
+                    git.log_messages("--no-walk=unsorted", stdin_revs=list(group))
+                )
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader, say head, has seen enough: stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def print_script_summaries(messages: Iterable[Tuple[str, str]]) -> None:
+    for commit_hash, message in messages:
+        summary = summarize_scripts(message)
+        if summary is None:
+            continue
+        blocks = " ".join(f"{lineno}:{syntax}" for lineno, syntax in summary.blocks)
+        line = f"{commit_hash} {len(summary.blocks)}"
+        if blocks:
+            line += f" {blocks}"
+        if summary.error:
+            line += f" error: {summary.error}"
+        print(line)
+
+
+def verify_commits(
+    commits: List[git.Commit],
+    *,
+    jobs: int,
+    parent_dir: Optional[str],
+    limits: ResourceLimits,
+) -> None:
+    """Prints whether each commit with scripts reproduces, failing if any do not."""
+    total = failed = 0
+    results = verify.verify(commits, jobs=jobs, parent_dir=parent_dir, limits=limits)
+    for result in results:
+        total += 1
+        subject = git.Commit(result.commit_hash).message.partition("\n")[0]
+        if result.ok:
+            print(f"ok {result.commit_hash} {subject}", flush=True)
+            continue
+        failed += 1
+        if result.error:
+            print(f"failed {result.commit_hash} {subject}: {result.error}")
+        else:
+            print(f"mismatch {result.commit_hash} {subject}")
+            print(result.diffstat, end="")
+        if result.log_path:
+            print(f"  output: {result.log_path}")
+        sys.stdout.flush()
+    if failed:
+        raise verify.NotReproduced(failed=failed, total=total)
+
+
+def resource_limits(
+    config: Dict[str, str], *, timeout: Optional[float]
+) -> ResourceLimits:
+    """Reads limits from the command line, rex.timeout and the rex.*Limit config."""
+
+    def limit(name: str, parse: Callable[[str], T]) -> Optional[T]:
+        return config_number(config, name, parse) if name in config else None
+
+    return ResourceLimits(
+        timeout=timeout if timeout is not None else limit("rex.timeout", float),
+        cpu_seconds=limit("rex.cpulimit", int),
+        memory=limit("rex.memorylimit", cache.parse_size),
+        file_size=limit("rex.filesizelimit", cache.parse_size),
+    )
+
+
+def declared_paths(
+    commits: Sequence[Optional[git.Commit]],
+) -> Optional[Tuple[str, ...]]:
+    """The paths all the commits' scripts declare they change, or None if unbounded."""
+    paths: Dict[str, None] = {}
+    for commit in commits:
+        if commit is None:
+            return None
+        try:
+            scripts = extract_scripts(commit.message)
+        except Exception:
+            return None  # Reported when the commit is reexecuted
+        commit_paths = script_paths(scripts)
+        if commit_paths is None:
+            return None
+        paths.update(dict.fromkeys(commit_paths))
+    return tuple(paths)
+
+
+def check_clean(
+    commits: Sequence[Optional[git.Commit]], *, edit: bool, no_commit: bool
+) -> None:
+    """Checks for uncommitted changes in the paths the commits' scripts change."""
+    with profile.span("clean check"):
+        paths = None if edit else declared_paths(commits)
+        if no_commit:
+            is_clean = git.no_unstaged_changes(paths)
+        else:
+            is_clean = git.is_clean_repo(paths)
+    if not is_clean:
+        raise UnstagedChanges()
+
+
+def prefetch_commit(commit: git.Commit) -> None:
+    """Reads a commit's message early, leaving any failure to its first real use."""
+    try:
+        commit.message
+    except git.GitFailure:
+        pass
+
+
+def rex_commits(args: Namespace) -> None:
+    revs = [*args.commits, *(read_stdin_revisions() if args.stdin else [])]
+    if args.list:
+        if args.rebase or args.edit or args.no_commit:
+            raise InvocationError()
+        list_scripts(revs)
+        return
+    # Independent startup queries run concurrently; each caches its result, so
+    # later calls return at once. Failures are raised in the order they would
+    # be were the queries run one after another.
+    with ThreadPoolExecutor(max_workers=STARTUP_THREADS) as pool:
+        top_level = pool.submit(git.top_level)
+        try:
+            commits: List[Optional[git.Commit]] = [*git.expand_revisions(revs)]
+        except git.GitFailure:
+            if not args.isolated and not args.verify:
+                # Uncommitted changes are reported first, as for valid revisions
+                os.chdir(top_level.result())
+                check_clean([None], edit=args.edit, no_commit=args.no_commit)
+            raise
+        if not revs:
+            commits.append(None)
+        if len(commits) > 1 and args.no_commit:
+            raise InvocationError()
+        if args.rebase and (revs or args.edit or args.no_commit):
+            raise InvocationError()
+        if args.isolated and (not revs or args.rebase or args.no_commit):
+            raise InvocationError()
+        if args.verify and (
+            not revs or args.rebase or args.edit or args.no_commit or args.isolated
+        ):
+            raise InvocationError()
+
+        os.chdir(top_level.result())
+
+        clean_check = None
+        if not args.isolated and not args.verify:  # These leave the working tree alone
+            clean_check = pool.submit(
+                check_clean, commits, edit=args.edit, no_commit=args.no_commit
+            )
+        rex_config = pool.submit(git.config_values, r"^rex\.")
+        if commits and commits[0]:
+            pool.submit(prefetch_commit, commits[0])
+        if args.edit:
+            pool.submit(git.core_editor)
+        if clean_check:
+            clean_check.result()
+        config = rex_config.result()
+
+    cache_settings = CacheSettings.from_config(
+        config,
+        use_cache=False if args.no_cache else True if args.cache else None,
+        refresh=args.refresh_cache,
+    )
+    limits = resource_limits(config, timeout=args.timeout)
+    if args.verify:
+        jobs = args.jobs
+        if jobs is None and "rex.verifyjobs" in config:
+            jobs = config_number(config, "rex.verifyjobs", int)
+        verify_commits(
+            [commit for commit in commits if commit],
+            jobs=jobs or os.cpu_count() or 1,
+            parent_dir=config.get("rex.isolateddir"),
+            limits=limits,
+        )
+        return
+    if args.capture_output or not git.is_false(
+        config.get("rex.captureoutput", "false")
+    ):
+        tail_lines = output.DEFAULT_TAIL_LINES
+        if "rex.outputtail" in config:
+            tail_lines = config_number(config, "rex.outputtail", int)
+        output.enable(git.common_dir() / "rex" / "output.log", tail_lines=tail_lines)
+
+    if args.isolated:
+        reexecute_isolated(
+            [commit for commit in commits if commit],
+            args=args,
+            config=config,
+            limits=limits,
+            cache_settings=cache_settings,
+        )
+        return
+
+    if args.rebase:
+        with profile.span("rebase", upstream=args.rebase):
+            rebase.rebase(
+                args.rebase,
+                execute=lambda scripts: execute_scripts(
+                    scripts,
+                    verbose=args.verbose > 0,
+                    time_commands=args.time_commands,
+                    limits=limits,
+                    report_usage=args.resource_usage,
+                    cache_settings=cache_settings,
+                ),
+            )
+        return
+
+    reexecute_commits(commits, args=args, limits=limits, cache_settings=cache_settings)
+
+
+def reexecute_commits(
+    commits: Sequence[Optional[git.Commit]],
+    *,
+    args: Namespace,
+    limits: ResourceLimits,
+    cache_settings: CacheSettings,
+) -> None:
+    for original_commit in commits:
+        try:
+            with profile.span(
+                "reexecute", commit=original_commit.hash if original_commit else None
+            ):
+                reexecute(
+                    original_commit,
+                    edit=args.edit,
+                    verbose=args.verbose > 0,
+                    time_commands=args.time_commands,
+                    limits=limits,
+                    report_usage=args.resource_usage,
+                    no_commit=args.no_commit,
+                    plumbing=args.plumbing,
+                    cache_settings=cache_settings,
+                )
+        except Exception:
+            if len(commits) > 1:
+                assert original_commit
+                log.error("Failed to reexecute %s", original_commit.hash)
+            raise
+
+
+def reexecute_isolated(
+    commits: List[git.Commit],
+    *,
+    args: Namespace,
+    config: Dict[str, str],
+    limits: ResourceLimits,
+    cache_settings: CacheSettings,
+) -> None:
+    """Reexecutes commits in a temporary worktree, then moves HEAD to the result.
+
+    Commits made before a failure are kept, as they would be without isolation.
+    """
+    base = git.head()
+    if base is None:
+        raise git.GitFailure("cannot reexecute in isolation on an unborn branch")
+    parent_dir = config.get("rex.isolateddir")
+    new_head = base
+    try:
+        with worktree.temporary_worktree(base, parent_dir=parent_dir) as path:
+            os.chdir(path)
+            try:
+                reexecute_commits(
+                    commits, args=args, limits=limits, cache_settings=cache_settings
+                )
+            finally:
+                new_head = git.head() or base
+    finally:
+        if new_head != base:
+            worktree.update_head(
+                new_head, base, message=f"rex (isolated): {len(commits)} commits"
+            )
+            log.warning(
+                "Your working tree and index were not updated; to update them, run"
+                " git read-tree -m -u %s HEAD",
+                base[:12],
+            )
+
+
+def main() -> None:
+    configure_logging()
+    try:
+        rex()
+    except InvocationError:
+        parser().print_help()
+        sys.exit(64)
+    except UnstagedChanges:
+        log.error("cannot reexecute: You have unstaged changes.")
+        log.error("Please commit or stash them.")
+        sys.exit(64)
+    except NoScriptBlockFound:
+        log.fatal("No code section found in commit")
+        sys.exit(64)
+    except NoExecutableCodeFound:
+        log.fatal("Aborting commit as no code found to execute")
+        sys.exit(64)
+    except UnsupportedCodeSyntax as e:
+        log.fatal("%d: Code sections must specify bash or python syntax", e.lineno)
+        sys.exit(64)
+    except UnsupportedCodeAttribute as e:
+        log.fatal("%d: Unsupported code section attribute %s", e.lineno, e.name)
+        sys.exit(64)
+    except UnexpectedCodeBlock as e:
+        log.fatal("%d: Unexpected start of new code section", e.lineno)
+        sys.exit(64)
+    except UnterminatedCodeBlock:
+        log.fatal("Code block not terminated in commit message")
+        sys.exit(64)
+    except EditorUnset:
+        log.error("Terminal is dumb, but EDITOR unset")
+        sys.exit(64)
+    except EditorError as e:
+        log.error("There was a problem with the editor %s", e.editor_command)
+        sys.exit(64)
+    except git.GitFailure as e:
+        log.fatal("%s", e.message)
+        sys.exit(64)
+    except server.ServerFailure as e:
+        log.fatal("%s", e.message)
+        sys.exit(64)
+    except rebase.MergeCommitInRange as e:
+        log.fatal("cannot rebase merge commit %s", e.commit_hash)
+        sys.exit(64)
+    except rebase.RebaseConflict as e:
+        log.error("could not apply %s due to conflicts", e.commit_hash)
+        log.error("Please rebase with git rebase instead.")
+        sys.exit(1)
+    except UnsupportedBashVersion as e:
+        log.fatal(
+            "--time-commands needs bash %d or later, but bash is version %s",
+            TIMINGS_BASH_VERSION,
+            e.version or "unknown",
+        )
+        sys.exit(64)
+    except verify.NotReproduced as e:
+        log.error("%d of %d commits did not reproduce", e.failed, e.total)
+        sys.exit(1)
+    except UserCodeError as e:
+        sys.exit(e.resultcode)
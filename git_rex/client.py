@@ -0,0 +1,140 @@
+"""Forwards a git rex invocation to the repository's server, if one is running.
+
+This runs before anything else on every invocation, so it only imports modules
+that load quickly: no subprocesses, json or typing.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import struct
+import sys
+from array import array
+
+SOCKET_NAME = "server.sock"
+NO_SERVER_ENV = "GIT_REX_NO_SERVER"
+HEADER = struct.Struct("!I")
+
+
+def find_common_dir(cwd: str) -> str | None:
+    """Finds the common git directory as git would, without running git."""
+    git_dir = os.environ.get("GIT_DIR")
+    if git_dir:
+        git_dir = os.path.join(cwd, git_dir)
+    else:
+        directory = cwd
+        while not os.path.exists(os.path.join(directory, ".git")):
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+        git_dir = os.path.join(directory, ".git")
+        if os.path.isfile(git_dir):  # A linked worktree or submodule
+            with open(git_dir) as f:
+                contents = f.read().strip()
+            if not contents.startswith("gitdir: "):
+                return None
+            git_dir = os.path.join(directory, contents[len("gitdir: ") :])
+    if os.environ.get("GIT_COMMON_DIR"):
+        return os.path.join(cwd, os.environ["GIT_COMMON_DIR"])
+    try:
+        with open(os.path.join(git_dir, "commondir")) as f:
+            return os.path.join(git_dir, f.read().strip())
+    except OSError:
+        return git_dir
+
+
+def connect(socket_dir: str) -> socket.socket | None:
+    """Connects to the server listening in socket_dir, if there is one."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    cwd = os.getcwd()
+    try:
+        # Connect with a relative path, as socket paths are limited to ~100 bytes
+        os.chdir(socket_dir)
+        sock.connect(SOCKET_NAME)
+    except OSError:
+        sock.close()
+        return None
+    finally:
+        os.chdir(cwd)
+    return sock
+
+
+def send_fields(
+    sock: socket.socket, fields: list[str], fds: tuple[int, ...] = ()
+) -> None:
+    data = b"\0".join(os.fsencode(field) for field in fields)
+    header = HEADER.pack(len(data))
+    if fds:
+        rights = (socket.SOL_SOCKET, socket.SCM_RIGHTS, array("i", fds))
+        sock.sendmsg([header], [rights])
+    else:
+        sock.sendall(header)
+    sock.sendall(data)
+
+
+def receive_exactly(sock: socket.socket, size: int) -> bytes | None:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def receive_fields(
+    sock: socket.socket, *, max_fds: int = 0
+) -> tuple[list[str], list[int]] | None:
+    """Receives a message sent with send_fields, or None if the peer hung up."""
+    fds = array("i")
+    header, ancillary, _, _ = sock.recvmsg(
+        HEADER.size, socket.CMSG_SPACE(max_fds * fds.itemsize)
+    )
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[: len(data) - len(data) % fds.itemsize])
+    rest = receive_exactly(sock, HEADER.size - len(header)) if header else None
+    if rest is None:
+        for fd in fds:
+            os.close(fd)
+        return None
+    (size,) = HEADER.unpack(header + rest)
+    contents = receive_exactly(sock, size)
+    if contents is None:
+        for fd in fds:
+            os.close(fd)
+        return None
+    fields = [os.fsdecode(field) for field in contents.split(b"\0")]
+    return (fields if contents else []), list(fds)
+
+
+def forward_to_server(argv: list[str]) -> int | None:
+    """Runs git rex in the repository's server, returning its exit code.
+
+    Returns None, having done nothing, if no server is running.
+    """
+    if not hasattr(socket, "AF_UNIX") or os.environ.get(NO_SERVER_ENV):
+        return None
+    cwd = os.getcwd()
+    common_dir = find_common_dir(cwd)
+    if common_dir is None:
+        return None
+    sock = connect(os.path.join(common_dir, "rex"))
+    if sock is None:
+        return None
+    with sock:
+        env = [f"{name}={value}" for name, value in os.environ.items()]
+        try:
+            send_fields(sock, ["run", cwd, str(len(argv)), *argv, *env], (0, 1, 2))
+        except OSError:
+            return None  # For instance, if stdin is closed
+        try:
+            response = receive_fields(sock)
+        except KeyboardInterrupt:
+            return 130  # Closing the connection interrupts the server's run too
+    if response is None:
+        print("fatal: lost connection to the git rex server", file=sys.stderr)
+        return 64
+    return int(response[0][0])
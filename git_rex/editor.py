@@ -1,8 +1,8 @@
 import os
 from shlex import quote
-from subprocess import call
 
 from .git import core_editor
+from .process import call
 
 
 class EditorUnset(Exception):
@@ -1,6 +1,34 @@
+import atexit
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import cached_property
+from logging import getLogger
 from pathlib import Path
-from subprocess import PIPE, Popen, check_output
+from subprocess import DEVNULL, PIPE
+from tempfile import TemporaryDirectory
+from threading import Lock
+from time import perf_counter
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from .packs import PackReader, is_object_id, pack_reader
+from .process import Process
+from .profile import git_span
+
+log = getLogger(__name__)
+T = TypeVar("T")
 
 
 class GitFailure(Exception):
@@ -8,46 +36,395 @@ class GitFailure(Exception):
         self.message = message
 
 
+class ObjectNotFound(GitFailure):
+    pass
+
+
+class UnstagedChanges(Exception):
+    pass
+
+
 def removeprefix(s: str, prefix: str):
     """Same as s.removeprefix(prefix), added in Python 3.9."""
     return s[len(prefix) :] if s.startswith(prefix) else s
 
 
-def git(*args: str) -> bytes:
-    p = Popen(["git", *args], stdout=PIPE, stderr=PIPE)
-    stdout, stderr = p.communicate()
+def git(
+    *args: str, input: Optional[bytes] = None, env: Optional[Dict[str, str]] = None
+) -> bytes:
+    with git_span(args):
+        p = Process(
+            ["git", *args],
+            stdin=None if input is None else PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            env=None if env is None else {**os.environ, **env},
+            cwd=working_dir(),
+        )
+        stdout, stderr = p.communicate(input)
     if p.returncode != 0:
-        try:
-            raise GitFailure(
-                removeprefix(stderr.decode("utf-8").splitlines()[0], "fatal: ")
-            )
-        except IndexError:
-            raise GitFailure("") from None
+        raise failure_from_stderr(stderr)
     return stdout
 
 
-def is_clean_repo() -> bool:
-    status = git("status", "--porcelain")
-    return status == b""
+def failure_from_stderr(stderr: bytes) -> GitFailure:
+    try:
+        return GitFailure(
+            removeprefix(stderr.decode("utf-8").splitlines()[0], "fatal: ")
+        )
+    except IndexError:
+        return GitFailure("")
+
+
+class BatchProcess:
+    """A long-lived `git cat-file` process answering one request per line."""
+
+    def __init__(self, *args: str):
+        self._args = args
+        self._process: Optional[Process] = None
+        self._lock = Lock()
+
+    def _pipes(self) -> Tuple[IO[bytes], IO[bytes]]:
+        if self._process is None:
+            self._process = Process(
+                ["git", "cat-file", *self._args],
+                stdin=PIPE,
+                stdout=PIPE,
+                stderr=PIPE,
+                cwd=working_dir(),
+            )
+        assert self._process.stdin and self._process.stdout  # Makes mypy happy
+        return self._process.stdin, self._process.stdout
+
+    def request(self, rev: str) -> Tuple[str, str, Optional[bytes]]:
+        """Returns the object id, type and, in --batch mode, contents of rev."""
+        if "\n" in rev:
+            raise GitFailure(f"Not a valid object name {rev}")
+        with self._lock, git_span(("cat-file", *self._args)):
+            stdin, stdout = self._pipes()
+            try:
+                stdin.write(rev.encode("utf-8") + b"\n")
+                stdin.flush()
+            except BrokenPipeError:
+                pass  # Reported below, when no header is returned
+            header = stdout.readline().split()
+            if not header:
+                raise self._died()
+            if header[-1] in (b"missing", b"ambiguous"):
+                raise ObjectNotFound(f"Not a valid object name {rev}")
+            oid, object_type = header[0].decode("ascii"), header[1].decode("ascii")
+            contents = None
+            if self._args[0] == "--batch":
+                size = int(header[2])
+                contents = stdout.read(size + 1)[:size]
+            return oid, object_type, contents
+
+    def start(self) -> None:
+        with self._lock:
+            self._pipes()
+
+    def _died(self) -> GitFailure:
+        assert self._process and self._process.stderr
+        self._process.wait()
+        failure = failure_from_stderr(self._process.stderr.read())
+        self._process = None
+        return failure
+
+    def close(self) -> None:
+        if self._process is not None:
+            assert self._process.stdin  # Makes mypy happy
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+
+    def detach(self) -> Optional[Process]:
+        """Forgets the process without waiting for it to exit, returning it."""
+        process, self._process = self._process, None
+        if process is not None:
+            for pipe in (process.stdin, process.stdout, process.stderr):
+                if pipe:
+                    pipe.close()
+        return process
+
+
+class ObjectReader:
+    """Resolves revisions and reads objects without spawning a process per call.
+
+    Keeps a single `git cat-file --batch-check` process for resolving revisions,
+    and a single `git cat-file --batch` process for reading object contents.
+    Given a pack reader, objects named by their full id are read with that
+    instead, falling back to git for any it cannot find.
+    """
+
+    def __init__(self, packs: Optional[PackReader] = None) -> None:
+        self._batch_check = BatchProcess("--batch-check")
+        self._batch = BatchProcess("--batch")
+        self._packs = packs
+
+    def resolve(self, rev: str) -> str:
+        oid, _, _ = self._batch_check.request(rev)
+        return oid
+
+    def resolve_commit(self, rev: str) -> str:
+        if self._packs and is_object_id(rev):
+            found = self._packs.read(rev)
+            if found and found[0] == "commit":
+                return rev.lower()
+        try:
+            return self.resolve(f"{rev}^{{commit}}")
+        except ObjectNotFound:
+            raise ObjectNotFound(f"Not a valid commit name {rev}") from None
+
+    def read(self, rev: str) -> Tuple[str, bytes]:
+        """Returns the type and contents of the object rev names."""
+        if self._packs and is_object_id(rev):
+            found = self._packs.read(rev)
+            if found:
+                return found
+        _, object_type, contents = self._batch.request(rev)
+        assert contents is not None
+        return object_type, contents
+
+    def commit_tree(self, commit_hash: str) -> str:
+        """Returns the tree of a commit."""
+        if self._packs and is_object_id(commit_hash):
+            tree = self._packs.commit_tree(commit_hash)
+            if tree:
+                return tree
+        return self.resolve(f"{commit_hash}^{{tree}}")
+
+    def start(self) -> None:
+        """Starts the git processes ahead of their first use."""
+        self._batch_check.start()
+        self._batch.start()
+
+    def close(self) -> None:
+        self._batch_check.close()
+        self._batch.close()
+        if self._packs:
+            self._packs.close()
+
+    def detach(self) -> List[Process]:
+        """Forgets the git processes, without waiting for them, returning them."""
+        processes = [self._batch_check.detach(), self._batch.detach()]
+        if self._packs:
+            self._packs.close()
+        return [process for process in processes if process]
+
+
+class Workspace:
+    """A directory to run git in, with its own metadata cache and object reader.
+
+    While one is active, in the current thread or task, git commands run in its
+    directory rather than the process's working directory, which is left alone.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.metadata: Dict[str, Any] = {}
+        self.object_reader = ObjectReader(pack_reader(path))
+
+    def close(self) -> None:
+        self.metadata.clear()
+        self.object_reader.close()
+
+
+_workspace: "ContextVar[Optional[Workspace]]" = ContextVar("workspace", default=None)
+_object_readers: Dict[str, ObjectReader] = {}
+_object_readers_lock = Lock()
+_metadata: Dict[Tuple[str, str], Any] = {}
+
+
+@contextmanager
+def active(workspace: Workspace) -> Iterator[None]:
+    """Runs git commands in the workspace for the body."""
+    token = _workspace.set(workspace)
+    try:
+        yield
+    finally:
+        _workspace.reset(token)
+
+
+def working_dir() -> str:
+    """The directory git commands run in."""
+    workspace = _workspace.get()
+    return workspace.path if workspace else os.getcwd()
+
+
+def object_reader() -> ObjectReader:
+    """The object reader shared by the whole run, or by the active workspace.
+
+    Readers are keyed by working directory, as that determines which repository
+    the underlying git processes discover.
+    """
+    workspace = _workspace.get()
+    if workspace:
+        return workspace.object_reader
+    cwd = os.getcwd()
+    with _object_readers_lock:  # Startup queries may ask for it concurrently
+        if cwd not in _object_readers:
+            _object_readers[cwd] = ObjectReader(pack_reader(cwd))
+            atexit.register(_object_readers[cwd].close)
+        return _object_readers[cwd]
+
+
+def cached(name: str, compute: Callable[[], T]) -> T:
+    """Memoizes repository metadata per working directory, until clear_caches."""
+    workspace = _workspace.get()
+    if workspace:
+        if name not in workspace.metadata:
+            workspace.metadata[name] = compute()
+        result: T = workspace.metadata[name]
+        return result
+    key = (os.getcwd(), name)
+    if key not in _metadata:
+        _metadata[key] = compute()
+    result = _metadata[key]
+    return result
+
+
+def close_object_readers() -> None:
+    for reader in _object_readers.values():
+        reader.close()
+    _object_readers.clear()
+
+
+def detach_object_readers() -> List[Process]:
+    """Forgets the object readers, without stopping their git processes.
+
+    For a server handing its readers over to a forked child: the processes
+    exit once the child does, and the caller must then wait for them.
+    """
+    processes = [p for reader in _object_readers.values() for p in reader.detach()]
+    _object_readers.clear()
+    return processes
+
+
+def clear_caches() -> None:
+    """Forgets cached metadata, and stops the object readers."""
+    _metadata.clear()
+    close_object_readers()
+
+
+def git_succeeds(*args: str) -> bool:
+    """Runs a command that signals its answer with exit status 0 or 1."""
+    with git_span(args):
+        p = Process(["git", *args], stdout=DEVNULL, stderr=PIPE, cwd=working_dir())
+        _, stderr = p.communicate()
+    if p.returncode not in (0, 1):
+        raise failure_from_stderr(stderr)
+    return p.returncode == 0
+
+
+def git_has_output(*args: str) -> bool:
+    """Runs a command, stopping it as soon as it outputs anything."""
+    with git_span(args):
+        p = Process(["git", *args], stdout=PIPE, stderr=PIPE, cwd=working_dir())
+        assert p.stdout and p.stderr  # Makes mypy happy
+        if p.stdout.read(1):
+            p.kill()
+            p.communicate()
+            return True
+        if p.wait() != 0:
+            raise failure_from_stderr(p.stderr.read())
+    return False
+
+
+def config_values(pattern: str) -> Dict[str, str]:
+    """Returns all config values whose (lowercased) names match pattern."""
+    return dict(cached(f"config {pattern}", lambda: read_config_values(pattern)))
+
 
+def read_config_values(pattern: str) -> Dict[str, str]:
+    args = ("config", "-z", "--get-regexp", pattern)
+    with git_span(args):
+        p = Process(["git", *args], stdout=PIPE, cwd=working_dir())
+        stdout, _ = p.communicate()
+    entries = (entry.partition("\n") for entry in stdout.decode("utf-8").split("\0"))
+    return {name: value for name, _, value in entries if name}
 
-def no_unstaged_changes() -> bool:
-    status = git("status", "--porcelain")
-    return any(line[1] != " " for line in status.splitlines())
 
+def is_false(value: str) -> bool:
+    return value.lower() in ("false", "no", "off", "0", "")
 
-def add_all() -> None:
-    git("add", "-A")
+
+def status_entries(paths: Optional[Sequence[str]] = None) -> List[bytes]:
+    """The XY status codes of changed and untracked files, in paths if given."""
+    output = git("status", "--porcelain", "-z", *(["--", *paths] if paths else []))
+    entries = iter(output.split(b"\0"))
+    codes = []
+    for entry in entries:
+        if entry:
+            codes.append(entry[:2])
+            if b"R" in entry[:2] or b"C" in entry[:2]:
+                next(entries)  # Skip the original path of the rename or copy
+    return codes
+
+
+def no_staged_changes() -> bool:
+    try:
+        object_reader().resolve("HEAD")
+    except ObjectNotFound:
+        return not git_has_output("ls-files", "-z", ":/")
+    return git_succeeds("diff-index", "--cached", "--quiet", "HEAD", "--")
+
+
+def check_working_tree(
+    *, allow_staged: bool, paths: Optional[Sequence[str]] = None
+) -> bool:
+    """Checks for uncommitted changes with a single git status.
+
+    If paths are given, only they are checked for unstaged and untracked changes,
+    though staged changes are checked everywhere, as they would be committed.
+    git status uses the untracked cache and filesystem monitor, if configured.
+    """
+    start = perf_counter()
+    codes = status_entries(paths)
+    if allow_staged:
+        is_clean = all(code[1:] == b" " for code in codes)
+    else:
+        is_clean = not codes and (not paths or no_staged_changes())
+    log.info("Checked working tree with git status in %.3fs", perf_counter() - start)
+    return is_clean
+
+
+def is_clean_repo(paths: Optional[Sequence[str]] = None) -> bool:
+    return check_working_tree(allow_staged=False, paths=paths)
+
+
+def no_unstaged_changes(paths: Optional[Sequence[str]] = None) -> bool:
+    return check_working_tree(allow_staged=True, paths=paths)
+
+
+def changed_paths_outside(paths: Sequence[str]) -> List[str]:
+    """Tracked files not matched by paths whose contents differ from the index.
+
+    Untracked files are not looked for, as that means scanning the whole tree.
+    """
+    excludes = [f":(exclude){path}" for path in paths]
+    output = git("diff", "--no-ext-diff", "--name-only", "-z", "--", *excludes)
+    return [path for path in output.decode("utf-8").split("\0") if path]
+
+
+def stage_changes(paths: Optional[Sequence[str]] = None) -> None:
+    """Stages all changes in the working tree, or only those in paths if given."""
+    git("add", "-A", *(["--", *paths] if paths else []))
 
 
 def core_editor() -> str:
-    p = Popen(["git", "config", "core.editor"], stdout=PIPE)
-    stdout, _ = p.communicate()
+    return cached("core.editor", read_core_editor)
+
+
+def read_core_editor() -> str:
+    with git_span(("config", "core.editor")):
+        p = Process(["git", "config", "core.editor"], stdout=PIPE, cwd=working_dir())
+        stdout, _ = p.communicate()
     return stdout.decode("ascii").strip()
 
 
 def store_commit_message(commit_message: str) -> None:
-    with open(".git/MERGE_MSG", "w") as f:
+    """Stores the message the next `git commit` in this worktree will start with."""
+    with open(git_dir() / "MERGE_MSG", "w") as f:
         f.write(commit_message)
 
 
@@ -59,8 +436,199 @@ def commit_with_meta_from(commit: "Commit") -> None:
     git("commit", "-C", commit.hash)
 
 
+def head() -> Optional[str]:
+    """The commit HEAD points to, or None if the current branch is unborn."""
+    try:
+        return object_reader().resolve_commit("HEAD")
+    except ObjectNotFound:
+        return None
+
+
+def write_tree() -> str:
+    return git("write-tree").decode("ascii").strip()
+
+
+def tree_of(commit_hash: Optional[str]) -> str:
+    """The tree of a commit, or the empty tree if commit_hash is None."""
+    if commit_hash is None:
+        empty_tree = git("hash-object", "-t", "tree", "--stdin", input=b"")
+        return empty_tree.decode("ascii").strip()
+    return object_reader().commit_tree(commit_hash)
+
+
+def switch_tree(old_tree: str, new_tree: str) -> None:
+    """Updates the index and working tree from old_tree to new_tree."""
+    git("read-tree", "-m", "-u", old_tree, new_tree)
+
+
+def author_env(author: str) -> Dict[str, str]:
+    """Environment variables that make git reuse an author line's identity."""
+    identity, timestamp, timezone = author.rsplit(" ", 2)
+    name, _, email = identity.partition(" <")
+    return {
+        "GIT_AUTHOR_NAME": name,
+        "GIT_AUTHOR_EMAIL": email.rstrip(">"),
+        "GIT_AUTHOR_DATE": f"{timestamp} {timezone}",
+    }
+
+
+def commit_tree(
+    tree: str, parents: List[str], commit_message: str, *, author: Optional[str]
+) -> str:
+    """Creates a commit object, returning its id, without updating any ref."""
+    parent_args = [arg for parent in parents for arg in ("-p", parent)]
+    new_commit = git(
+        "commit-tree",
+        tree,
+        *parent_args,
+        input=commit_message.encode("utf-8"),
+        env=author_env(author) if author else None,
+    )
+    return new_commit.decode("ascii").strip()
+
+
+def commit_index(commit_message: str, *, author: Optional[str] = None) -> None:
+    """Commits the index with plumbing commands, bypassing porcelain and hooks.
+
+    An empty commit is detected by comparing tree ids, and refused.
+    """
+    parent = head()
+    tree = write_tree()
+    if tree == tree_of(parent):
+        raise GitFailure("nothing to commit, working tree clean")
+    parents = [parent] if parent else []
+    new_commit = commit_tree(tree, parents, commit_message, author=author)
+    subject = commit_message.partition("\n")[0]
+    git(
+        "update-ref", "-m", f"commit (rex): {subject}", "HEAD", new_commit, parent or ""
+    )
+
+
+def current_branch() -> Optional[str]:
+    """The ref HEAD points to, or None if HEAD is detached."""
+    try:
+        return git("symbolic-ref", "-q", "HEAD").decode("utf-8").strip()
+    except GitFailure:
+        return None
+
+
+def merge_file(base: bytes, ours: bytes, theirs: bytes) -> Optional[bytes]:
+    """Merges changes to a file's contents, or returns None if they conflict."""
+    with TemporaryDirectory() as temp_dir:
+        filenames = []
+        for name, contents in (("ours", ours), ("base", base), ("theirs", theirs)):
+            filenames.append(os.path.join(temp_dir, name))
+            with open(filenames[-1], "wb") as f:
+                f.write(contents)
+        with git_span(("merge-file", "-p")):
+            p = Process(
+                ["git", "merge-file", "-p", *filenames], stdout=PIPE, stderr=PIPE
+            )
+            merged, _ = p.communicate()
+    return merged if p.returncode == 0 else None
+
+
+def is_range(rev: str) -> bool:
+    return ".." in rev
+
+
+def expand_revisions(revs: Iterable[str]) -> List["Commit"]:
+    """Expands revision ranges into the commits they contain, oldest first.
+
+    Every revision is resolved at once, as names like HEAD move once the first
+    commit is reexecuted.
+    """
+    commits: List[Commit] = []
+    for rev in revs:
+        if is_range(rev):
+            hashes = git("rev-list", "--reverse", rev).decode("ascii").split()
+            commits.extend(Commit(h) for h in hashes)
+        else:
+            commits.append(Commit(Commit(rev).hash))
+    return commits
+
+
+def log_messages(
+    *args: str, stdin_revs: Optional[List[str]] = None
+) -> Iterator[Tuple[str, str]]:
+    """Streams the hash and message of each commit git log lists, newest first.
+
+    Memory use is bounded by the longest message, however many commits there are.
+    Revisions in stdin_revs are passed on standard input, as there may be many.
+    """
+    if stdin_revs is not None:
+        args = ("--stdin", *args)
+    command = ("log", "-z", "--no-color", "--format=%H%n%B", *args, "--")
+    with git_span(command):
+        # Unbuffered, so each read returns whatever git has written so far
+        p = Process(
+            ["git", *command],
+            stdin=None if stdin_revs is None else PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            bufsize=0,
+            cwd=working_dir(),
+        )
+        assert p.stdout and p.stderr
+        try:
+            if p.stdin:
+                try:
+                    # git log reads all its revisions before writing anything
+                    p.stdin.write(
+                        "".join(f"{rev}\n" for rev in stdin_revs or []).encode()
+                    )
+                    p.stdin.close()
+                except BrokenPipeError:
+                    pass  # git failed; its stderr says why
+            pending = b""
+            while True:
+                chunk = p.stdout.read(1 << 16)
+                records = (pending + chunk).split(b"\0")
+                pending = records.pop() if chunk else b""
+                for record in records:
+                    if record:
+                        commit_hash, _, message = record.partition(b"\n")
+                        yield commit_hash.decode("ascii"), message.decode(
+                            "utf-8", errors="replace"
+                        )
+                if not chunk:
+                    break
+            stderr = p.stderr.read()
+            if p.wait() != 0:
+                raise failure_from_stderr(stderr)
+        finally:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+            for stream in (p.stdin, p.stdout, p.stderr):
+                if stream:
+                    stream.close()
+
+
 def top_level() -> Path:
-    return Path(git("rev-parse", "--show-toplevel").decode("utf-8").strip())
+    return cached(
+        "top_level",
+        lambda: Path(git("rev-parse", "--show-toplevel").decode("utf-8").strip()),
+    )
+
+
+def git_dir() -> Path:
+    """The git directory of the current worktree."""
+    return cached(
+        "git_dir",
+        lambda: Path(git("rev-parse", "--absolute-git-dir").decode("utf-8").strip()),
+    )
+
+
+def common_dir() -> Path:
+    """The directory holding state shared by all worktrees of the repository."""
+    return cached(
+        "common_dir",
+        lambda: Path(
+            working_dir(),
+            git("rev-parse", "--git-common-dir").decode("utf-8").strip(),
+        ),
+    )
 
 
 class Commit:
@@ -69,18 +637,43 @@ class Commit:
 
     @cached_property
     def hash(self) -> str:
-        return git("rev-parse", self._rev).decode("ascii").strip()
+        return object_reader().resolve_commit(self._rev)
+
+    @cached_property
+    def _contents(self) -> bytes:
+        _, contents = object_reader().read(self.hash)
+        return contents
 
     @cached_property
     def message(self) -> str:
-        return check_output(
-            [
-                "git",
-                "show",
-                "--no-patch",
-                "--format=format:%B",
-                "--encoding=UTF-8",
-                self.hash,
-            ],
-            encoding="utf-8",
-        )
+        return commit_message(self._contents)
+
+    @cached_property
+    def parents(self) -> List[str]:
+        header = self._contents.partition(b"\n\n")[0]
+        return [
+            line[len(b"parent ") :].decode("ascii")
+            for line in header.split(b"\n")
+            if line.startswith(b"parent ")
+        ]
+
+    @cached_property
+    def author(self) -> str:
+        """The author line of the commit: name, email, timestamp and timezone."""
+        return commit_headers(self._contents)[b"author"].decode("utf-8")
+
+
+def commit_headers(contents: bytes) -> Dict[bytes, bytes]:
+    """Extracts the (first value of each) header of a raw commit object."""
+    headers: Dict[bytes, bytes] = {}
+    for line in contents.partition(b"\n\n")[0].split(b"\n"):
+        name, _, value = line.partition(b" ")
+        if name:  # Skip continuation lines
+            headers.setdefault(name, value)
+    return headers
+
+
+def commit_message(contents: bytes) -> str:
+    """Extracts the message from the raw contents of a commit object."""
+    encoding = commit_headers(contents).get(b"encoding", b"utf-8").decode("ascii")
+    return contents.partition(b"\n\n")[2].decode(encoding)
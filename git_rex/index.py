@@ -0,0 +1,341 @@
+"""Indexes the scripts in a repository's history, for fast queries across it.
+
+The index is an SQLite database, rex/index.sqlite in the common git directory.
+It maps each commit with scripts in its message to a fingerprint of each
+script, and to the names of the commands the scripts run. It also records the
+ref tips it has indexed, so an update only reads commits added since the last.
+"""
+
+import ast
+import re
+import sqlite3
+from contextlib import closing
+from hashlib import sha1
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from . import git
+from .messages import Script, extract_scripts, summarize_scripts
+
+SCHEMA_VERSION = 2
+FINGERPRINT_VERSION = "git-rex script fingerprint 1"
+SCHEMA = """
+CREATE TABLE commits (hash TEXT PRIMARY KEY);
+CREATE TABLE scripts (
+    hash TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    first_lineno INTEGER NOT NULL,
+    syntax TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (hash, position)
+);
+CREATE INDEX scripts_by_fingerprint ON scripts (fingerprint);
+CREATE TABLE commands (
+    hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (name, hash)
+);
+CREATE TABLE tips (hash TEXT PRIMARY KEY);
+"""
+
+# Splits a line of bash into roughly one simple command per part
+COMMAND_SEPARATORS = re.compile(r"\|\||&&|\$\(|[;|&(){}`]")
+ASSIGNMENT = re.compile(r"\w+=")
+COMMAND_NAME = re.compile(r"[\w./+-]+")
+# Words that can come before a command name
+PREFIX_KEYWORDS = {"!", "if", "then", "elif", "else", "do", "while", "until", "time"}
+# Words that start a part of a line with no command in it
+NON_COMMAND_KEYWORDS = {"for", "select", "case", "esac", "fi", "done", "in", "function"}
+# Commands that run the command following their options, and those options of
+# theirs that take a separate value
+LAUNCHERS = {
+    "command": set(),
+    "env": {"-u", "--unset", "-C", "--chdir"},
+    "exec": {"-a"},
+    "npx": {"-p", "--package"},
+    "sudo": {"-u", "--user", "-g", "--group", "-C", "-D", "-h", "-p", "-r", "-t"},
+    "time": {"-f", "--format", "-o", "--output"},
+    "xargs": {"-a", "-d", "-E", "-I", "-L", "-n", "-P", "-s"},
+}
+# Launchers that are a program and its subcommand or option
+TWO_WORD_LAUNCHERS = {
+    ("poetry", "run"),
+    ("pipenv", "run"),
+    ("python", "-m"),
+    ("python3", "-m"),
+}
+
+
+class IndexedScript:
+    def __init__(self, *, first_lineno: int, syntax: str, fingerprint: str):
+        self.first_lineno = first_lineno
+        self.syntax = syntax
+        self.fingerprint = fingerprint
+
+
+def index_file() -> Path:
+    return git.common_dir() / "rex" / "index.sqlite"
+
+
+def connect() -> sqlite3.Connection:
+    """Opens the index, creating it, or recreating it if its schema is outdated."""
+    path = index_file()
+    path.parent.mkdir(exist_ok=True)
+    db = sqlite3.connect(str(path))
+    (version,) = db.execute("PRAGMA user_version").fetchone()
+    if version != SCHEMA_VERSION:
+        with db:
+            for table in ("commits", "scripts", "commands", "tips"):
+                db.execute(f"DROP TABLE IF EXISTS {table}")
+            db.executescript(SCHEMA)
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return db
+
+
+def fingerprint(script: Script) -> str:
+    """Hashes a script, ignoring blank lines, comment lines and trailing whitespace.
+
+    Leading whitespace is also ignored in bash scripts, but not in python ones.
+    """
+    key = sha1()
+
+    def add(field: str) -> None:
+        data = field.encode("utf-8")
+        key.update(b"%d:%s," % (len(data), data))
+
+    add(FINGERPRINT_VERSION)
+    add(script.syntax)
+    if script.paths:
+        add("paths " + ",".join(script.paths))
+    for line in script.script:
+        line = line.rstrip() if script.syntax == "python" else line.strip()
+        if line and not line.lstrip().startswith("#"):
+            add(line)
+    return key.hexdigest()
+
+
+def launched_command(words: List[str]) -> List[str]:
+    """The words of the command a launcher like xargs or `poetry run` runs, if any.
+
+    >>> launched_command(["xargs", "-n", "1", "black", "-q"])
+    ['black', '-q']
+    >>> launched_command(["env", "-u", "HOME", "X=1", "black"])
+    ['black']
+    >>> launched_command(["black", "."])
+    []
+    """
+    if tuple(words[:2]) in TWO_WORD_LAUNCHERS:
+        return words[2:]
+    if words[0] not in LAUNCHERS:
+        return []
+    takes_value = LAUNCHERS[words[0]]
+    rest = words[1:]
+    while rest and (
+        rest[0].startswith("-") or (words[0] == "env" and ASSIGNMENT.match(rest[0]))
+    ):
+        option = rest.pop(0)
+        if option == "--":
+            break
+        if option in takes_value and rest:
+            rest.pop(0)
+    return rest
+
+
+def bash_command_names(lines: Iterable[str]) -> Set[str]:
+    """The names of the commands bash code runs, found by a rough scan.
+
+    Both a launcher, like xargs or `poetry run`, and the command it runs count.
+
+    >>> sorted(bash_command_names(["FOO=1 black . && isort .", "for f in *; do",
+    ...                            "  git add \\"$f\\"  # Stage it", "done"]))
+    ['black', 'git', 'isort']
+    """
+    names = set()
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#"):
+            continue
+        for part in COMMAND_SEPARATORS.split(line):
+            words = part.split()
+            while words and (words[0] in PREFIX_KEYWORDS or ASSIGNMENT.match(words[0])):
+                words.pop(0)
+            if not words or words[0] in NON_COMMAND_KEYWORDS:
+                continue
+            if words[0].startswith("#"):
+                break
+            while words and COMMAND_NAME.fullmatch(words[0]):
+                names.add(words[0])
+                words = launched_command(words)
+    return names
+
+
+def python_command_names(lines: Iterable[str]) -> Set[str]:
+    """The names of the programs python code runs with subprocess or os.system.
+
+    Programs are found in calls whose first argument is a list or tuple literal
+    starting with a string, or, for os.system and shell=True, a string literal.
+
+    >>> sorted(python_command_names(["import os, subprocess",
+    ...     "subprocess.run(['black', '.'], check=True)", "os.system('isort .')"]))
+    ['black', 'isort']
+    """
+    try:
+        tree = ast.parse("\n".join(lines))
+    except SyntaxError:
+        return set()
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not node.args:
+            continue
+        argument = node.args[0]
+        if isinstance(argument, (ast.List, ast.Tuple)) and argument.elts:
+            program = argument.elts[0]
+            if isinstance(program, ast.Constant) and isinstance(program.value, str):
+                names.add(program.value)
+        elif isinstance(argument, ast.Constant) and isinstance(argument.value, str):
+            function = node.func
+            is_system = (
+                isinstance(function, ast.Attribute) and function.attr == "system"
+            )
+            is_shell = any(
+                keyword.arg == "shell"
+                and isinstance(keyword.value, ast.Constant)
+                and keyword.value.value is True
+                for keyword in node.keywords
+            )
+            if is_system or is_shell:
+                names.update(bash_command_names(argument.value.splitlines()))
+    return names
+
+
+def command_names(script: Script) -> Set[str]:
+    if script.syntax == "python":
+        return python_command_names(script.script)
+    return bash_command_names(script.script)
+
+
+def ref_tips() -> List[str]:
+    """The commits that refs, other than rex's own, and HEAD point to."""
+    output = git.git(
+        "for-each-ref",
+        "--format=%(objecttype) %(objectname) %(*objecttype) %(*objectname) %(refname)",
+    ).decode("utf-8")
+    tips = set()
+    for line in output.splitlines():
+        object_type, object_name, peeled_type, peeled_name, refname = line.split(" ", 4)
+        if refname.startswith("refs/rex/"):
+            continue
+        if object_type == "commit":
+            tips.add(object_name)
+        elif peeled_type == "commit":
+            tips.add(peeled_name)
+    head = git.head()
+    if head:
+        tips.add(head)
+    return sorted(tips)
+
+
+def existing_commits(hashes: Iterable[str]) -> List[str]:
+    """The hashes that name commits still in the repository."""
+    found = []
+    for commit_hash in hashes:
+        try:
+            found.append(git.object_reader().resolve_commit(commit_hash))
+        except git.ObjectNotFound:
+            pass  # Garbage collected since it was indexed
+    return found
+
+
+def update(db: sqlite3.Connection) -> Tuple[int, int]:
+    """Indexes commits added since the last update.
+
+    Returns the number of commits read, and how many of them had scripts.
+    """
+    tips = ref_tips()
+    old_tips = [row[0] for row in db.execute("SELECT hash FROM tips")]
+    if not tips or set(tips) <= set(old_tips):
+        return 0, 0
+    revs = [*tips, *(f"^{tip}" for tip in existing_commits(old_tips))]
+    read = indexed = 0
+    with db:
+        # Oldest first, so that later commits get later row ids
+        for commit_hash, message in git.log_messages("--reverse", stdin_revs=revs):
+            read += 1
+            summary = summarize_scripts(message)
+            if summary is None or summary.error:
+                continue
+            scripts = extract_scripts(message)
+            if db.execute(
+                "INSERT OR IGNORE INTO commits (hash) VALUES (?)", (commit_hash,)
+            ).rowcount:
+                indexed += 1
+            for position, script in enumerate(scripts):
+                db.execute(
+                    "INSERT OR REPLACE INTO scripts VALUES (?, ?, ?, ?, ?)",
+                    (
+                        commit_hash,
+                        position,
+                        script.first_lineno,
+                        script.syntax,
+                        fingerprint(script),
+                    ),
+                )
+                db.executemany(
+                    "INSERT OR IGNORE INTO commands (hash, name) VALUES (?, ?)",
+                    ((commit_hash, name) for name in command_names(script)),
+                )
+        db.execute("DELETE FROM tips")
+        db.executemany("INSERT INTO tips (hash) VALUES (?)", ((tip,) for tip in tips))
+    return read, indexed
+
+
+def commit_scripts(db: sqlite3.Connection, commit_hash: str) -> List[IndexedScript]:
+    """The scripts in a commit, computed from its message if it is not indexed."""
+    rows = db.execute(
+        "SELECT first_lineno, syntax, fingerprint FROM scripts"
+        " WHERE hash = ? ORDER BY position",
+        (commit_hash,),
+    ).fetchall()
+    if rows:
+        return [
+            IndexedScript(first_lineno=lineno, syntax=syntax, fingerprint=fp)
+            for lineno, syntax, fp in rows
+        ]
+    return [
+        IndexedScript(
+            first_lineno=script.first_lineno,
+            syntax=script.syntax,
+            fingerprint=fingerprint(script),
+        )
+        for script in extract_scripts(git.Commit(commit_hash).message)
+    ]
+
+
+def commits_running(db: sqlite3.Connection, name: str) -> List[str]:
+    """The indexed commits with scripts that run the named command, newest first."""
+    with closing(
+        db.execute(
+            "SELECT commits.hash FROM commands JOIN commits USING (hash)"
+            " WHERE name = ? ORDER BY commits.rowid DESC",
+            (name,),
+        )
+    ) as cursor:
+        return [row[0] for row in cursor]
+
+
+def commits_with_fingerprints(
+    db: sqlite3.Connection, fingerprints: Iterable[str], *, exclude: Optional[str]
+) -> List[str]:
+    """The indexed commits with any of the script fingerprints, newest first."""
+    fingerprints = list(fingerprints)
+    placeholders = ", ".join("?" for _ in fingerprints)
+    with closing(
+        db.execute(
+            "SELECT DISTINCT commits.hash, commits.rowid"
+            " FROM scripts JOIN commits USING (hash)"
+            f" WHERE fingerprint IN ({placeholders}) AND hash IS NOT ?"
+            " ORDER BY commits.rowid DESC",
+            (*fingerprints, exclude),
+        )
+    ) as cursor:
+        return [row[0] for row in cursor]
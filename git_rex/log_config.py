@@ -2,11 +2,13 @@ import sys
 from logging import (
     ERROR,
     FATAL,
+    INFO,
     WARNING,
     Formatter,
     StreamHandler,
     addLevelName,
     basicConfig,
+    getLogger,
 )
 
 
@@ -15,6 +17,16 @@ def configure_logging() -> None:
     errorHandler.setFormatter(Formatter("%(levelname)s: %(message)s"))
     errorHandler.setLevel(WARNING)
     basicConfig(handlers=[errorHandler])
+    addLevelName(INFO, "info")
     addLevelName(WARNING, "warn")
     addLevelName(ERROR, "error")
     addLevelName(FATAL, "fatal")
+
+
+def set_verbosity(verbosity: int) -> None:
+    """Outputs rex's own diagnostics when --verbose is given twice."""
+    level = INFO if verbosity >= 2 else WARNING
+    root = getLogger()
+    root.setLevel(level)
+    for handler in root.handlers:
+        handler.setLevel(level)
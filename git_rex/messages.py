@@ -1,9 +1,19 @@
 import re
-from typing import Iterable, List, Tuple, Union
+from textwrap import dedent
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 from .bash import BashScript
+from .python import PythonScript
 
-CODE_BLOCK = re.compile(r"\s*```(\w*)\s*$")
+CODE_BLOCK = re.compile(r"\s*```(\w*)((?:\s+\w+=\S*)*)\s*$")
+# CODE_BLOCK, for finding fences in a whole message at once
+FENCE = re.compile(r"^[^\S\n]*```(\w*)((?:[^\S\n]+\w+=\S*)*)[^\S\n]*$", re.MULTILINE)
+# Characters besides \n that str.splitlines treats as line boundaries
+OTHER_LINE_BREAKS = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+SUPPORTED_SYNTAXES = ("bash", "python")
+SUPPORTED_ATTRIBUTES = ("paths",)
+
+Script = Union[BashScript, PythonScript]
 
 
 class NoScriptBlockFound(Exception):
@@ -19,6 +29,12 @@ class UnsupportedCodeSyntax(Exception):
         self.lineno = lineno
 
 
+class UnsupportedCodeAttribute(Exception):
+    def __init__(self, lineno: int, name: str):
+        self.lineno = lineno
+        self.name = name
+
+
 class UnexpectedCodeBlock(Exception):
     def __init__(self, lineno: int):
         self.lineno = lineno
@@ -34,9 +50,13 @@ class TextLine:
 
 
 class CodeBlockStart:
-    def __init__(self, text: str, lineno: int):
+    def __init__(
+        self, text: str, lineno: int, syntax: str, *, paths: Tuple[str, ...] = ()
+    ):
         self.text = text
         self.lineno = lineno
+        self.syntax = syntax
+        self.paths = paths
 
 
 class CodeLine:
@@ -52,21 +72,43 @@ class CodeBlockEnd:
 MessageLine = Union[TextLine, CodeBlockStart, CodeLine, CodeBlockEnd]
 
 
+def parse_attributes(text: str, lineno: int) -> Dict[str, str]:
+    """Parses the name=value attributes after the syntax of an opening fence.
+
+    >>> parse_attributes(" paths=src,docs", 3)
+    {'paths': 'src,docs'}
+    """
+    attributes = {}
+    for attribute in text.split():
+        name, _, value = attribute.partition("=")
+        if name not in SUPPORTED_ATTRIBUTES:
+            raise UnsupportedCodeAttribute(lineno, name)
+        attributes[name] = value
+    return attributes
+
+
 def parse_message(message: str) -> Iterable[MessageLine]:
     in_code_block = False
     lines = message.splitlines()
     for lineno, line in enumerate(lines, start=1):
         if not in_code_block:
             if m := CODE_BLOCK.match(line):
-                if m.group(1) != "bash":
+                if m.group(1) not in SUPPORTED_SYNTAXES:
                     raise UnsupportedCodeSyntax(lineno)
-                yield CodeBlockStart(line, lineno)
+                attributes = parse_attributes(m.group(2), lineno)
+                paths = attributes.get("paths", "").split(",")
+                yield CodeBlockStart(
+                    line,
+                    lineno,
+                    m.group(1),
+                    paths=tuple(path for path in paths if path),
+                )
                 in_code_block = True
             else:
                 yield TextLine(line)
         else:
             if m := CODE_BLOCK.match(line):
-                if m.group(1):
+                if m.group(1) or m.group(2):
                     raise UnexpectedCodeBlock(lineno)
                 in_code_block = False
                 yield CodeBlockEnd(line)
@@ -76,7 +118,7 @@ def parse_message(message: str) -> Iterable[MessageLine]:
         raise UnterminatedCodeBlock(lineno, line)
 
 
-def extract_scripts(message: str) -> Tuple[BashScript, ...]:
+def extract_scripts(message: str) -> Tuple[Script, ...]:
     """Extracts code from between triple-tick blocks
 
     >>> commit_message = '''Sample commit
@@ -98,24 +140,134 @@ def extract_scripts(message: str) -> Tuple[BashScript, ...]:
     7: and_a thing
     >>> print(scripts[1])
     11: do stuff
+
+    Indentation is significant in python blocks, so it is preserved, relative
+    to the block as a whole:
+
+    >>> print(extract_scripts("```python\\n  if True:\\n    pass\\n```")[0])
+    2: if True:
+    3:   pass
     """
-    code_blocks = []
+    code_blocks: List[Script] = []
     code_lines: List[str] = []
     first_lineno: int = 0
+    syntax = ""
+    paths: Tuple[str, ...] = ()
     for line in parse_message(message):
         if isinstance(line, CodeBlockStart):
             first_lineno = line.lineno + 1
+            syntax = line.syntax
+            paths = line.paths
         elif isinstance(line, CodeLine):
-            code_lines.append(line.text.strip())
+            code_lines.append(line.text)
         elif isinstance(line, CodeBlockEnd):
             assert first_lineno != 0
-            code_blocks.append(BashScript(first_lineno, tuple(code_lines)))
+            if syntax == "python":
+                source = dedent("\n".join(code_lines))
+                code_blocks.append(
+                    PythonScript(first_lineno, tuple(source.split("\n")), paths=paths)
+                )
+            else:
+                script = tuple(code_line.strip() for code_line in code_lines)
+                code_blocks.append(BashScript(first_lineno, script, paths=paths))
             code_lines.clear()
     if not code_blocks:
         raise NoScriptBlockFound()
     return tuple(code_blocks)
 
 
+def script_paths(scripts: Iterable[Script]) -> Optional[Tuple[str, ...]]:
+    """The paths the scripts declare they change, or None if any may change anything.
+
+    >>> script_paths(extract_scripts("```bash paths=src\\nls\\n```"))
+    ('src',)
+    """
+    paths: Dict[str, None] = {}
+    for script in scripts:
+        if not script.paths:
+            return None
+        paths.update(dict.fromkeys(script.paths))
+    return tuple(paths)
+
+
+class ScriptSummary:
+    """Where a message's code blocks start, and what is wrong with them, if anything."""
+
+    def __init__(self, blocks: List[Tuple[int, str]], error: Optional[str]):
+        self.blocks = blocks
+        self.error = error
+
+
+def summarize_scripts(message: str) -> Optional[ScriptSummary]:
+    """Finds the code blocks in a message without extracting their scripts.
+
+    Returns None if the message has no code blocks. This is much faster than
+    extract_scripts, for scanning many messages.
+
+    >>> summary = summarize_scripts("Subject\\n\\n```bash\\nls\\n```\\n```\\n")
+    >>> summary.blocks, summary.error
+    ([(3, 'bash')], '6: Code sections must specify bash or python syntax')
+    """
+    if "```" not in message:
+        return None
+    if OTHER_LINE_BREAKS.search(message):
+        return summarize_parsed_scripts(message)
+    blocks: List[Tuple[int, str]] = []
+    error = None
+    opening: Optional[Tuple[int, str]] = None
+    lineno, position = 1, 0
+    for fence in FENCE.finditer(message):
+        lineno += message.count("\n", position, fence.start())
+        position = fence.start()
+        syntax, attributes = fence.group(1), fence.group(2)
+        if opening is None and syntax not in SUPPORTED_SYNTAXES:
+            error = f"{lineno}: Code sections must specify bash or python syntax"
+            break
+        elif opening is None:
+            try:
+                parse_attributes(attributes, lineno)
+            except UnsupportedCodeAttribute as e:
+                error = f"{lineno}: Unsupported code section attribute {e.name}"
+                break
+            opening = (lineno, syntax)
+        elif syntax or attributes:
+            error = f"{lineno}: Unexpected start of new code section"
+            break
+        else:
+            blocks.append(opening)
+            opening = None
+    else:
+        if opening is not None:
+            error = "Code block not terminated in commit message"
+    if not blocks and error is None:
+        return None
+    return ScriptSummary(blocks, error)
+
+
+def summarize_parsed_scripts(message: str) -> Optional[ScriptSummary]:
+    """Same as summarize_scripts, but slower, handling every kind of line break."""
+    blocks: List[Tuple[int, str]] = []
+    error = None
+    opening: Tuple[int, str] = (0, "")
+    try:
+        for line in parse_message(message):
+            if isinstance(line, CodeBlockStart):
+                opening = (line.lineno, line.syntax)
+            elif isinstance(line, CodeBlockEnd):
+                blocks.append(opening)
+    except UnsupportedCodeSyntax as e:
+        error = f"{e.lineno}: Code sections must specify bash or python syntax"
+    except UnsupportedCodeAttribute as e:
+        error = f"{e.lineno}: Unsupported code section attribute {e.name}"
+    except UnexpectedCodeBlock as e:
+        error = f"{e.lineno}: Unexpected start of new code section"
+    except UnterminatedCodeBlock:
+        error = "Code block not terminated in commit message"
+    if not blocks and error is None:
+        return None
+    return ScriptSummary(blocks, error)
+
+
 def cleanup_message(message: str) -> str:
     """Remove comments outside of code blocks."""
     lines = []
@@ -132,3 +284,22 @@ def cleanup_message(message: str) -> str:
     if not code_line_found:
         raise NoExecutableCodeFound()
     return "".join(lines)
+
+
+def strip_whitespace(message: str) -> str:
+    """Tidies whitespace the way `git commit` does for a message it didn't edit.
+
+    Trailing whitespace and leading and trailing blank lines are removed, and
+    consecutive blank lines collapsed.
+
+    >>> strip_whitespace("\\n  \\nSubject  \\n\\n\\n\\nBody\\n\\n")
+    'Subject\\n\\nBody\\n'
+    """
+    lines: List[str] = []
+    for line in message.splitlines():
+        line = line.rstrip()
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    while lines and not lines[-1]:
+        lines.pop()
+    return "".join(f"{line}\n" for line in lines)
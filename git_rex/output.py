@@ -0,0 +1,199 @@
+"""Captures script output to a log file, keeping only the last lines in memory.
+
+Once enabled, everything written to stdout and stderr while a script runs,
+including by the processes it starts, goes to the log file instead. The
+terminal shows a progress line, and the last few lines are shown if the script
+fails. Memory use is bounded however much a script prints.
+"""
+
+import fcntl
+import os
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic
+from typing import IO, Deque, Iterator, Optional
+
+DEFAULT_TAIL_LINES = 20
+# Longer lines are truncated in the tail, though not in the log file
+MAX_LINE_LENGTH = 4096
+PROGRESS_INTERVAL = 0.1
+
+_log: Optional[IO[bytes]] = None
+_log_path: Optional[Path] = None
+_tail_lines = DEFAULT_TAIL_LINES
+
+
+def enable(log_path: Path, *, tail_lines: int) -> None:
+    """Starts capturing output to log_path, replacing any earlier log.
+
+    If another run is still writing to log_path, a log named after this
+    process is used instead. Such logs are deleted by the next run, once the
+    run that wrote them has finished.
+    """
+    global _log, _log_path, _tail_lines
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    log = open(log_path, "ab")
+    try:
+        fcntl.flock(log, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        _log_path = log_path
+    except BlockingIOError:
+        log.close()
+        _log_path = process_log_path(log_path, os.getpid())
+        while True:
+            log = open(_log_path, "ab")
+            fcntl.flock(log, fcntl.LOCK_EX)
+            if os.fstat(log.fileno()).st_nlink:
+                break
+            log.close()  # Deleted by another run as it was opened
+    remove_finished_logs(log_path)
+    log.truncate(0)
+    _log = log
+    _tail_lines = tail_lines
+
+
+def process_log_path(log_path: Path, pid: int) -> Path:
+    """The log used by process pid while another run holds log_path.
+
+    >>> process_log_path(Path(".git/rex/output.log"), 123)
+    PosixPath('.git/rex/output-123.log')
+    """
+    return log_path.with_name(f"{log_path.stem}-{pid}{log_path.suffix}")
+
+
+def remove_finished_logs(log_path: Path) -> None:
+    """Deletes the per-process logs that no running rex still holds locked."""
+    for path in log_path.parent.glob(f"{log_path.stem}-*{log_path.suffix}"):
+        if not path.stem[len(log_path.stem) + 1 :].isdigit():
+            continue
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            path.unlink()
+        except (BlockingIOError, FileNotFoundError):
+            pass  # Still being written, or already deleted
+        finally:
+            os.close(fd)
+
+
+def is_enabled() -> bool:
+    return _log is not None
+
+
+class Tail:
+    """The last lines read from a pipe, and how many there were in total."""
+
+    def __init__(self, max_lines: int):
+        self.lines: Deque[bytes] = deque(maxlen=max_lines)
+        self.count = 0
+        self._partial = b""
+
+    def add(self, data: bytes) -> None:
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()[:MAX_LINE_LENGTH]
+        for line in lines:
+            self.lines.append(line[:MAX_LINE_LENGTH])
+            self.count += 1
+
+    def finish(self) -> None:
+        if self._partial:
+            self.lines.append(self._partial)
+            self.count += 1
+            self._partial = b""
+
+
+def copy_output(
+    read_fd: int,
+    log: IO[bytes],
+    tail: Tail,
+    *,
+    label: str,
+    progress_fd: Optional[int],
+    finished: threading.Event,
+) -> None:
+    """Copies a pipe to the log until EOF, showing progress until finished is set."""
+    last_progress = 0.0
+    while True:
+        data = os.read(read_fd, 1 << 16)
+        if not data:
+            break
+        log.write(data)
+        tail.add(data)
+        if progress_fd is not None and monotonic() - last_progress > PROGRESS_INTERVAL:
+            last_progress = monotonic()
+            if not finished.is_set():
+                os.write(
+                    progress_fd,
+                    f"\r\x1b[K{label}: {tail.count} lines of output".encode(),
+                )
+    tail.finish()
+    log.flush()
+    os.close(read_fd)
+    if progress_fd is not None:
+        os.close(progress_fd)
+
+
+@contextmanager
+def captured(label: str) -> Iterator[None]:
+    """Captures output for the body, if enabled, showing the tail if it raises."""
+    if _log is None:
+        yield
+        return
+    _log.write(f"==> {label} <==\n".encode())
+    tail = Tail(_tail_lines)
+    finished = threading.Event()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+    show_progress = os.isatty(saved_stderr)
+    read_fd, write_fd = os.pipe()
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
+    reader = threading.Thread(
+        target=copy_output,
+        args=(read_fd, _log, tail),
+        kwargs=dict(
+            label=label,
+            progress_fd=os.dup(saved_stderr) if show_progress else None,
+            finished=finished,
+        ),
+        daemon=True,
+    )
+    reader.start()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        # Processes the script left running in the background may keep the
+        # pipe open; their output still goes to the log, but is not waited for
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_stdout, 1)
+        os.dup2(saved_stderr, 2)
+        os.close(saved_stdout)
+        os.close(saved_stderr)
+        reader.join(timeout=1.0)
+        finished.set()
+        if show_progress:
+            os.write(2, b"\r\x1b[K")
+        if failed:
+            print_tail(tail)
+
+
+def print_tail(tail: Tail) -> None:
+    print(
+        f"Last {len(tail.lines)} of {tail.count} lines of output"
+        f" (all in {_log_path}):",
+        file=sys.stderr,
+    )
+    for line in list(tail.lines):
+        print(line.decode("utf-8", errors="replace"), file=sys.stderr)
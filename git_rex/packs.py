@@ -0,0 +1,395 @@
+"""Reads objects straight from the object database, without running git.
+
+Even kept running, `git cat-file` costs a round trip to another process per
+object. Here, pack indexes, packs and the commit-graph are memory-mapped
+instead, so only the pages a lookup touches are read, and loose objects are
+read directly. Only what reading commits needs is supported: SHA-1 object
+ids, version 2 pack indexes and a single commit-graph file. Lookups return
+None for anything else, and for objects that cannot be found, so callers can
+fall back to git.
+
+As git honours replacement objects and these readers do not, none is used in
+repositories that have any.
+"""
+
+import mmap
+import os
+import re
+import struct
+import zlib
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .client import find_common_dir
+
+NO_PACK_READER_ENV = "GIT_REX_NO_PACK_READER"
+HASH_LENGTH = 20
+OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+OFS_DELTA = 6
+REF_DELTA = 7
+# Deeper chains are refused, so a corrupt pack cannot loop forever
+MAX_DELTA_DEPTH = 10_000
+FANOUT_SIZE = 256 * 4
+UINT32 = struct.Struct(">I")
+UINT64 = struct.Struct(">Q")
+OBJECT_ID = re.compile("[0-9a-fA-F]{40}")
+SHA256_CONFIG = re.compile(rb"^\s*objectformat\s*=\s*sha256\s*$", re.I | re.M)
+
+
+class CorruptObject(Exception):
+    pass
+
+
+def is_object_id(rev: str) -> bool:
+    """Whether rev is a full SHA-1 object id.
+
+    >>> is_object_id("3b18e512dba79e4c8300dd08aeb37f8e728b8dad")
+    True
+    >>> is_object_id("HEAD"), is_object_id("3b18e512")
+    (False, False)
+    """
+    return OBJECT_ID.fullmatch(rev) is not None
+
+
+def map_file(path: Path) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def fanout_search(
+    data: mmap.mmap, *, fanout: int, ids: int, oid: bytes
+) -> Optional[int]:
+    """The position of oid in a sorted table of ids, narrowed by its fanout table.
+
+    Entry n of the fanout table counts the ids whose first byte is at most n.
+    """
+    first = oid[0]
+    low = UINT32.unpack_from(data, fanout + 4 * (first - 1))[0] if first else 0
+    high = UINT32.unpack_from(data, fanout + 4 * first)[0]
+    while low < high:
+        middle = (low + high) // 2
+        start = ids + middle * HASH_LENGTH
+        found = data[start : start + HASH_LENGTH]
+        if found < oid:
+            low = middle + 1
+        elif found > oid:
+            high = middle
+        else:
+            return middle
+    return None
+
+
+def inflate(data: mmap.mmap, position: int, size: int) -> bytes:
+    """Decompresses the zlib stream at position, which inflates to size bytes."""
+    decompressor = zlib.decompressobj()
+    chunks = []
+    chunk_size = max(size, 4096)
+    while not decompressor.eof:
+        chunk = data[position : position + chunk_size]
+        if not chunk:
+            raise CorruptObject("truncated object")
+        chunks.append(decompressor.decompress(chunk))
+        position += chunk_size
+    result = b"".join(chunks)
+    if len(result) != size:
+        raise CorruptObject("object size mismatch")
+    return result
+
+
+def read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    """Reads a little-endian base-128 number, returning it and the next position."""
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """Rebuilds an object from its delta against base.
+
+    >>> apply_delta(b"hello world", bytes([11, 9, 0x91, 6, 5, 4]) + b" you")
+    b'world you'
+    """
+    base_size, position = read_varint(delta, 0)
+    result_size, position = read_varint(delta, position)
+    if base_size != len(base):
+        raise CorruptObject("delta base size mismatch")
+    result = bytearray()
+    while position < len(delta):
+        opcode = delta[position]
+        position += 1
+        if opcode & 0x80:  # Copy from base
+            offset = size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= delta[position] << (8 * i)
+                    position += 1
+            for i in range(3):
+                if opcode & (0x10 << i):
+                    size |= delta[position] << (8 * i)
+                    position += 1
+            result += base[offset : offset + (size or 0x10000)]
+        elif opcode:  # Insert the next opcode bytes
+            result += delta[position : position + opcode]
+            position += opcode
+        else:
+            raise CorruptObject("reserved delta opcode")
+    if len(result) != result_size:
+        raise CorruptObject("delta result size mismatch")
+    return bytes(result)
+
+
+class Pack:
+    """A pack file, and the version 2 index of the objects in it."""
+
+    def __init__(self, index_path: Path):
+        self._index = map_file(index_path)
+        try:
+            if self._index[:8] != b"\xfftOc\x00\x00\x00\x02":
+                raise CorruptObject(f"unsupported pack index {index_path}")
+            self._count = UINT32.unpack_from(self._index, 8 + FANOUT_SIZE - 4)[0]
+            self._ids = 8 + FANOUT_SIZE
+            self._offsets = self._ids + self._count * (HASH_LENGTH + 4)
+            self._large_offsets = self._offsets + self._count * 4
+            minimum_size = self._large_offsets + 2 * HASH_LENGTH
+            large_offsets_size = len(self._index) - minimum_size
+            if large_offsets_size < 0 or large_offsets_size % 8:
+                raise CorruptObject(f"unsupported pack index {index_path}")
+            self._pack = map_file(index_path.with_suffix(".pack"))
+        except BaseException:
+            self._index.close()
+            raise
+
+    def find(self, oid: bytes) -> Optional[int]:
+        """The offset of oid in the pack, if it is there."""
+        position = fanout_search(self._index, fanout=8, ids=self._ids, oid=oid)
+        if position is None:
+            return None
+        offset = UINT32.unpack_from(self._index, self._offsets + 4 * position)[0]
+        if offset & 0x80000000:
+            large = self._large_offsets + 8 * (offset & 0x7FFFFFFF)
+            offset = UINT64.unpack_from(self._index, large)[0]
+        return int(offset)
+
+    def read_at(
+        self, offset: int, read_base: Callable[[bytes], Optional[Tuple[str, bytes]]]
+    ) -> Optional[Tuple[str, bytes]]:
+        """Reads the object at offset, resolving any chain of deltas.
+
+        Bases named by object id, rather than by offset, are read with read_base.
+        """
+        deltas: List[bytes] = []
+        for _ in range(MAX_DELTA_DEPTH):
+            byte = self._pack[offset]
+            kind, size, shift = (byte >> 4) & 7, byte & 0x0F, 4
+            position = offset + 1
+            while byte & 0x80:
+                byte = self._pack[position]
+                position += 1
+                size |= (byte & 0x7F) << shift
+                shift += 7
+            if kind == OFS_DELTA:
+                byte = self._pack[position]
+                position += 1
+                distance = byte & 0x7F
+                while byte & 0x80:
+                    byte = self._pack[position]
+                    position += 1
+                    distance = ((distance + 1) << 7) | (byte & 0x7F)
+                deltas.append(inflate(self._pack, position, size))
+                offset -= distance
+            elif kind == REF_DELTA:
+                base_id = self._pack[position : position + HASH_LENGTH]
+                deltas.append(inflate(self._pack, position + HASH_LENGTH, size))
+                base = read_base(base_id)
+                if base is None:
+                    return None
+                object_type, contents = base
+                break
+            elif kind in OBJECT_TYPES:
+                object_type = OBJECT_TYPES[kind]
+                contents = inflate(self._pack, position, size)
+                break
+            else:
+                raise CorruptObject(f"unknown object type {kind}")
+        else:
+            raise CorruptObject("delta chain too deep")
+        for delta in reversed(deltas):
+            contents = apply_delta(contents, delta)
+        return object_type, contents
+
+    def close(self) -> None:
+        self._index.close()
+        self._pack.close()
+
+
+class CommitGraph:
+    """A commit-graph file, giving each commit's tree without reading the commit."""
+
+    def __init__(self, path: Path):
+        self._data = map_file(path)
+        try:
+            # Only a single file, not a chain of them, in a SHA-1 repository
+            if self._data[:6] != b"CGPH\x01\x01" or self._data[7]:
+                raise CorruptObject(f"unsupported commit-graph {path}")
+            chunks: Dict[bytes, int] = {}
+            for i in range(self._data[6]):
+                entry = 8 + 12 * i
+                chunk_id = self._data[entry : entry + 4]
+                chunks[chunk_id] = UINT64.unpack_from(self._data, entry + 4)[0]
+            self._fanout = chunks[b"OIDF"]
+            self._ids = chunks[b"OIDL"]
+            self._commit_data = chunks[b"CDAT"]
+        except KeyError:
+            self._data.close()
+            raise CorruptObject(f"missing chunk in commit-graph {path}") from None
+        except BaseException:
+            self._data.close()
+            raise
+
+    def tree_of(self, oid: bytes) -> Optional[bytes]:
+        """The tree of commit oid, if the graph includes it."""
+        position = fanout_search(
+            self._data, fanout=self._fanout, ids=self._ids, oid=oid
+        )
+        if position is None:
+            return None
+        start = self._commit_data + position * (HASH_LENGTH + 16)
+        return self._data[start : start + HASH_LENGTH]
+
+    def close(self) -> None:
+        self._data.close()
+
+
+class PackReader:
+    """Reads objects from a repository's packs and loose objects.
+
+    Packs are listed again when an object is not found, as git may have
+    repacked the repository since they were first listed.
+    """
+
+    def __init__(self, objects_dir: Path):
+        self._objects_dir = objects_dir
+        self._packs: Dict[str, Pack] = {}
+        self._graph: Optional[CommitGraph] = None
+        self._lock = Lock()
+        try:
+            self._graph = CommitGraph(objects_dir / "info" / "commit-graph")
+        except (OSError, ValueError, CorruptObject):
+            pass  # Trees are read from the commits instead
+        self._list_packs()
+
+    def _list_packs(self) -> bool:
+        """Opens any packs added since the last call, returning whether there were."""
+        try:
+            names = os.listdir(self._objects_dir / "pack")
+        except OSError:
+            return False
+        added = False
+        for name in sorted(names):
+            if name.endswith(".idx") and name not in self._packs:
+                try:
+                    self._packs[name] = Pack(self._objects_dir / "pack" / name)
+                    added = True
+                except (OSError, ValueError, CorruptObject):
+                    pass  # Unsupported, or deleted since listing; git can read it
+        return added
+
+    def read(self, object_id: str) -> Optional[Tuple[str, bytes]]:
+        """Returns the type and contents of an object, or None if not found."""
+        oid = bytes.fromhex(object_id)
+        with self._lock:
+            try:
+                found = self._read(oid)
+                if found is None and self._list_packs():
+                    found = self._read(oid)
+            except (CorruptObject, zlib.error, IndexError, ValueError, struct.error):
+                return None
+        return found
+
+    def _read(self, oid: bytes) -> Optional[Tuple[str, bytes]]:
+        for pack in self._packs.values():
+            offset = pack.find(oid)
+            if offset is not None:
+                return pack.read_at(offset, self._read)
+        return self._read_loose(oid.hex())
+
+    def _read_loose(self, object_id: str) -> Optional[Tuple[str, bytes]]:
+        try:
+            with open(self._objects_dir / object_id[:2] / object_id[2:], "rb") as f:
+                compressed = f.read()
+        except OSError:
+            return None
+        header, _, contents = zlib.decompress(compressed).partition(b"\0")
+        object_type, _, size = header.decode("ascii").partition(" ")
+        if int(size) != len(contents):
+            raise CorruptObject("object size mismatch")
+        return object_type, contents
+
+    def commit_tree(self, object_id: str) -> Optional[str]:
+        """The tree of a commit, or None if it cannot be found."""
+        if self._graph is not None:
+            with self._lock:
+                tree = self._graph.tree_of(bytes.fromhex(object_id))
+            if tree is not None:
+                return tree.hex()
+        found = self.read(object_id)
+        if found is None or found[0] != "commit":
+            return None
+        header = found[1].partition(b"\n")[0]
+        if not header.startswith(b"tree "):
+            return None
+        return header[len(b"tree ") :].decode("ascii")
+
+    def close(self) -> None:
+        with self._lock:
+            for pack in self._packs.values():
+                pack.close()
+            self._packs.clear()
+            if self._graph is not None:
+                self._graph.close()
+                self._graph = None
+
+
+def has_replacements(common_dir: Path) -> bool:
+    """Whether the repository has refs/replace refs, which git cat-file honours."""
+    if os.environ.get("GIT_NO_REPLACE_OBJECTS"):
+        return False
+    for _, _, files in os.walk(common_dir / "refs" / "replace"):
+        if files:
+            return True
+    try:
+        with open(common_dir / "packed-refs", "rb") as f:
+            return any(b" refs/replace/" in line for line in f)
+    except OSError:
+        return False
+
+
+def uses_sha256(common_dir: Path) -> bool:
+    try:
+        config = (common_dir / "config").read_bytes()
+    except OSError:
+        return False
+    return SHA256_CONFIG.search(config) is not None
+
+
+def pack_reader(directory: str) -> Optional[PackReader]:
+    """A reader for the objects of the repository at directory, if one can be used.
+
+    There is none if GIT_REX_NO_PACK_READER is set, or the repository uses
+    SHA-256 or replacement objects.
+    """
+    if os.environ.get(NO_PACK_READER_ENV):
+        return None
+    common_dir = find_common_dir(directory)
+    if common_dir is None:
+        return None
+    if uses_sha256(Path(common_dir)) or has_replacements(Path(common_dir)):
+        return None
+    objects_dir = os.environ.get("GIT_OBJECT_DIRECTORY")
+    return PackReader(Path(directory, objects_dir or Path(common_dir, "objects")))
@@ -0,0 +1,113 @@
+"""Starts every subprocess rex runs, recording what each was and how it went.
+
+Records are only kept once enable has been called. Each holds the process's
+argv, how long it ran, and its exit status; print_summary totals them by
+command, so a run's process count and cost can be reported, and tests can
+assert budgets on them.
+"""
+
+import os
+from subprocess import Popen
+from time import perf_counter
+from typing import IO, TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Union
+
+if TYPE_CHECKING:
+    _Popen = Popen[bytes]
+else:
+    _Popen = Popen  # Not subscriptable before Python 3.9
+
+_records: Optional[List["ProcessRecord"]] = None
+
+
+def enable() -> None:
+    global _records
+    _records = []
+
+
+def is_enabled() -> bool:
+    return _records is not None
+
+
+def records() -> List["ProcessRecord"]:
+    """The processes started since enable was called, oldest first."""
+    assert _records is not None
+    return list(_records)
+
+
+def command_name(argv: Sequence[str]) -> str:
+    """The name a process is grouped under: git and its subcommand, or the program.
+
+    >>> command_name(["git", "-c", "x=y", "cat-file", "--batch"])
+    'git cat-file'
+    >>> command_name(["/bin/bash", "-c", "true"])
+    'bash'
+    """
+    program = os.path.basename(argv[0]) if argv else ""
+    if program != "git":
+        return program
+    args = argv[1:]
+    for i, arg in enumerate(args):
+        if not arg.startswith("-") and (i == 0 or args[i - 1] not in ("-c", "-C")):
+            return f"git {arg}"
+    return "git"
+
+
+class ProcessRecord:
+    """One process rex started; wall and returncode are None until it is waited for."""
+
+    def __init__(self, argv: List[str]):
+        self.argv = argv
+        self.name = command_name(argv)
+        self.start = perf_counter()
+        self.wall: Optional[float] = None
+        self.returncode: Optional[int] = None
+
+    def elapsed(self) -> float:
+        """How long the process ran, or has run so far if it has not been waited for."""
+        return perf_counter() - self.start if self.wall is None else self.wall
+
+    def finish(self, returncode: int) -> None:
+        if self.returncode is None:
+            self.wall = perf_counter() - self.start
+            self.returncode = returncode
+
+
+class Process(_Popen):
+    """A Popen that records itself, if enabled, when it is waited for."""
+
+    def __init__(self, args: Union[str, List[str]], **kwargs: Any):
+        argv = args.split() if isinstance(args, str) else list(args)
+        record = ProcessRecord(argv) if _records is not None else None
+        super().__init__(args, **kwargs)
+        self._record = record
+        if record is not None and _records is not None:
+            _records.append(record)
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        # communicate, call and the context manager exit all wait through here
+        returncode = super().wait(timeout)
+        if self._record is not None:
+            self._record.finish(returncode)
+        return returncode
+
+
+def call(command: str, *, shell: bool) -> int:
+    """Same as subprocess.call, but recorded."""
+    with Process(command, shell=shell) as p:
+        return p.wait()
+
+
+def print_summary(file: IO[str]) -> None:
+    """Prints how many processes of each kind were started, and their total time."""
+    assert _records is not None
+    totals: Dict[str, List[float]] = {}
+    for record in _records:
+        total = totals.setdefault(record.name, [0, 0.0])
+        total[0] += 1
+        total[1] += record.elapsed()
+    rows = sorted(totals.items(), key=lambda row: row[1][1], reverse=True)
+    wall = sum(record.elapsed() for record in _records)
+    print(f"processes: {len(_records)} started, {wall * 1000:.1f} ms total", file=file)
+    print(f"{'count':>7} {'ms':>10}  command", file=file)
+    for name, (count, duration) in rows:
+        print(f"{int(count):>7} {duration * 1000:>10.1f}  {name}", file=file)
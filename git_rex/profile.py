@@ -0,0 +1,86 @@
+"""Times the phases of a rex run and the git commands it spawns.
+
+Timings are only recorded once enable has been called, and are written out in
+the Chrome trace event format, which chrome://tracing, Perfetto and speedscope
+can all display.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import IO, Any, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+PHASE = "phase"
+GIT = "git"
+
+_events: Optional[List[Dict[str, Any]]] = None
+_start = 0.0
+
+
+def enable() -> None:
+    global _events, _start
+    _events = []
+    _start = perf_counter()
+
+
+def is_enabled() -> bool:
+    return _events is not None
+
+
+def _microseconds(seconds: float) -> int:
+    return int(seconds * 1_000_000)
+
+
+@contextmanager
+def span(name: str, *, category: str = PHASE, **args: Any) -> Iterator[None]:
+    """Records how long the body takes, if profiling is enabled."""
+    if _events is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        end = perf_counter()
+        _events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": _microseconds(start - _start),
+                "dur": _microseconds(end - start),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+
+def git_span(args: Tuple[str, ...]) -> ContextManager[None]:
+    """Times a git subprocess, grouped in the summary by subcommand."""
+    subcommand = next((arg for arg in args if not arg.startswith("-")), "")
+    return span(f"git {subcommand}", category=GIT, argv=" ".join(args)[:200])
+
+
+def write_trace(filename: str) -> None:
+    assert _events is not None
+    with open(filename, "w") as f:
+        json.dump({"traceEvents": _events, "displayTimeUnit": "ms"}, f)
+
+
+def print_summary(file: IO[str], *, limit: int = 15) -> None:
+    """Prints the total time spent in each kind of span, largest first."""
+    assert _events is not None
+    totals: Dict[Tuple[str, str], List[int]] = {}
+    for event in _events:
+        total = totals.setdefault((event["cat"], event["name"]), [0, 0])
+        total[0] += 1
+        total[1] += event["dur"]
+    rows = sorted(totals.items(), key=lambda row: row[1][1], reverse=True)
+    elapsed = perf_counter() - _start
+    print(f"profile: {elapsed * 1000:.1f} ms total", file=file)
+    print(f"{'calls':>7} {'ms':>10}  name", file=file)
+    for (_, name), (calls, duration) in rows[:limit]:
+        print(f"{calls:>7} {duration / 1000:>10.1f}  {name}", file=file)
@@ -0,0 +1,176 @@
+import os
+import signal
+import sys
+import threading
+from time import perf_counter
+from types import FrameType, TracebackType
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from .bash import UserCodeError
+from .resources import (
+    TIMEOUT_EXIT_CODE,
+    InProcessUsage,
+    ResourceLimits,
+    ResourceUsage,
+    ScriptTimeout,
+)
+from .timings import CommandTiming, durations
+
+FILENAME = "<commit message>"
+
+
+def error_lineno(traceback: Optional[TracebackType]) -> Optional[int]:
+    """The line of the commit message the innermost frame of a script was on."""
+    lineno = None
+    while traceback:
+        if traceback.tb_frame.f_code.co_filename == FILENAME:
+            lineno = traceback.tb_lineno
+        traceback = traceback.tb_next
+    return lineno
+
+
+class PythonScript:
+    """A script run inside the rex process, avoiding interpreter startup costs.
+
+    Each script gets a fresh namespace. Changes to the working directory and
+    environment variables are undone when the script finishes, as they would be
+    at the end of a bash script. As with python -c, the working directory is on
+    sys.path, so scripts can import modules from the repository. Those modules
+    are forgotten afterwards, as later commits may change them, and no bytecode
+    is written for them, so the scripts leave no __pycache__ directories behind.
+    """
+
+    syntax = "python"
+
+    def __init__(
+        self, first_lineno: int, script: Tuple[str, ...], *, paths: Tuple[str, ...] = ()
+    ):
+        self.first_lineno = first_lineno
+        self.script = script
+        self.paths = paths  # Pathspecs it declares it changes; empty if unbounded
+
+    def __repr__(self) -> str:
+        return (
+            f"PythonScript(first_lineno={self.first_lineno}, "
+            f"script={repr(self.script)})"
+        )
+
+    def __str__(self) -> str:
+        return "\n".join(
+            f"{lineno}: {line}"
+            for (lineno, line) in enumerate(self.script, start=self.first_lineno)
+        )
+
+    def _tracer(
+        self, *, verbose: bool, starts: Optional[List[Tuple[float, int, str]]]
+    ) -> Callable[..., Any]:
+        def trace(
+            frame: FrameType, event: str, arg: Any
+        ) -> Optional[Callable[..., Any]]:
+            if frame.f_code.co_filename != FILENAME:
+                return None  # Only trace the script itself, not code it calls
+            if event == "line":
+                line = self.script[frame.f_lineno - self.first_lineno].strip()
+                if starts is not None:
+                    starts.append((perf_counter(), frame.f_lineno, line))
+                if verbose:
+                    # Output each line before executing it, like bash's set -x
+                    print(f"+ {line}", file=sys.stderr, flush=True)
+            return trace
+
+        return trace
+
+    def execute(
+        self,
+        *,
+        verbose: bool = False,
+        timings: Optional[List[CommandTiming]] = None,
+        limits: Optional[ResourceLimits] = None,
+        cwd: Optional[str] = None,
+    ) -> ResourceUsage:
+        """Runs the script, appending how long each line took to timings.
+
+        Returns the resources the script used. Only the timeout of limits applies,
+        and only on the main thread, where it can be delivered as a signal. If cwd
+        is given, the process changes to it while the script runs, as the script
+        runs in this process.
+        """
+        starts: Optional[List[Tuple[float, int, str]]] = None
+        if timings is not None:
+            starts = []
+        timeout = limits.timeout if limits else None
+        if threading.current_thread() is not threading.main_thread():
+            timeout = None
+        # Pad with blank lines so line numbers match the original commit message
+        source = "\n" * (self.first_lineno - 1) + "\n".join(self.script)
+        original_cwd = os.getcwd()
+        script_dir = cwd if cwd is not None else original_cwd
+        environ = dict(os.environ)
+        stdin = sys.stdin
+        path = list(sys.path)
+        modules = set(sys.modules)
+        dont_write_bytecode = sys.dont_write_bytecode
+        alarm_handler = None
+        usage = InProcessUsage()
+        try:
+            code = compile(source, FILENAME, "exec")
+            if cwd is not None:
+                os.chdir(cwd)
+            sys.path.insert(0, "")
+            sys.dont_write_bytecode = True
+            with open(os.devnull) as sys.stdin:
+                if timeout is not None:
+                    alarm_handler = signal.signal(signal.SIGALRM, raise_timeout)
+                    signal.setitimer(signal.ITIMER_REAL, timeout)
+                if verbose or starts is not None:
+                    sys.settrace(self._tracer(verbose=verbose, starts=starts))
+                exec(code, {"__name__": "__main__"})
+        except SystemExit as e:
+            if isinstance(e.code, int) and e.code != 0:
+                raise UserCodeError(e.code)
+            elif e.code is not None and not isinstance(e.code, int):
+                print(e.code, file=sys.stderr)
+                raise UserCodeError(1)
+        except SyntaxError as e:
+            print(f"error: {e.lineno}: SyntaxError: {e.msg}", file=sys.stderr)
+            raise UserCodeError(1)
+        except Exception as e:
+            lineno = error_lineno(e.__traceback__)
+            print(f"error: {lineno}: {type(e).__name__}: {e}", file=sys.stderr)
+            raise UserCodeError(1)
+        except ScriptTimeout as e:
+            lineno = error_lineno(e.__traceback__)
+            print(
+                f"error: {lineno}: script timed out after {timeout:g}s", file=sys.stderr
+            )
+            raise UserCodeError(TIMEOUT_EXIT_CODE)
+        finally:
+            sys.settrace(None)
+            if alarm_handler is not None:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, alarm_handler)
+            if timings is not None and starts is not None:
+                timings.extend(durations(starts, perf_counter()))
+            sys.stdin = stdin
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.path[:] = path
+            sys.dont_write_bytecode = dont_write_bytecode
+            forget_modules(set(sys.modules) - modules, directory=script_dir)
+            os.chdir(original_cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+        return usage.stop()
+
+
+def forget_modules(names: Iterable[str], *, directory: str) -> None:
+    """Removes the named modules loaded from files in directory from sys.modules."""
+    directory = os.path.join(os.path.realpath(directory), "")
+    for name in names:
+        filename = getattr(sys.modules.get(name), "__file__", None)
+        if filename and os.path.realpath(filename).startswith(directory):
+            del sys.modules[name]
+
+
+def raise_timeout(signum: int, frame: Optional[FrameType]) -> None:
+    raise ScriptTimeout()
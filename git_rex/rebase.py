@@ -0,0 +1,152 @@
+"""Rebases a branch, reexecuting the scripts in its commit messages.
+
+Commits without scripts are applied with a three-way merge into a private index,
+so the working tree is only updated when a script needs to run in it.
+"""
+
+import os
+from logging import getLogger
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import git
+from .messages import NoScriptBlockFound, Script, extract_scripts
+
+log = getLogger(__name__)
+
+Scripts = Tuple[Script, ...]
+
+
+class MergeCommitInRange(Exception):
+    def __init__(self, commit_hash: str):
+        self.commit_hash = commit_hash
+
+
+class RebaseConflict(Exception):
+    def __init__(self, commit_hash: str):
+        self.commit_hash = commit_hash
+
+
+def commits_to_rebase(upstream: str) -> List[Tuple[str, str]]:
+    """The commits in upstream..HEAD, oldest first, paired with their parents."""
+    lines = git.git("rev-list", "--reverse", "--parents", f"{upstream}..HEAD")
+    commits = []
+    for line in lines.decode("ascii").splitlines():
+        commit_hash, *parents = line.split()
+        if len(parents) != 1:
+            raise MergeCommitInRange(commit_hash)
+        commits.append((commit_hash, parents[0]))
+    return commits
+
+
+def scripts_in(commit: git.Commit) -> Optional[Scripts]:
+    try:
+        return extract_scripts(commit.message)
+    except NoScriptBlockFound:
+        return None
+    except Exception as e:
+        log.warning(
+            "Applying %s as a regular commit, as its scripts cannot be parsed (%s)",
+            commit.hash[:7],
+            type(e).__name__,
+        )
+        return None
+
+
+def merge_trees(base: str, ours: str, theirs: str) -> Optional[str]:
+    """Three-way merges trees in a private index, returning None on conflict."""
+    with TemporaryDirectory() as temp_dir:
+        env = {"GIT_INDEX_FILE": os.path.join(temp_dir, "index")}
+        git.git("read-tree", "-i", "-m", "--aggressive", base, ours, theirs, env=env)
+
+        stages: Dict[bytes, Dict[int, Tuple[bytes, str]]] = {}
+        for entry in git.git("ls-files", "-u", "-z", env=env).split(b"\0"):
+            if entry:
+                info, _, path = entry.partition(b"\t")
+                mode, oid, stage = info.split()
+                stages.setdefault(path, {})[int(stage)] = (mode, oid.decode("ascii"))
+
+        resolved = []
+        for path, versions in stages.items():
+            modes = {mode for mode, _ in versions.values()}
+            if len(versions) != 3 or modes not in ({b"100644"}, {b"100755"}):
+                return None  # Added, deleted or changed type on one side
+            _, base_blob = git.object_reader().read(versions[1][1])
+            _, our_blob = git.object_reader().read(versions[2][1])
+            _, their_blob = git.object_reader().read(versions[3][1])
+            merged = git.merge_file(base_blob, our_blob, their_blob)
+            if merged is None:
+                return None
+            oid = git.git("hash-object", "-w", "--stdin", input=merged)
+            resolved.append(b"%s %s\t%s\0" % (modes.pop(), oid.strip(), path))
+        if resolved:
+            git.git(
+                "update-index",
+                "-z",
+                "--index-info",
+                input=b"".join(resolved),
+                env=env,
+            )
+        return git.git("write-tree", env=env).decode("ascii").strip()
+
+
+def rebase(upstream: str, *, execute: Callable[[Scripts], None]) -> None:
+    """Replays the commits in upstream..HEAD onto upstream.
+
+    Commits with scripts are reexecuted in the working tree, using execute, which
+    must also stage the changes. If anything fails, the branch, index and
+    working tree are restored, and no commits are kept.
+    """
+    original_head = git.head()
+    if original_head is None:
+        raise git.GitFailure("cannot rebase: you do not have any commits yet")
+    branch = git.current_branch()
+    onto = git.Commit(upstream).hash
+    commits = commits_to_rebase(onto)
+
+    tip = onto
+    worktree_tree = git.tree_of(original_head)
+    try:
+        for commit_hash, parent in commits:
+            commit = git.Commit(commit_hash)
+            scripts = scripts_in(commit)
+            if scripts is None and parent == tip:
+                log.info("Reusing %s unchanged", commit_hash[:7])
+                tip = commit_hash
+                continue
+            if scripts is None:
+                tree = merge_trees(
+                    git.tree_of(parent), git.tree_of(tip), git.tree_of(commit_hash)
+                )
+                if tree is None:
+                    raise RebaseConflict(commit_hash)
+            else:
+                log.info("Reexecuting %s", commit_hash[:7])
+                git.switch_tree(worktree_tree, git.tree_of(tip))
+                worktree_tree = git.tree_of(tip)
+                git.git("update-ref", "--no-deref", "HEAD", tip)
+                execute(scripts)
+                tree = worktree_tree = git.write_tree()
+            if tree == git.tree_of(tip):
+                log.info("Dropping %s, as it is now empty", commit_hash[:7])
+                continue
+            tip = git.commit_tree(tree, [tip], commit.message, author=commit.author)
+    except BaseException:
+        log.error("Rebase aborted; %s has been left unchanged", branch or "HEAD")
+        git.git("read-tree", "--reset", "-u", git.tree_of(original_head))
+        restore_head(branch, original_head)
+        raise
+
+    git.switch_tree(worktree_tree, git.tree_of(tip))
+    reflog_message = f"rebase (rex): onto {onto}"
+    if branch:
+        git.git("update-ref", "-m", reflog_message, branch, tip, original_head)
+    restore_head(branch, tip)
+    git.git("update-ref", "ORIG_HEAD", original_head)
+
+
+def restore_head(branch: Optional[str], commit_hash: str) -> None:
+    if branch:
+        git.git("symbolic-ref", "HEAD", branch)
+    else:
+        git.git("update-ref", "--no-deref", "HEAD", commit_hash)
@@ -0,0 +1,215 @@
+"""Limits the resources scripts can use, and measures what they used."""
+
+import os
+import resource
+import signal
+import sys
+import threading
+from subprocess import DEVNULL
+from time import perf_counter
+from typing import Any, List, Optional, Tuple
+
+from .process import Process
+
+# Exit code for a script that timed out, as from timeout(1)
+TIMEOUT_EXIT_CODE = 124
+# bash's ulimit option for each rlimit, and the unit in bytes it is set in
+ULIMIT_OPTIONS = {
+    resource.RLIMIT_CPU: ("-t", 1),
+    resource.RLIMIT_AS: ("-v", 1024),
+    resource.RLIMIT_FSIZE: ("-f", 1024),
+}
+
+
+class ScriptTimeout(BaseException):
+    """Raised in a python script that runs past its timeout.
+
+    Like KeyboardInterrupt, it is not an Exception, so scripts do not catch it.
+    """
+
+
+class ResourceLimits:
+    """Limits on each script: a wall-clock timeout and, for bash, rlimits.
+
+    The rlimits apply to each process a bash script starts, as they are set
+    with bash's ulimit, which rounds sizes up to whole KiB. They are soft limits,
+    so a script can raise them if it needs to. Python scripts run inside rex, so
+    only the timeout applies to them.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout: Optional[float] = None,
+        cpu_seconds: Optional[int] = None,
+        memory: Optional[int] = None,
+        file_size: Optional[int] = None,
+    ):
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory = memory
+        self.file_size = file_size
+
+    def rlimits(self) -> List[Tuple[int, int]]:
+        limits = [
+            (resource.RLIMIT_CPU, self.cpu_seconds),
+            (resource.RLIMIT_AS, self.memory),
+            (resource.RLIMIT_FSIZE, self.file_size),
+        ]
+        return [(kind, value) for kind, value in limits if value is not None]
+
+    def command(self, args: List[str]) -> List[str]:
+        """Wraps args in a bash that sets the rlimits, then execs args.
+
+        Setting them in the child between fork and exec, with preexec_fn, is
+        not safe while other threads run, as they do under --verify and the API.
+        """
+        ulimits = []
+        for kind, value in self.rlimits():
+            option, unit = ULIMIT_OPTIONS[kind]
+            units = -(-value // unit)
+            _, hard = resource.getrlimit(kind)
+            if hard != resource.RLIM_INFINITY:
+                units = min(units, hard // unit)
+            ulimits.append(f"ulimit -S {option} {units} && ")
+        if not ulimits:
+            return args
+        return ["bash", "-c", "".join(ulimits) + 'exec "$@"', "bash", *args]
+
+
+class ResourceUsage:
+    """The resources a script used, as reported by getrusage."""
+
+    def __init__(
+        self,
+        *,
+        wall: float,
+        user: float,
+        system: float,
+        max_rss: int,
+        blocks_in: int,
+        blocks_out: int,
+    ):
+        self.wall = wall
+        self.user = user
+        self.system = system
+        self.max_rss = max_rss
+        self.blocks_in = blocks_in
+        self.blocks_out = blocks_out
+
+    @classmethod
+    def from_rusage(
+        cls, usage: "resource.struct_rusage", *, wall: float
+    ) -> "ResourceUsage":
+        return cls(
+            wall=wall,
+            user=usage.ru_utime,
+            system=usage.ru_stime,
+            max_rss=max_rss_bytes(usage),
+            blocks_in=usage.ru_inblock,
+            blocks_out=usage.ru_oublock,
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"{self.wall:.2f}s wall, {self.user:.2f}s user, {self.system:.2f}s sys,"
+            f" {self.max_rss / (1024 * 1024):.1f} MiB max RSS,"
+            f" {self.blocks_in} blocks in, {self.blocks_out} blocks out"
+        )
+
+
+def max_rss_bytes(usage: "resource.struct_rusage") -> int:
+    """ru_maxrss in bytes: Linux reports it in KiB, but macOS in bytes."""
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+class InProcessUsage:
+    """Measures the resources used by code run inside rex, and its subprocesses.
+
+    The maximum RSS is that of rex so far, as getrusage cannot reset it.
+    """
+
+    def __init__(self) -> None:
+        self._start = perf_counter()
+        self._self = resource.getrusage(resource.RUSAGE_SELF)
+        self._children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def stop(self) -> ResourceUsage:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        def used(field: str) -> Any:
+            return (
+                getattr(own, field)
+                - getattr(self._self, field)
+                + getattr(children, field)
+                - getattr(self._children, field)
+            )
+
+        return ResourceUsage(
+            wall=perf_counter() - self._start,
+            user=used("ru_utime"),
+            system=used("ru_stime"),
+            max_rss=max(max_rss_bytes(own), max_rss_bytes(children)),
+            blocks_in=used("ru_inblock"),
+            blocks_out=used("ru_oublock"),
+        )
+
+
+def run(
+    args: List[str], *, limits: Optional[ResourceLimits], cwd: Optional[str] = None
+) -> Tuple[int, ResourceUsage, bool]:
+    """Runs a command under limits, with no input, in cwd if given.
+
+    Returns its exit code (negative if a signal killed it, as from subprocess),
+    the resources it and the processes it waited for used, and whether it was
+    killed for running past the timeout.
+    """
+    start = perf_counter()
+    process = Process(
+        limits.command(args) if limits else args,
+        stdin=DEVNULL,
+        # A session of its own, so that a timeout can kill everything it ran
+        start_new_session=bool(limits and limits.timeout is not None),
+        cwd=cwd,
+    )
+    timed_out = threading.Event()
+    timer = None
+    if limits and limits.timeout is not None:
+
+        def kill() -> None:
+            timed_out.set()
+            kill_group(process.pid)
+
+        timer = threading.Timer(limits.timeout, kill)
+        timer.start()
+    try:
+        _, wait_status, usage = os.wait4(process.pid, 0)
+    except BaseException:
+        # For instance, Ctrl-C, which does not reach a separate process group
+        if limits and limits.timeout is not None:
+            kill_group(process.pid)
+        else:
+            process.kill()
+        process.wait()
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+    if os.WIFSIGNALED(wait_status):
+        process.returncode = -os.WTERMSIG(wait_status)
+    else:
+        process.returncode = os.WEXITSTATUS(wait_status)
+    process.wait()  # Already reaped, so only records the exit status
+    return (
+        process.returncode,
+        ResourceUsage.from_rusage(usage, wall=perf_counter() - start),
+        timed_out.is_set() and process.returncode == -signal.SIGKILL,
+    )
+
+
+def kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass  # Already finished
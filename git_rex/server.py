@@ -0,0 +1,425 @@
+"""A warm git rex server for one repository, reached over a Unix socket.
+
+Each request runs in a child forked from the server, so the interpreter has
+already started, git_rex is already imported, and the git cat-file processes
+and repository metadata (top level, git directory, config) are already cached.
+Caches are dropped when the config changes, and the cat-file processes are
+restarted when the index or HEAD does.
+
+Requests run concurrently, each in its own child. A cat-file pipe cannot be
+shared between concurrent users, so each child takes over the warm processes
+the server had started, and the server starts fresh ones for the next request.
+The server exits once no run is in progress and it has been idle long enough.
+"""
+
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from pathlib import Path
+from select import select
+from subprocess import DEVNULL
+from typing import Dict, List, NoReturn, Optional, Tuple
+
+from . import git
+from .client import NO_SERVER_ENV, SOCKET_NAME, connect, receive_fields, send_fields
+from .process import Process
+
+DEFAULT_IDLE_TIMEOUT = 600.0
+START_TIMEOUT = 10.0
+
+
+class ServerFailure(Exception):
+    def __init__(self, message: str):
+        self.message = message
+
+
+class ServerStatus:
+    def __init__(self, *, pid: int, started: float, requests: int):
+        self.pid = pid
+        self.started = started
+        self.requests = requests
+
+
+def socket_dir() -> Path:
+    return git.common_dir() / "rex"
+
+
+def status() -> Optional[ServerStatus]:
+    """The status of the repository's server, or None if it is not running."""
+    sock = connect(str(socket_dir()))
+    if sock is None:
+        return None
+    with sock:
+        send_fields(sock, ["status"])
+        response = receive_fields(sock)
+    if response is None:
+        return None
+    pid, started, requests = response[0]
+    return ServerStatus(pid=int(pid), started=float(started), requests=int(requests))
+
+
+def start(*, idle_timeout: float) -> ServerStatus:
+    """Starts a server in the background, unless one is already running."""
+    running = status()
+    if running:
+        return running
+    directory = socket_dir()
+    directory.mkdir(exist_ok=True)
+    with open(directory / "server.log", "a") as log_file:
+        process = Process(
+            [
+                sys.executable,
+                "-c",
+                "import sys; from git_rex.server import serve;"
+                " serve(idle_timeout=float(sys.argv[1]))",
+                str(idle_timeout),
+            ],
+            cwd=git.top_level(),
+            stdin=DEVNULL,
+            stdout=DEVNULL,
+            stderr=log_file,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        running = status()
+        if running:
+            return running
+        if process.poll() is not None:
+            break
+        time.sleep(0.02)
+    raise ServerFailure(f"server did not start; see {directory / 'server.log'}")
+
+
+def stop() -> bool:
+    """Stops the repository's server, returning whether one was running."""
+    sock = connect(str(socket_dir()))
+    if sock is None:
+        return False
+    with sock:
+        send_fields(sock, ["stop"])
+        return receive_fields(sock) is not None
+
+
+def exit_code(wait_status: int) -> int:
+    """Like os.waitstatus_to_exitcode, added in Python 3.9, but shell-style."""
+    if os.WIFSIGNALED(wait_status):
+        return 128 + os.WTERMSIG(wait_status)
+    return os.WEXITSTATUS(wait_status)
+
+
+def run_child(argv: List[str], cwd: str, fds: List[int]) -> NoReturn:
+    """Runs git rex with the client's stdio, then exits without cleanup.
+
+    Skipping cleanup leaves the cat-file processes shared with the server open.
+    """
+    returncode = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = open(0, closefd=False)
+        sys.stdout = open(1, "w", buffering=1 if os.isatty(1) else -1, closefd=False)
+        sys.stderr = open(2, "w", buffering=1, errors="backslashreplace", closefd=False)
+        os.environ[NO_SERVER_ENV] = "1"  # Nested runs would wait for this one
+        os.chdir(cwd)
+        sys.argv = argv
+
+        from .cli import main
+
+        main()
+        returncode = 0
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            returncode = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+    except KeyboardInterrupt:
+        returncode = 130
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(returncode)
+
+
+class Request:
+    """A git rex run, in a forked child, for a client still waiting on conn."""
+
+    def __init__(self, *, pid: int, conn: socket.socket, exit_read: int):
+        self.pid = pid
+        self.conn = conn
+        self.exit_read = exit_read
+        self.interrupted = False
+
+
+class Server:
+    """Handles requests as they arrive, running each in a child of its own.
+
+    Runs do not wait for each other, as worktrees share the server. Each child
+    takes over the server's git cat-file processes, which only one process at
+    a time can use, and the server starts new ones for the next run.
+    """
+
+    def __init__(self, listener: socket.socket):
+        self.listener = listener
+        self.started = self.last_run = time.time()
+        self.requests = 0
+        self.running: List[Request] = []
+        self.detached: List[Process] = []
+        self.environment: Tuple[Tuple[str, str], ...] = ()
+        # For each top level, the config files git reads there, and their stamps
+        self.config: Dict[Path, Tuple[List[Path], Tuple[object, ...]]] = {}
+        self.worktree_stamp: Tuple[object, ...] = ()
+
+    def refresh_caches(self) -> None:
+        """Drops stale caches, then fills those a run uses, for children to inherit.
+
+        Metadata is kept until any config file, or the environment variables
+        that locate them, change. The object readers are also restarted when
+        the index or HEAD changes.
+        """
+        environment = git_environment()
+        if environment != self.environment:
+            git.clear_caches()
+            self.config.clear()
+            self.environment = environment
+        top_level = git.top_level()
+        os.chdir(top_level)
+        known = self.config.get(top_level)
+        if known is None or file_stamps(known[0]) != known[1]:
+            git.clear_caches()
+            files = config_files()
+            self.config[top_level] = (files, file_stamps(files))
+        git_dir, common_dir = git.git_dir(), git.common_dir()
+        paths = [git_dir / "index", git_dir / "HEAD", common_dir / "packed-refs"]
+        head = (git_dir / "HEAD").read_text().strip()
+        if head.startswith("ref: "):
+            paths.append(common_dir / head[len("ref: ") :])
+        worktree_stamp = tuple(file_stamp(path) for path in paths)
+        if worktree_stamp != self.worktree_stamp:
+            git.close_object_readers()
+            self.worktree_stamp = worktree_stamp
+
+        git.config_values(r"^rex\.")
+        git.core_editor()
+        git.object_reader().start()
+
+    def handle(self, conn: socket.socket) -> bool:
+        """Handles one request, returning False if the server should stop.
+
+        Closes conn, unless a run was started, which finish closes later.
+        """
+        message = receive_fields(conn, max_fds=3)
+        if message is None:
+            conn.close()
+            return True
+        fields, fds = message
+        command = fields[0] if fields else ""
+        if command == "run" and len(fds) == 3:
+            self.requests += 1
+            self.running.append(self.start(conn, fields[1:], fds))
+            return True
+        for fd in fds:
+            os.close(fd)
+        with conn:
+            if command == "status":
+                send_fields(
+                    conn, [str(os.getpid()), str(self.started), str(self.requests)]
+                )
+            elif command == "stop":
+                send_fields(conn, [])
+                return False
+        return True
+
+    def start(self, conn: socket.socket, fields: List[str], fds: List[int]) -> Request:
+        cwd, argc = fields[0], int(fields[1])
+        argv = fields[2 : 2 + argc]
+        os.environ.clear()
+        for entry in fields[2 + argc :]:
+            name, _, value = entry.partition("=")
+            os.environ[name] = value
+        try:
+            os.chdir(cwd)
+            self.refresh_caches()
+        except (OSError, git.GitFailure):
+            pass  # The child will report the problem to the client
+
+        exit_read, exit_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            self.listener.close()
+            conn.close()
+            for request in self.running:
+                request.conn.close()
+                os.close(request.exit_read)
+            os.close(exit_read)
+            run_child(argv, cwd, fds)
+        os.close(exit_write)
+        for fd in fds:
+            os.close(fd)
+        self.detached.extend(git.detach_object_readers())
+        return Request(pid=pid, conn=conn, exit_read=exit_read)
+
+    def watched(self) -> List[int]:
+        """The file descriptors to wait on for running requests' events."""
+        fds = []
+        for request in self.running:
+            fds.append(request.exit_read)
+            if not request.interrupted:
+                fds.append(request.conn.fileno())
+        return fds
+
+    def process_events(self, readable: List[int]) -> None:
+        """Finishes runs whose child has exited, and interrupts abandoned ones.
+
+        The exit pipe closes when the child exits; if instead the client hangs
+        up first, for instance on Ctrl-C, the child is interrupted.
+        """
+        for request in list(self.running):
+            if request.exit_read in readable:
+                self.finish(request)
+            elif not request.interrupted and request.conn.fileno() in readable:
+                os.kill(request.pid, signal.SIGINT)
+                request.interrupted = True
+        # Handed-over cat-file processes exit shortly after their child
+        self.detached = [process for process in self.detached if process.poll() is None]
+
+    def finish(self, request: Request) -> None:
+        os.close(request.exit_read)
+        _, wait_status = os.waitpid(request.pid, 0)
+        with request.conn:
+            try:
+                send_fields(request.conn, [str(exit_code(wait_status))])
+            except OSError:
+                pass  # The client has gone
+        self.running.remove(request)
+        self.last_run = time.time()
+
+    def wait_for_runs(self) -> None:
+        """Waits for every run, and handed-over process, to finish."""
+        while self.running:
+            readable, _, _ = select([r.exit_read for r in self.running], [], [])
+            self.process_events(readable)
+        for process in self.detached:
+            process.wait()
+        self.detached = []
+
+
+def git_environment() -> Tuple[Tuple[str, str], ...]:
+    return tuple(
+        (name, value)
+        for name, value in sorted(os.environ.items())
+        if name[:4] == "GIT_" or name in ("HOME", "XDG_CONFIG_HOME")
+    )
+
+
+def config_files() -> List[Path]:
+    """The files git reads config from here, including those they include.
+
+    The standard files are listed even if they do not exist, so creating one
+    counts as a change.
+    """
+    paths = {
+        git.common_dir() / "config",
+        git.git_dir() / "config.worktree",
+        Path("/etc/gitconfig"),
+    }
+    home = os.environ.get("HOME")
+    xdg_config_home = os.environ.get("XDG_CONFIG_HOME")
+    if home:
+        paths.add(Path(home, ".gitconfig"))
+        xdg_config_home = xdg_config_home or os.path.join(home, ".config")
+    if xdg_config_home:
+        paths.add(Path(xdg_config_home, "git", "config"))
+    for name in ("GIT_CONFIG_GLOBAL", "GIT_CONFIG_SYSTEM"):
+        if os.environ.get(name):
+            paths.add(Path(os.environ[name]))
+    # Entries are origin, NUL, name, newline, value, NUL; origins are relative
+    # to the working directory, the top level
+    fields = os.fsdecode(git.git("config", "--list", "--show-origin", "-z")).split("\0")
+    for origin, entry in zip(fields[::2], fields[1::2]):
+        if not origin.startswith("file:"):
+            continue
+        path = Path(git.top_level(), origin[len("file:") :])
+        paths.add(path)
+        # An included file with no entries yet is not listed as an origin
+        name, _, value = entry.partition("\n")
+        if name == "include.path" or (
+            name.startswith("includeif.") and name.endswith(".path")
+        ):
+            paths.add(path.parent / os.path.expanduser(value))
+    return sorted(paths)
+
+
+def file_stamp(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def file_stamps(paths: List[Path]) -> Tuple[object, ...]:
+    return tuple(file_stamp(path) for path in paths)
+
+
+def bind(directory: Path) -> socket.socket:
+    existing = connect(str(directory))
+    if existing:
+        existing.close()
+        raise ServerFailure("a server is already running")
+    os.chdir(directory)  # Bind with a relative path, as in client.connect
+    try:
+        os.unlink(SOCKET_NAME)  # Left behind by a server that was killed
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)
+    try:
+        listener.bind(SOCKET_NAME)
+    finally:
+        os.umask(umask)
+    listener.listen()
+    return listener
+
+
+def serve(*, idle_timeout: float) -> None:
+    """Handles requests until stopped, or no git rex run for idle_timeout seconds."""
+    from . import cli  # noqa: F401  Imported once here, rather than in every child
+
+    directory = socket_dir().resolve()
+    listener = bind(directory)
+    socket_inode = os.stat(SOCKET_NAME).st_ino
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"{time.ctime()}: server {os.getpid()} started", file=sys.stderr)
+    server = Server(listener)
+    try:
+        while True:
+            timeout = None
+            if not server.running:
+                timeout = max(0, idle_timeout - (time.time() - server.last_run))
+            watched = [listener.fileno(), *server.watched()]
+            readable, _, _ = select(watched, [], [], timeout)
+            if not readable:
+                print(f"{time.ctime()}: idle, stopping", file=sys.stderr)
+                break
+            server.process_events(readable)
+            if listener.fileno() in readable:
+                conn, _ = listener.accept()
+                if not server.handle(conn):
+                    print(f"{time.ctime()}: stopping", file=sys.stderr)
+                    break
+    finally:
+        listener.close()
+        socket_path = directory / SOCKET_NAME
+        if socket_path.exists() and socket_path.stat().st_ino == socket_inode:
+            socket_path.unlink()
+        server.wait_for_runs()
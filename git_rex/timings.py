@@ -0,0 +1,52 @@
+"""Measures how long each command in a script took."""
+
+from typing import IO, Dict, Iterable, List, Tuple
+
+
+class CommandTiming:
+    def __init__(self, lineno: int, command: str, seconds: float):
+        self.lineno = lineno
+        self.command = command
+        self.seconds = seconds
+
+
+def durations(
+    starts: Iterable[Tuple[float, int, str]], end: float
+) -> List[CommandTiming]:
+    """Converts when each command started into how long each one took.
+
+    >>> [t.seconds for t in durations([(1.0, 3, "a"), (1.25, 4, "b")], end=2.0)]
+    [0.25, 0.75]
+    """
+    starts = list(starts)
+    ends = [started for started, _, _ in starts[1:]] + [end]
+    return [
+        CommandTiming(lineno, command, stop - started)
+        for (started, lineno, command), stop in zip(starts, ends)
+    ]
+
+
+def slowest_lines(
+    timings: Iterable[CommandTiming], *, limit: int
+) -> List[CommandTiming]:
+    """Totals the time spent on each line, which may run many commands."""
+    lines: Dict[int, CommandTiming] = {}
+    for timing in timings:
+        if timing.lineno in lines:
+            lines[timing.lineno].seconds += timing.seconds
+        else:
+            lines[timing.lineno] = CommandTiming(
+                timing.lineno, timing.command, timing.seconds
+            )
+    return sorted(lines.values(), key=lambda line: line.seconds, reverse=True)[:limit]
+
+
+def report_slowest(
+    timings: Iterable[CommandTiming], file: IO[str], *, limit: int = 5
+) -> None:
+    slowest = slowest_lines(timings, limit=limit)
+    if slowest:
+        print("Slowest commands:", file=file)
+    for line in slowest:
+        command = line.command.splitlines()[0] if line.command else ""
+        print(f"{line.seconds:9.3f}s  {line.lineno}: {command}", file=file)
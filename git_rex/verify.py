@@ -0,0 +1,184 @@
+"""Checks that commits' scripts still reproduce them.
+
+Each commit's scripts are run on its parent, in a throwaway worktree, and the
+tree they produce compared with the commit's own. Commits are independent, so
+they are checked in parallel, each worker in its own process. Script results
+are never taken from the cache, as that would defeat the check.
+"""
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from . import git, worktree
+from .bash import UserCodeError
+from .messages import (
+    NoExecutableCodeFound,
+    extract_scripts,
+    script_paths,
+    summarize_scripts,
+)
+from .resources import ResourceLimits, ScriptTimeout
+
+
+class NotReproduced(Exception):
+    def __init__(self, *, failed: int, total: int):
+        self.failed = failed
+        self.total = total
+
+
+class VerifyResult:
+    """The outcome of verifying one commit.
+
+    If the scripts could not be run, error says why. Otherwise, diffstat
+    summarizes how the tree they produced differs from the commit's, and is
+    empty if it matches.
+    """
+
+    def __init__(
+        self,
+        *,
+        commit_hash: str,
+        error: Optional[str] = None,
+        diffstat: str = "",
+        log_path: Optional[str] = None,
+    ):
+        self.commit_hash = commit_hash
+        self.error = error
+        self.diffstat = diffstat
+        self.log_path = log_path
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.diffstat
+
+
+def log_dir() -> Path:
+    return git.common_dir() / "rex" / "verify"
+
+
+@contextmanager
+def redirected_output(path: Path) -> Iterator[None]:
+    """Sends everything written to stdout and stderr, by any process, to path."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+    with open(path, "wb") as log_file:
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_stdout, 1)
+        os.dup2(saved_stderr, 2)
+        os.close(saved_stdout)
+        os.close(saved_stderr)
+
+
+def verify_commit(
+    commit_hash: str,
+    *,
+    parent_dir: Optional[str],
+    limits: Optional[ResourceLimits],
+    log_path: Path,
+) -> VerifyResult:
+    """Runs a commit's scripts on its parent, comparing the result to the commit.
+
+    Script output goes to log_path. Runs in a worker process.
+    """
+    try:
+        commit = git.Commit(commit_hash)
+        if len(commit.parents) != 1:
+            kind = "root" if not commit.parents else "merge"
+            return VerifyResult(
+                commit_hash=commit_hash, error=f"cannot verify {kind} commit"
+            )
+        with redirected_output(log_path):
+            scripts = extract_scripts(commit.message)
+            with worktree.temporary_worktree(
+                commit.parents[0], parent_dir=parent_dir
+            ) as path:
+                os.chdir(path)
+                for script in scripts:
+                    script.execute(limits=limits)
+                git.stage_changes(script_paths(scripts))
+                tree = git.write_tree()
+                diffstat = git.git("diff", "--stat", commit_hash, tree)
+    except UserCodeError as e:
+        error = f"script failed with exit code {e.resultcode}"
+    except NoExecutableCodeFound:
+        error = "no code to execute"
+    except git.GitFailure as e:
+        error = e.message
+    except (Exception, ScriptTimeout) as e:
+        # Reported as this commit's failure, rather than ending the whole run
+        error = describe(e)
+    else:
+        return VerifyResult(
+            commit_hash=commit_hash,
+            diffstat=diffstat.decode("utf-8", errors="replace"),
+            log_path=str(log_path),
+        )
+    return VerifyResult(
+        commit_hash=commit_hash,
+        error=error,
+        log_path=str(log_path) if log_path.exists() else None,
+    )
+
+
+def describe(error: BaseException) -> str:
+    """Describes an unexpected exception by its type and message.
+
+    >>> describe(OSError("No space left on device"))
+    'OSError: No space left on device'
+    """
+    message = str(error)
+    return f"{type(error).__name__}: {message}" if message else type(error).__name__
+
+
+def verify(
+    commits: List[git.Commit],
+    *,
+    jobs: int,
+    parent_dir: Optional[str],
+    limits: Optional[ResourceLimits],
+) -> Iterator[VerifyResult]:
+    """Verifies each commit with scripts in its message, yielding results in order.
+
+    Commits without scripts are skipped. Up to jobs commits are verified at once.
+    """
+    directory = log_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Spawned, not forked, so workers share no git processes with this one
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        pending: List[Tuple[str, "Future[VerifyResult]"]] = []
+        for commit in commits:
+            summary = summarize_scripts(commit.message)
+            if summary is None:
+                continue
+            if summary.error:
+                result: "Future[VerifyResult]" = Future()
+                result.set_result(
+                    VerifyResult(commit_hash=commit.hash, error=summary.error)
+                )
+            else:
+                result = pool.submit(
+                    verify_commit,
+                    commit.hash,
+                    parent_dir=parent_dir,
+                    limits=limits,
+                    log_path=directory / f"{commit.hash}.log",
+                )
+            pending.append((commit.hash, result))
+        for commit_hash, result in pending:
+            try:
+                yield result.result()
+            except Exception as e:  # For instance, if a worker process died
+                yield VerifyResult(commit_hash=commit_hash, error=describe(e))
@@ -0,0 +1,62 @@
+"""Runs scripts in a throwaway linked worktree, leaving the user's checkout alone.
+
+Each isolated run checks out its own detached worktree in a fresh temporary
+directory, so several can run at once, and the user can keep working meanwhile.
+"""
+
+import os
+import shutil
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import Iterator, Optional
+
+from . import git, profile
+
+log = getLogger(__name__)
+
+
+@contextmanager
+def temporary_worktree(
+    commit_hash: str, *, parent_dir: Optional[str]
+) -> Iterator[Path]:
+    """Checks out commit_hash in a new detached worktree, removed afterwards.
+
+    The worktree is created in a new directory inside parent_dir, or the system
+    temporary directory if parent_dir is None. The working directory is restored
+    on exit, in case the caller moved into the worktree.
+    """
+    cwd = os.getcwd()
+    temp_dir = Path(mkdtemp(prefix="git-rex-", dir=parent_dir))
+    path = temp_dir / "worktree"
+    try:
+        with profile.span("create worktree"):
+            git.git("worktree", "add", "--detach", "--quiet", str(path), commit_hash)
+        yield path
+    finally:
+        os.chdir(cwd)
+        git.close_object_readers()  # Some may be running in the worktree
+        with profile.span("remove worktree"):
+            try:
+                git.git("worktree", "remove", "--force", str(path))
+            except git.GitFailure as e:
+                # For instance, if adding it failed partway; tidy up by hand
+                log.info("Could not remove worktree %s (%s)", path, e.message)
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                git.git("worktree", "prune")
+            else:
+                temp_dir.rmdir()
+
+
+def update_head(new_head: str, old_head: str, *, message: str) -> None:
+    """Moves HEAD, or the branch it points to, from old_head to new_head.
+
+    Fails if another process has moved it in the meantime.
+    """
+    try:
+        git.git("update-ref", "-m", message, "HEAD", new_head, old_head)
+    except git.GitFailure as e:
+        raise git.GitFailure(
+            f"{e.message}; the reexecuted commits end at {new_head}"
+        ) from None
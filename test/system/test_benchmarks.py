@@ -0,0 +1,34 @@
+"""Verify the benchmark suite still runs, on tiny repositories."""
+
+import json
+import sys
+from subprocess import PIPE, Popen
+
+
+def benchmark(request, *args):
+    script = request.config.rootpath / "benchmarks" / "benchmark.py"
+    p = Popen([sys.executable, str(script), *args], stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+    return p.returncode, stderr
+
+
+def test_benchmarks(request, tmp_path):
+    results = tmp_path / "results.json"
+    returncode, _ = benchmark(
+        request, "--scale", "0.01", "--repeat", "1", "--output", str(results)
+    )
+    assert returncode == 0
+    measurements = json.loads(results.read_text())["results"]
+    assert "startup" in measurements
+    assert "clean check (50 tracked files)" in measurements
+
+    # Pretend the baseline was ten times faster
+    baseline = json.loads(results.read_text())
+    baseline["results"] = {name: 1000.0 for name in measurements}
+    baseline["results"]["startup"] = measurements["startup"] / 10
+    results.write_text(json.dumps(baseline))
+    returncode, stderr = benchmark(
+        request, "--scale", "0.01", "--repeat", "1", "--baseline", str(results)
+    )
+    assert returncode == 1
+    assert "regression: startup: " in stderr
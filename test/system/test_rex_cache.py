@@ -0,0 +1,62 @@
+"""Verify script results are cached, and reused when replayed on the same tree."""
+
+from subprocess import check_call, check_output
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'Script run' >> .git/RUN_LOG
+echo 'Line appended by rex-commit' >> file.txt
+```
+"""
+
+
+def run_count():
+    try:
+        return len(open(".git/RUN_LOG").readlines())
+    except FileNotFoundError:
+        return 0
+
+
+def cache_entries():
+    refs = check_output(["git", "for-each-ref", "refs/rex/cache/"], text=True)
+    return len(refs.splitlines())
+
+
+def replay_and_reset(rex, *args):
+    assert rex(*args, "somebranch").wait() == 0
+    assert open("file.txt").read() == "First line\nLine appended by rex-commit\n"
+    log = check_output(["git", "log", "--format=%s"], text=True).splitlines()
+    assert log == ["An example git-rex commit", "Initial revision of file.txt"]
+    check_call(["git", "reset", "--hard", "--quiet", "HEAD^"])
+
+
+def test_rex_cache(rex, temp_git_repo):
+    with open("file.txt", "w") as file:
+        print("First line", file=file)
+    check_call(["git", "add", "file.txt"])
+    check_call(["git", "commit", "-m", "Initial revision of file.txt"])
+    check_call(["git", "checkout", "-q", "-b", "somebranch"])
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+    check_call(["git", "checkout", "-q", "main"])
+
+    # The cache is off by default
+    replay_and_reset(rex)
+    assert (run_count(), cache_entries()) == (1, 0)
+
+    replay_and_reset(rex, "--cache")
+    assert (run_count(), cache_entries()) == (2, 1)
+
+    # Replaying onto the same tree reuses the cached result
+    replay_and_reset(rex, "--cache")
+    assert (run_count(), cache_entries()) == (2, 1)
+
+    replay_and_reset(rex, "--refresh-cache")
+    assert (run_count(), cache_entries()) == (3, 1)
+
+    check_call(["git", "config", "rex.cache", "true"])
+    replay_and_reset(rex)
+    assert (run_count(), cache_entries()) == (3, 1)
+
+    replay_and_reset(rex, "--no-cache")
+    assert (run_count(), cache_entries()) == (4, 1)
@@ -0,0 +1,93 @@
+"""Verify `git rex cache` maintenance subcommands."""
+
+import json
+import os
+from subprocess import PIPE, check_call, check_output
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'Script run' >> .git/RUN_LOG
+echo 'Line appended by rex-commit' >> file.txt
+```
+"""
+
+
+def rex_output(rex, *args):
+    p = rex(*args, stdout=PIPE, encoding="utf-8")
+    stdout, _ = p.communicate()
+    assert p.returncode == 0
+    return stdout
+
+
+def cache_entries():
+    refs = check_output(["git", "for-each-ref", "refs/rex/cache/"], text=True)
+    return len(refs.splitlines())
+
+
+def test_rex_cache_maintenance(rex, temp_git_repo, tmp_path_factory):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "checkout", "-q", "-b", "somebranch"])
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+    check_call(["git", "checkout", "-q", "main"])
+    check_call(["git", "config", "rex.cache", "true"])
+    assert rex("somebranch").wait() == 0
+    check_call(["git", "reset", "--hard", "--quiet", "HEAD^"])
+    assert rex("somebranch").wait() == 0
+
+    stats = rex_output(rex, "cache", "stats").splitlines()
+    assert stats[0] == "entries:  1"
+    assert stats[1].startswith("size:     ")
+    assert stats[2:] == ["hits:     1"]
+
+    # Seed a fresh clone from an exported bundle
+    bundle = tmp_path_factory.mktemp("bundle") / "cache.bundle"
+    assert rex("cache", "export", str(bundle)).wait() == 0
+    clone = tmp_path_factory.mktemp("clone")
+    check_call(["git", "clone", "--quiet", "--branch", "main", ".", str(clone)])
+    os.chdir(clone)
+    check_call(["git", "config", "user.email", "unit-test-runner@example.com"])
+    check_call(["git", "config", "user.name", "Unit Test Runner"])
+    check_call(["git", "reset", "--hard", "--quiet", "HEAD^"])
+    assert rex_output(rex, "cache", "import", str(bundle)) == (
+        "Imported 1 new cache entries\n"
+    )
+    assert rex("--cache", "origin/somebranch").wait() == 0
+    assert open("file.txt").read() == "Line appended by rex-commit\n"
+    assert not os.path.exists(".git/RUN_LOG")
+    # The fresh clone had no .git/rex directory until rex recorded the hit
+    assert json.loads(open(".git/rex/cache-usage.json").read())["hits"] == 1
+
+    assert rex_output(rex, "cache", "evict", "--max-size", "1g") == (
+        "Evicted 0 cache entries\n"
+    )
+    assert cache_entries() == 1
+    check_call(["git", "config", "rex.cacheMaxSize", "0"])
+    assert rex_output(rex, "cache", "evict") == "Evicted 1 cache entries\n"
+    assert cache_entries() == 0
+
+
+FAILING_COMMIT_MESSAGE = """A failing git-rex commit
+
+```bash
+exit 3
+```
+"""
+
+
+def test_rex_cache_usage_only_records_hits(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "commit", "--allow-empty", "-m", FAILING_COMMIT_MESSAGE])
+    usage_file = temp_git_repo / ".git" / "rex" / "cache-usage.json"
+
+    # A miss writes no usage at all
+    assert rex("--cache", "HEAD").wait() == 3
+    assert not usage_file.exists()
+
+    # Eviction forgets keys of entries that no longer exist
+    usage_file.parent.mkdir(exist_ok=True)
+    usage_file.write_text(json.dumps({"hits": 0, "last_used": {"deleted-by-hand": 0}}))
+    assert rex_output(rex, "cache", "evict", "--max-age", "1") == (
+        "Evicted 0 cache entries\n"
+    )
+    assert json.loads(usage_file.read_text())["last_used"] == {}
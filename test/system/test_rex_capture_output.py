@@ -0,0 +1,52 @@
+"""Verify the `--capture-output` flag."""
+
+from subprocess import PIPE, check_call
+
+COMMIT_MESSAGE = """A noisy git-rex commit
+
+```bash
+for i in $(seq 1000); do echo "Line $i"; done
+echo 'File created by rex-commit' > file.txt
+```
+"""
+FAILING_COMMIT_MESSAGE = """A noisy, failing git-rex commit
+
+```bash
+for i in $(seq 1000); do echo "Line $i"; done
+echo 'Something went wrong' >&2
+exit 3
+```
+"""
+
+
+def test_rex_capture_output(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+
+    p = rex("--capture-output", "HEAD", stdout=PIPE, stderr=PIPE, encoding="utf-8")
+    stdout, stderr = p.communicate()
+
+    assert p.returncode == 0
+    assert stdout == ""
+    assert stderr == ""
+    log = (temp_git_repo / ".git" / "rex" / "output.log").read_text().splitlines()
+    assert log[0] == "==> 4: bash script <=="
+    assert log[1:] == [f"Line {i}" for i in range(1, 1001)]
+
+
+def test_rex_capture_output_failure(rex, temp_git_repo):
+    check_call(["git", "config", "rex.captureOutput", "true"])
+    check_call(["git", "config", "rex.outputTail", "3"])
+    check_call(["git", "commit", "--allow-empty", "-m", FAILING_COMMIT_MESSAGE])
+
+    p = rex("HEAD", stdout=PIPE, stderr=PIPE, encoding="utf-8")
+    stdout, stderr = p.communicate()
+
+    assert p.returncode == 3
+    assert stdout == ""
+    log_file = temp_git_repo / ".git" / "rex" / "output.log"
+    assert stderr.splitlines() == [
+        f"Last 3 of 1001 lines of output (all in {log_file}):",
+        "Line 999",
+        "Line 1000",
+        "Something went wrong",
+    ]
@@ -0,0 +1,53 @@
+"""Verify the `--count-processes` flag, and keep rex within its process budgets.
+
+If a change makes rex start more processes, and that is intended, raise the
+budget here; otherwise, find the extra process.
+"""
+
+from subprocess import PIPE, check_call
+
+import pytest
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'File created by rex' > file.txt
+```
+"""
+# The most git processes replaying one commit may start. Before rex counted its
+# processes, a replay started 6: rev-parse, status, rev-parse, show, add, commit.
+# Plumbing commits with write-tree, commit-tree and update-ref instead; a cache
+# miss adds write-tree twice, then commit-tree and update-ref to store the result.
+GIT_BUDGETS = {(): 6, ("--plumbing",): 8, ("--cache",): 10}
+
+
+def count_processes(rex, *args):
+    """Runs rex with --count-processes, returning the count of each command."""
+    p = rex("--count-processes", *args, stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+    assert p.returncode == 0, stderr
+    lines = stderr.splitlines()
+    assert lines[0].startswith("processes: ")
+    assert lines[1].split() == ["count", "ms", "command"]
+    counts = {}
+    for line in lines[2:]:
+        count, _, name = line.split(maxsplit=2)
+        counts[name] = int(count)
+    assert sum(counts.values()) == int(lines[0].split()[1])
+    return counts
+
+
+@pytest.mark.parametrize("args", list(GIT_BUDGETS))
+def test_single_commit_replay_budget(rex, temp_git_repo, args):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+    check_call(["git", "checkout", "--quiet", "-b", "replay", "HEAD~"])
+
+    counts = count_processes(rex, *args, "main")
+
+    assert counts.pop("bash") == 1
+    git_count = sum(count for name, count in counts.items() if name.startswith("git"))
+    assert git_count == sum(counts.values()), counts
+    assert git_count <= GIT_BUDGETS[args], counts
+    # Revisions are resolved by one long-lived process; commits are read without git
+    assert counts["git cat-file"] == 1
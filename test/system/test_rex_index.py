@@ -0,0 +1,107 @@
+"""Verify the `git rex index` subcommands."""
+
+from subprocess import PIPE, check_call, check_output
+
+BLACK_MESSAGE = """Reformat with black
+
+```bash
+black .
+```
+"""
+BLACK_AGAIN_MESSAGE = """Reformat with black again
+
+```bash
+# Same script, different comments
+black .
+```
+"""
+# As in the README
+POETRY_BLACK_MESSAGE = """Automatic code reformatting
+
+Reformat all code with black
+
+```bash
+# Code to execute needs to go in a section like this in your commit message
+poetry run black .
+```
+"""
+ISORT_MESSAGE = """Sort imports
+
+```python
+import subprocess
+subprocess.run(["isort", "."], check=True)
+```
+"""
+
+
+def commit(message):
+    check_call(["git", "commit", "--allow-empty", "-m", message])
+    return check_output(["git", "rev-parse", "HEAD"], encoding="ascii").strip()
+
+
+def rex_output(rex, *args):
+    p = rex(*args, stdout=PIPE, encoding="utf-8")
+    stdout, _ = p.communicate()
+    assert p.returncode == 0
+    return stdout.splitlines()
+
+
+def test_index_update_is_incremental(rex, temp_git_repo):
+    commit("A commit without scripts")
+    commit(BLACK_MESSAGE)
+
+    assert rex_output(rex, "index", "update") == [
+        "Indexed 1 commits with scripts, of 2 new commits"
+    ]
+    assert rex_output(rex, "index", "update") == [
+        "Indexed 0 commits with scripts, of 0 new commits"
+    ]
+
+    commit(ISORT_MESSAGE)
+    assert rex_output(rex, "index", "update") == [
+        "Indexed 1 commits with scripts, of 1 new commits"
+    ]
+    assert (temp_git_repo / ".git" / "rex" / "index.sqlite").exists()
+
+
+def test_index_find_command(rex, temp_git_repo):
+    black = commit(BLACK_MESSAGE)
+    isort = commit(ISORT_MESSAGE)
+    black_again = commit(BLACK_AGAIN_MESSAGE)
+
+    assert rex_output(rex, "index", "find", "--command", "black") == [
+        black_again,
+        black,
+    ]
+    assert rex_output(rex, "index", "find", "--command", "isort") == [isort]
+    assert rex_output(rex, "index", "find", "--command", "flake8") == []
+
+
+def test_index_find_launched_command(rex, temp_git_repo):
+    black = commit(POETRY_BLACK_MESSAGE)
+    commit(ISORT_MESSAGE)
+
+    assert rex_output(rex, "index", "find", "--command", "black") == [black]
+    assert rex_output(rex, "index", "find", "--command", "poetry") == [black]
+
+
+def test_index_find_same_script(rex, temp_git_repo):
+    black = commit(BLACK_MESSAGE)
+    commit(ISORT_MESSAGE)
+    black_again = commit(BLACK_AGAIN_MESSAGE)
+
+    assert rex_output(rex, "index", "find", "--same-as", black) == [black_again]
+
+    [script] = rex_output(rex, "index", "show", black)
+    lineno_syntax, fingerprint = script.split()
+    assert lineno_syntax == "4:bash"
+    assert rex_output(rex, "index", "find", "--fingerprint", fingerprint) == [
+        black_again,
+        black,
+    ]
+
+
+def test_index_find_without_update(rex, temp_git_repo):
+    commit(BLACK_MESSAGE)
+
+    assert rex_output(rex, "index", "find", "--no-update", "--command", "black") == []
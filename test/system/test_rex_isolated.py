@@ -0,0 +1,98 @@
+"""Verify reexecuting commits in a temporary worktree, `git rex --isolated`."""
+
+from subprocess import PIPE, check_call, check_output
+
+
+def commit_message(n: int) -> str:
+    return f"""Append line {n}
+
+```bash
+echo 'Line {n}' >> file.txt
+```
+"""
+
+
+def check_output_lines(cmd):
+    return check_output(cmd, encoding="ascii").splitlines()
+
+
+def create_rex_branch() -> None:
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "checkout", "-b", "somebranch"])
+    for n in range(1, 3):
+        check_call(["git", "commit", "--allow-empty", "-m", commit_message(n)])
+    check_call(["git", "checkout", "main"])
+
+
+def test_rex_isolated(rex, temp_git_repo):
+    create_rex_branch()
+    base = check_output(["git", "rev-parse", "HEAD"], encoding="ascii").strip()
+    open("unstaged.txt", "w").write("Work in progress\n")
+
+    p = rex("--isolated", "main..somebranch", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+    assert p.returncode == 0, stderr
+
+    log = check_output_lines(["git", "log", "--format=format:%s"])
+    assert log == ["Append line 2", "Append line 1", "Initial commit"]
+    committed = check_output(["git", "show", "HEAD:file.txt"], encoding="ascii")
+    assert committed.splitlines() == ["Line 1", "Line 2"]
+
+    # The working tree and index were left alone
+    assert not (temp_git_repo / "file.txt").exists()
+    assert open("unstaged.txt").read() == "Work in progress\n"
+    assert check_output_lines(["git", "diff", "--cached", "--name-only", "HEAD"]) == [
+        "file.txt"
+    ]
+    assert f"git read-tree -m -u {base[:12]} HEAD" in stderr
+    check_call(["git", "read-tree", "-m", "-u", base, "HEAD"])
+    assert open("file.txt").read().splitlines() == ["Line 1", "Line 2"]
+
+    # The temporary worktree was removed
+    worktrees = check_output_lines(["git", "worktree", "list", "--porcelain"])
+    assert len([line for line in worktrees if line.startswith("worktree ")]) == 1
+
+
+def test_rex_isolated_failure(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "commit", "--allow-empty", "-m", commit_message(1)])
+    failing = "Fail\n\n```bash\nfalse\n```\n"
+    check_call(["git", "commit", "--allow-empty", "-m", failing])
+    commits = check_output_lines(["git", "rev-list", "--reverse", "HEAD~2..HEAD"])
+    check_call(["git", "reset", "--quiet", "--hard", "HEAD~2"])
+
+    assert rex("--isolated", *commits).wait() == 1
+
+    # Commits made before the failure are kept, as without --isolated
+    log = check_output_lines(["git", "log", "--format=format:%s"])
+    assert log == ["Append line 1", "Initial commit"]
+    worktrees = check_output_lines(["git", "worktree", "list", "--porcelain"])
+    assert len([line for line in worktrees if line.startswith("worktree ")]) == 1
+
+
+def test_rex_isolated_needs_commits(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+
+    assert rex("--isolated", stdout=PIPE).wait() == 64
+
+
+def test_rex_isolated_reads_config_once(rex, temp_git_repo, tmp_path_factory):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    message = "Record the worktree\n\n```bash\npwd > where.txt\n```\n"
+    check_call(["git", "commit", "--allow-empty", "-m", message])
+    check_call(["git", "reset", "--quiet", "--hard", "HEAD~"])
+    isolated_dir = tmp_path_factory.mktemp("isolated")
+    check_call(["git", "config", "rex.isolatedDir", str(isolated_dir)])
+
+    p = rex(
+        "--isolated", "--count-processes", "main@{1}", stderr=PIPE, encoding="utf-8"
+    )
+    _, stderr = p.communicate()
+    assert p.returncode == 0, stderr
+
+    where = check_output(["git", "show", "HEAD:where.txt"], encoding="utf-8")
+    assert where.startswith(str(isolated_dir))
+    counts = [
+        line.split()[0] for line in stderr.splitlines() if line.endswith(" git config")
+    ]
+    assert counts == ["1"]
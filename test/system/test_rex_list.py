@@ -0,0 +1,80 @@
+"""Verify the `--list` flag."""
+
+from subprocess import PIPE, check_call, check_output
+
+SCRIPT_MESSAGE = """A commit with scripts
+
+```bash
+echo 'File created by rex-commit' > file.txt
+```
+
+```python
+print("hello")
+```
+"""
+BROKEN_MESSAGE = """A commit with an unterminated script
+
+```bash
+echo 'File created by rex-commit' > file.txt
+"""
+
+
+def commit(message):
+    check_call(["git", "commit", "--allow-empty", "-m", message])
+    return check_output(["git", "rev-parse", "HEAD"], encoding="ascii").strip()
+
+
+def test_rex_list(rex, temp_git_repo):
+    base = commit("A commit without scripts")
+    scripts = commit(SCRIPT_MESSAGE)
+    broken = commit(BROKEN_MESSAGE)
+    commit("Another commit without scripts")
+
+    p = rex("--list", f"{base}..HEAD", stdout=PIPE, encoding="utf-8")
+    stdout, _ = p.communicate()
+
+    assert p.returncode == 0
+    assert stdout.splitlines() == [
+        f"{broken} 0 error: Code block not terminated in commit message",
+        f"{scripts} 2 3:bash 7:python",
+    ]
+    assert not (temp_git_repo / "file.txt").exists()
+
+
+def test_rex_list_single_commit(rex, temp_git_repo):
+    scripts = commit(SCRIPT_MESSAGE)
+    commit("A commit without scripts")
+
+    p = rex("--list", "HEAD", "HEAD~1", stdout=PIPE, encoding="utf-8")
+    stdout, _ = p.communicate()
+
+    assert p.returncode == 0
+    assert stdout.splitlines() == [f"{scripts} 2 3:bash 7:python"]
+
+
+def test_rex_list_stdin_commits_in_one_git_log(rex, temp_git_repo):
+    first = commit(SCRIPT_MESSAGE)
+    commit("A commit without scripts")
+    second = commit(SCRIPT_MESSAGE + "\nA second commit with scripts\n")
+    stdin_revs = "".join(f"{rev}\0" for rev in (first, "HEAD~1", second))
+
+    p = rex(
+        "--list",
+        "--count-processes",
+        "--stdin",
+        stdin=PIPE,
+        stdout=PIPE,
+        stderr=PIPE,
+        encoding="utf-8",
+    )
+    stdout, stderr = p.communicate(stdin_revs)
+
+    assert p.returncode == 0, stderr
+    assert stdout.splitlines() == [
+        f"{first} 2 3:bash 7:python",
+        f"{second} 2 3:bash 7:python",
+    ]
+    counts = [
+        line.split()[0] for line in stderr.splitlines() if line.endswith(" git log")
+    ]
+    assert counts == ["1"]
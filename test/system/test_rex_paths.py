@@ -0,0 +1,54 @@
+"""Verify limiting rex to the paths code blocks declare, with `paths=`."""
+
+import os
+from subprocess import PIPE, check_call, check_output
+
+COMMIT_MESSAGE = """A scoped git-rex commit
+
+```bash paths=src
+echo 'Line 2' >> src/file.txt
+echo 'Stray line' >> docs/file.txt
+```
+"""
+
+
+def create_files() -> None:
+    for directory in ("src", "docs"):
+        os.mkdir(directory)
+        with open(f"{directory}/file.txt", "w") as f:
+            f.write("Line 1\n")
+    check_call(["git", "add", "-A"])
+    check_call(["git", "commit", "-m", "Initial commit"])
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+
+
+def test_rex_paths(rex, temp_git_repo):
+    create_files()
+    open("docs/draft.txt", "w").write("Work in progress\n")
+
+    p = rex("HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+
+    assert p.returncode == 0, stderr
+    committed = check_output(
+        ["git", "diff-tree", "--no-commit-id", "--name-only", "-r", "HEAD"],
+        encoding="utf-8",
+    )
+    assert committed.splitlines() == ["src/file.txt"]
+    assert stderr.splitlines() == [
+        "warn: Files outside the scripts' paths (src) were changed, but not staged:"
+        " docs/file.txt"
+    ]
+    status = check_output(["git", "status", "--porcelain"], encoding="utf-8")
+    assert status.splitlines() == [" M docs/file.txt", "?? docs/draft.txt"]
+
+
+def test_rex_paths_refuses_unstaged_changes_in_paths(rex, temp_git_repo):
+    create_files()
+    open("src/draft.txt", "w").write("Work in progress\n")
+
+    p = rex("HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+
+    assert p.returncode == 64
+    assert "You have unstaged changes" in stderr
@@ -0,0 +1,69 @@
+"""Verify committing with plumbing commands, `git rex --plumbing COMMIT`."""
+
+import os
+import stat
+from subprocess import PIPE, check_call, check_output
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'Line appended by rex-commit' >> file.txt
+```
+"""
+
+EMPTY_COMMIT_MESSAGE = """A git-rex commit that changes nothing
+
+```bash
+true
+```
+"""
+
+
+def git_show(format, rev="HEAD"):
+    return check_output(["git", "show", "-s", f"--format={format}", rev], text=True)
+
+
+def add_failing_pre_commit_hook():
+    with open(".git/hooks/pre-commit", "w") as f:
+        print("#!/bin/sh\nexit 1", file=f)
+    os.chmod(".git/hooks/pre-commit", stat.S_IRWXU)
+
+
+def test_rex_plumbing(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "checkout", "-b", "somebranch"])
+    check_call(
+        [
+            "git",
+            "commit",
+            "--allow-empty",
+            "--author=Original Author <original@example.com>",
+            "--date=2001-02-03T04:05:06+07:00",
+            "-m",
+            COMMIT_MESSAGE,
+        ]
+    )
+    check_call(["git", "checkout", "main"])
+    add_failing_pre_commit_hook()
+
+    assert rex("--plumbing", "somebranch").wait() == 0
+
+    assert open("file.txt").read() == "Line appended by rex-commit\n"
+    assert git_show("%an <%ae> %ad", "main") == git_show("%an <%ae> %ad", "somebranch")
+    assert git_show("%cn", "main") == "Unit Test Runner\n"
+    assert git_show("%B", "main") == COMMIT_MESSAGE + "\n"
+    assert git_show("%s", "main^") == "Initial commit\n"
+    reflog = check_output(["git", "reflog", "-1", "--format=%gs", "main"], text=True)
+    assert reflog == "commit (rex): An example git-rex commit\n"
+    assert check_output(["git", "status", "--porcelain"]) == b""
+
+
+def test_rex_plumbing_empty_result(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "commit", "--allow-empty", "-m", EMPTY_COMMIT_MESSAGE])
+
+    p = rex("--plumbing", "HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+
+    assert p.returncode == 64
+    assert stderr == "fatal: nothing to commit, working tree clean\n"
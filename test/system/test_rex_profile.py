@@ -0,0 +1,56 @@
+"""Verify the `--profile` flag."""
+
+import json
+from subprocess import PIPE, check_call
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'File created by rex-commit' > file.txt
+```
+"""
+
+
+def test_rex_profile(rex, temp_git_repo, tmp_path_factory):
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+    trace_file = tmp_path_factory.mktemp("profile") / "trace.json"
+
+    p = rex("--profile", str(trace_file), "HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+    assert p.returncode == 0
+
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    names = {event["name"] for event in events}
+    assert {"clean check", "read message", "bash script", "commit"} <= names
+    assert "git commit" in names
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    (script_event,) = [event for event in events if event["name"] == "bash script"]
+    assert script_event["args"] == {"line": 4}
+
+    lines = stderr.splitlines()
+    assert lines[0].startswith("profile: ")
+    assert lines[1].split() == ["calls", "ms", "name"]
+    assert lines[2].endswith("  rex")
+
+
+def test_rex_profile_startup_queries_overlap(rex, temp_git_repo, tmp_path_factory):
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+    trace_file = tmp_path_factory.mktemp("profile") / "trace.json"
+
+    assert rex("--profile", str(trace_file), "HEAD", stderr=PIPE).wait() == 0
+
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    (clean_check,) = [event for event in events if event["name"] == "clean check"]
+    reads = [event for event in events if event["name"] == "git cat-file"]
+    assert any(event["tid"] != clean_check["tid"] for event in reads)
+
+
+def test_rex_unstaged_changes_reported_before_bad_revision(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    open("unstaged.txt", "w").write("Work in progress\n")
+
+    p = rex("no-such-commit", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+
+    assert p.returncode == 64
+    assert "You have unstaged changes" in stderr
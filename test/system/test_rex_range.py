@@ -0,0 +1,83 @@
+"""Verify reexecuting several commits at once, `git rex A..B`."""
+
+from subprocess import PIPE, check_call, check_output
+
+
+def commit_message(n: int) -> str:
+    return f"""Append line {n}
+
+```bash
+echo 'Line {n}' >> file.txt
+```
+"""
+
+
+def create_rex_branch() -> None:
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "checkout", "-b", "somebranch"])
+    for n in range(1, 4):
+        check_call(["git", "commit", "--allow-empty", "-m", commit_message(n)])
+    check_call(["git", "checkout", "main"])
+
+
+def check_output_lines(cmd):
+    return check_output(cmd, encoding="ascii").splitlines()
+
+
+def test_rex_range(rex, temp_git_repo):
+    create_rex_branch()
+
+    assert rex("main..somebranch").wait() == 0
+
+    file_txt = open("file.txt").read().splitlines()
+    assert file_txt == ["Line 1", "Line 2", "Line 3"]
+    log = check_output_lines(["git", "log", "--format=format:%s"])
+    assert log == ["Append line 3", "Append line 2", "Append line 1", "Initial commit"]
+
+
+def test_rex_commits_from_stdin(rex, temp_git_repo):
+    create_rex_branch()
+    commits = check_output_lines(["git", "rev-list", "main..somebranch"])
+
+    p = rex("--stdin", stdin=PIPE, encoding="ascii")
+    p.communicate("\0".join([commits[0], commits[2]]))
+    assert p.returncode == 0
+
+    file_txt = open("file.txt").read().splitlines()
+    assert file_txt == ["Line 3", "Line 1"]
+    log = check_output_lines(["git", "log", "--format=format:%s"])
+    assert log == ["Append line 1", "Append line 3", "Initial commit"]
+
+
+def test_rex_stdin_entries_are_stripped(rex, temp_git_repo):
+    create_rex_branch()
+    commits = check_output_lines(["git", "rev-list", "main..somebranch"])
+
+    p = rex("--stdin", stdin=PIPE, encoding="ascii")
+    p.communicate(f"{commits[2]}\n\0 {commits[1]}\n\0\n")
+    assert p.returncode == 0
+
+    assert open("file.txt").read().splitlines() == ["Line 1", "Line 2"]
+
+
+def test_rex_head_resolved_before_reexecuting(rex, temp_git_repo):
+    create_rex_branch()
+    check_call(["git", "checkout", "--quiet", "somebranch~"])
+
+    assert rex("somebranch", "HEAD").wait() == 0
+
+    file_txt = open("file.txt").read().splitlines()
+    assert file_txt == ["Line 3", "Line 2"]
+    log = check_output_lines(["git", "log", "--format=format:%s"])
+    assert log[:2] == ["Append line 2", "Append line 3"]
+
+
+def test_rex_empty_range(rex, temp_git_repo):
+    create_rex_branch()
+    head = check_output(["git", "rev-parse", "HEAD"], encoding="ascii")
+
+    p = rex("HEAD..HEAD", stdout=PIPE, stderr=PIPE, encoding="utf-8")
+    stdout, stderr = p.communicate()
+
+    assert (p.returncode, stdout, stderr) == (0, "", "")
+    assert check_output(["git", "rev-parse", "HEAD"], encoding="ascii") == head
@@ -0,0 +1,87 @@
+"""Verify rebasing with `git rex --rebase UPSTREAM`."""
+
+from subprocess import check_call, check_output
+
+SCRIPT_COMMIT_MESSAGE = """Append a line with rex
+
+```bash
+echo 'Line appended by rex-commit' >> file.txt
+```
+"""
+
+
+def write(filename, *lines):
+    with open(filename, "w") as file:
+        for line in lines:
+            print(line, file=file)
+
+
+def commit_all(message, *args):
+    check_call(["git", "add", "-A"])
+    check_call(["git", "commit", "--quiet", "--allow-empty", "-m", message, *args])
+
+
+def check_output_lines(cmd):
+    return check_output(cmd, encoding="utf-8").splitlines()
+
+
+def create_diverged_branches():
+    write("file.txt", "First line")
+    write("other.txt", "one", "two", "three", "four", "five")
+    commit_all("Initial commit")
+
+    check_call(["git", "checkout", "--quiet", "-b", "feature"])
+    write("other.txt", "one", "two", "three", "four", "FIVE")
+    commit_all("Shout five", "--author=Feature Author <feature@example.com>")
+    write("file.txt", "First line", "Line appended on feature")
+    commit_all(SCRIPT_COMMIT_MESSAGE)
+    write("new.txt", "New file")
+    commit_all("Add new.txt")
+
+    check_call(["git", "checkout", "--quiet", "main"])
+    write("file.txt", "First line", "Line appended on main")
+    write("other.txt", "ONE", "two", "three", "four", "five")
+    commit_all("Change main")
+    check_call(["git", "checkout", "--quiet", "feature"])
+
+
+def test_rex_rebase(rex, temp_git_repo):
+    create_diverged_branches()
+
+    assert rex("--rebase", "main").wait() == 0
+
+    assert check_output_lines(["git", "log", "--format=%s by %an"]) == [
+        "Add new.txt by Unit Test Runner",
+        "Append a line with rex by Unit Test Runner",
+        "Shout five by Feature Author",
+        "Change main by Unit Test Runner",
+        "Initial commit by Unit Test Runner",
+    ]
+    assert check_output_lines(["git", "symbolic-ref", "HEAD"]) == ["refs/heads/feature"]
+    assert check_output_lines(["git", "status", "--porcelain"]) == []
+    assert open("file.txt").read().splitlines() == [
+        "First line",
+        "Line appended on main",
+        "Line appended by rex-commit",
+    ]
+    assert open("other.txt").read().splitlines() == [
+        "ONE",
+        "two",
+        "three",
+        "four",
+        "FIVE",
+    ]
+    assert open("new.txt").read() == "New file\n"
+
+
+def test_rex_rebase_conflict(rex, temp_git_repo):
+    create_diverged_branches()
+    write("other.txt", "One", "two", "three", "four", "FIVE")
+    commit_all("Capitalize one")
+    original_head = check_output_lines(["git", "rev-parse", "HEAD"])
+
+    assert rex("--rebase", "main").wait() == 1
+
+    assert check_output_lines(["git", "rev-parse", "HEAD"]) == original_head
+    assert check_output_lines(["git", "symbolic-ref", "HEAD"]) == ["refs/heads/feature"]
+    assert check_output_lines(["git", "status", "--porcelain"]) == []
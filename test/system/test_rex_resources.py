@@ -0,0 +1,62 @@
+"""Verify the `--timeout` and `--resource-usage` flags, and the rex.*Limit config."""
+
+from subprocess import PIPE, check_call
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'File created by rex-commit' > file.txt
+```
+
+```python
+open("file.txt", "a").write("Line appended by rex-commit\\n")
+```
+"""
+SLOW_COMMIT_MESSAGE = """A slow git-rex commit
+
+```bash
+sleep 5
+```
+"""
+
+
+def test_rex_resource_usage(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+
+    p = rex("--resource-usage", "HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+    assert p.returncode == 0
+
+    lines = stderr.splitlines()
+    assert len(lines) == 2
+    assert lines[0].startswith("usage: 4: bash script: ")
+    assert lines[1].startswith("usage: 8: python script: ")
+    assert "MiB max RSS" in lines[0]
+
+
+def test_rex_timeout(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", SLOW_COMMIT_MESSAGE])
+
+    p = rex("--timeout", "0.2", "HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+
+    assert p.returncode == 124
+    assert stderr == "error: 4: script timed out after 0.2s\n"
+
+
+def test_rex_timeout_config(rex, temp_git_repo):
+    check_call(["git", "config", "rex.timeout", "0.2"])
+    check_call(["git", "commit", "--allow-empty", "-m", SLOW_COMMIT_MESSAGE])
+
+    assert rex("HEAD", stderr=PIPE).wait() == 124
+
+
+def test_rex_bad_limit_config(rex, temp_git_repo):
+    check_call(["git", "config", "rex.memoryLimit", "lots"])
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+
+    p = rex("HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+
+    assert p.returncode == 64
+    assert "bad numeric config value 'lots' for 'rex.memorylimit'" in stderr
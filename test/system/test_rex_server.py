@@ -0,0 +1,137 @@
+"""Verify running git rex in a warm server, with `git rex server`."""
+
+import os
+import time
+from subprocess import PIPE, check_call, check_output
+
+import pytest
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'Line appended by rex-commit' >> file.txt
+echo 'Output from the script'
+echo "Running in $PWD" >&2
+```
+"""
+
+FAILING_COMMIT_MESSAGE = """A failing git-rex commit
+
+```bash
+exit 3
+```
+"""
+
+
+def rex_output(rex, *args):
+    p = rex(*args, stdout=PIPE, encoding="utf-8")
+    stdout, _ = p.communicate()
+    assert p.returncode == 0
+    return stdout
+
+
+def served_requests(rex):
+    status = rex_output(rex, "server", "status").splitlines()
+    assert status[2].startswith("requests: ")
+    return int(status[2].split()[1])
+
+
+@pytest.fixture
+def rex_server(rex, temp_git_repo):
+    assert rex_output(rex, "server", "start").startswith("Server running (pid ")
+    try:
+        yield
+    finally:
+        rex("server", "stop").wait()
+
+
+def test_rex_server(rex, rex_server, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+    commit = check_output(["git", "rev-parse", "HEAD"], encoding="ascii").strip()
+    check_call(["git", "commit", "--allow-empty", "-m", FAILING_COMMIT_MESSAGE])
+    assert served_requests(rex) == 0
+
+    # Output, exit codes and the working directory are forwarded
+    os.mkdir("subdir")
+    p = rex(commit, stdout=PIPE, stderr=PIPE, encoding="utf-8", cwd="subdir")
+    stdout, stderr = p.communicate()
+    assert p.returncode == 0
+    assert stdout.startswith("Output from the script\n")
+    assert stderr == f"Running in {temp_git_repo}\n"
+    assert rex(commit).wait() == 0
+    assert rex("HEAD~2").wait() == 3
+    assert served_requests(rex) == 3
+
+    assert open("file.txt").read() == "Line appended by rex-commit\n" * 2
+    assert check_output(["git", "log", "--format=%s", "-2"], text=True) == (
+        "An example git-rex commit\nAn example git-rex commit\n"
+    )
+
+    assert rex_output(rex, "server", "stop") == "Server stopped\n"
+    assert rex_output(rex, "server", "status") == "No server running\n"
+
+
+def test_rex_server_idle_timeout(rex, temp_git_repo):
+    assert rex("server", "start", "--idle-timeout", "0.5").wait() == 0
+    deadline = time.monotonic() + 10
+    while rex_output(rex, "server", "status") != "No server running\n":
+        assert time.monotonic() < deadline
+        time.sleep(0.2)
+
+
+SLOW_COMMIT_MESSAGE = """A slow git-rex commit
+
+```bash
+sleep 1
+echo 'File created by rex' > file.txt
+```
+"""
+
+
+def test_rex_server_runs_requests_concurrently(rex, rex_server, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "commit", "--allow-empty", "-m", SLOW_COMMIT_MESSAGE])
+    worktrees = []
+    for name in ("first", "second"):
+        check_call(["git", "worktree", "add", "--quiet", "-b", name, name, "HEAD~"])
+        worktrees.append(temp_git_repo / name)
+
+    start = time.monotonic()
+    # Without the cache, which would let the second run reuse the first's result
+    processes = [rex("--no-cache", "main", cwd=worktree) for worktree in worktrees]
+    # The server answers, and accepts more runs, while runs are in progress
+    while served_requests(rex) < 2:
+        assert time.monotonic() - start < 1
+    assert [p.wait() for p in processes] == [0, 0]
+    assert time.monotonic() - start < 2
+
+    for worktree in worktrees:
+        assert (worktree / "file.txt").read_text() == "File created by rex\n"
+        log = check_output(["git", "log", "--format=%s"], cwd=worktree, text=True)
+        assert log == "A slow git-rex commit\nInitial commit\n"
+
+
+PRINTING_COMMIT_MESSAGE = """A git-rex commit that prints
+
+```bash
+echo 'Output from the script'
+echo 'Line appended by rex-commit' >> file.txt
+```
+"""
+
+
+def test_rex_server_rereads_global_config(
+    rex, rex_server, temp_git_repo, tmp_path_factory
+):
+    home = tmp_path_factory.mktemp("home")
+    (home / "included.gitconfig").write_text("")
+    (home / ".gitconfig").write_text("[include]\n\tpath = included.gitconfig\n")
+    rex.env = {**os.environ, "HOME": str(home), "XDG_CONFIG_HOME": str(home)}
+    check_call(["git", "commit", "--allow-empty", "-m", PRINTING_COMMIT_MESSAGE])
+
+    assert rex_output(rex, "--no-cache", "HEAD") == "Output from the script\n"
+
+    # Output is captured once an included global config file says so
+    (home / "included.gitconfig").write_text("[rex]\n\tcaptureOutput = true\n")
+    assert rex_output(rex, "--no-cache", "HEAD") == ""
+    assert served_requests(rex) == 2
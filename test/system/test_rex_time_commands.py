@@ -0,0 +1,50 @@
+"""Verify the `--time-commands` flag."""
+
+import os
+from shutil import which
+from subprocess import PIPE, check_call
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'File created by rex-commit' > file.txt
+sleep 0.2
+```
+"""
+
+
+def test_rex_time_commands(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+
+    p = rex("--time-commands", "HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+    assert p.returncode == 0
+
+    lines = stderr.splitlines()
+    assert lines[0] == "Slowest commands:"
+    assert lines[1].endswith("s  5: sleep 0.2")
+    assert lines[2].endswith("s  4: echo 'File created by rex-commit' > file.txt")
+
+
+def test_rex_time_commands_needs_bash_5(rex, temp_git_repo, tmp_path_factory):
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+    bin_dir = tmp_path_factory.mktemp("bin")
+    old_bash = bin_dir / "bash"
+    # Reports the version of macOS's /bin/bash, but runs scripts with this bash
+    old_bash.write_text(
+        "#!/bin/sh\n"
+        'case "$*" in *BASH_VERSION*) echo "3.2.57(1)-release" ; exit ;; esac\n'
+        f'exec {which("bash")} "$@"\n'
+    )
+    old_bash.chmod(0o755)
+    rex.env = {**os.environ, "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}"}
+
+    p = rex("--time-commands", "HEAD", stderr=PIPE, encoding="utf-8")
+    _, stderr = p.communicate()
+
+    assert p.returncode == 64
+    assert stderr.splitlines() == [
+        "fatal: --time-commands needs bash 5 or later,"
+        " but bash is version 3.2.57(1)-release"
+    ]
+    assert not os.path.exists("file.txt")
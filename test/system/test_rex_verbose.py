@@ -23,3 +23,15 @@ def test_rex_commit(rex, temp_git_repo):
 
     assert stdout == ""
     assert stderr == "+ echo 'File created by rex-commit'\n"
+
+
+def test_rex_diagnostics(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+
+    p = rex("-vv", "HEAD", stdout=PIPE, stderr=PIPE, encoding="utf-8")
+    stdout, stderr = p.communicate()
+    assert p.returncode == 0
+
+    lines = stderr.splitlines()
+    assert lines[0].startswith("info: Checked working tree with ")
+    assert lines[1:] == ["+ echo 'File created by rex-commit'"]
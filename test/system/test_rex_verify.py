@@ -0,0 +1,101 @@
+"""Verify checking that commits reproduce, `git rex --verify`."""
+
+from subprocess import PIPE, check_call, check_output
+
+
+def commit_message(subject: str, script: str) -> str:
+    return f"""{subject}
+
+```bash
+{script}
+```
+"""
+
+
+def rev_parse(rev: str) -> str:
+    return check_output(["git", "rev-parse", rev], encoding="ascii").strip()
+
+
+def commit_file(subject: str, line: str, script: str) -> None:
+    with open("file.txt", "a") as f:
+        f.write(f"{line}\n")
+    check_call(["git", "add", "file.txt"])
+    check_call(["git", "commit", "--quiet", "-m", commit_message(subject, script)])
+
+
+def test_rex_verify(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    commit_file("Append line 1", "Line 1", "echo 'Line 1' >> file.txt")
+    commit_file("Append line 2", "Line 2", "echo 'Line 2' >> file.txt")
+    check_call(["git", "commit", "--allow-empty", "-m", "No scripts"])
+    open("unstaged.txt", "w").write("Work in progress\n")
+
+    p = rex("--verify", "-j", "2", "main~3..main", stdout=PIPE, encoding="utf-8")
+    stdout, _ = p.communicate()
+
+    assert p.returncode == 0
+    assert stdout.splitlines() == [
+        f"ok {rev_parse('main~2')} Append line 1",
+        f"ok {rev_parse('main~1')} Append line 2",
+    ]
+    assert check_output(["git", "worktree", "list"], encoding="utf-8").count("\n") == 1
+    assert open("unstaged.txt").read() == "Work in progress\n"
+
+
+def test_rex_verify_failures(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    commit_file("Edited by hand", "Line 1", "echo 'Other line' >> file.txt")
+    check_call(
+        ["git", "commit", "--allow-empty", "-m", commit_message("Fails", "exit 3")]
+    )
+    check_call(["git", "commit", "--allow-empty", "-m", "Bad\n\n```sh\ntrue\n```\n"])
+    mismatch, failure, bad = rev_parse("HEAD~2"), rev_parse("HEAD~1"), rev_parse("HEAD")
+
+    p = rex("--verify", "main~3..main", stdout=PIPE, stderr=PIPE, encoding="utf-8")
+    stdout, stderr = p.communicate()
+
+    assert p.returncode == 1
+    log_dir = temp_git_repo / ".git" / "rex" / "verify"
+    assert stdout.splitlines() == [
+        f"mismatch {mismatch} Edited by hand",
+        " file.txt | 2 +-",
+        " 1 file changed, 1 insertion(+), 1 deletion(-)",
+        f"  output: {log_dir / f'{mismatch}.log'}",
+        f"failed {failure} Fails: script failed with exit code 3",
+        f"  output: {log_dir / f'{failure}.log'}",
+        f"failed {bad} Bad: 3: Code sections must specify bash or python syntax",
+    ]
+    assert stderr.splitlines() == ["error: 3 of 3 commits did not reproduce"]
+
+
+def test_rex_verify_needs_revisions(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+
+    assert rex("--verify", stdout=PIPE).wait() == 64
+
+
+def test_rex_verify_reports_unexpected_errors(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    commit_file("Append line 1", "Line 1", "echo 'Line 1' >> file.txt")
+    crash = "Crash\n\n```python\nimport os\nos._exit(0)\n```\n"
+    check_call(["git", "commit", "--allow-empty", "-m", crash])
+    ok_hash, crash_hash = rev_parse("HEAD~1"), rev_parse("HEAD")
+
+    p = rex(
+        "--verify",
+        "-j",
+        "1",
+        "main~2..main",
+        stdout=PIPE,
+        stderr=PIPE,
+        encoding="utf-8",
+    )
+    stdout, stderr = p.communicate()
+
+    assert p.returncode == 1, stderr
+    assert stdout.splitlines() == [
+        f"ok {ok_hash} Append line 1",
+        f"failed {crash_hash} Crash: BrokenProcessPool: A process in the process pool"
+        " was terminated abruptly while the future was running or pending.",
+    ]
+    assert stderr.splitlines() == ["error: 1 of 2 commits did not reproduce"]
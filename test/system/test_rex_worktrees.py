@@ -0,0 +1,64 @@
+"""Verify running rex in linked worktrees, including several at once."""
+
+from subprocess import PIPE, check_call, check_output
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'File created by rex' > file.txt
+```
+"""
+SLOW_COMMIT_MESSAGE = """A slow git-rex commit
+
+```bash
+echo 'Started'
+sleep 1
+echo 'File created by rex' > file.txt
+```
+"""
+
+
+def check_output_lines(cmd, **kwargs):
+    return check_output(cmd, encoding="ascii", **kwargs).splitlines()
+
+
+def test_rex_no_commit_in_linked_worktree(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE])
+    check_call(["git", "worktree", "add", "--quiet", "-b", "other", "other", "HEAD~"])
+    worktree = temp_git_repo / "other"
+
+    assert rex("--no-commit", "main", cwd=worktree).wait() == 0
+
+    assert (worktree / "file.txt").read_text() == "File created by rex\n"
+    assert not (temp_git_repo / ".git" / "MERGE_MSG").exists()
+    check_call(["git", "commit", "--no-edit"], cwd=worktree)
+    log = check_output_lines(["git", "log", "--format=format:%s"], cwd=worktree)
+    assert log == ["An example git-rex commit", "Initial commit"]
+
+
+def test_rex_concurrently_in_linked_worktrees(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "commit", "--allow-empty", "-m", SLOW_COMMIT_MESSAGE])
+    worktrees = []
+    for name in ("first", "second"):
+        check_call(["git", "worktree", "add", "--quiet", "-b", name, name, "HEAD~"])
+        worktrees.append(temp_git_repo / name)
+
+    processes = [
+        rex("--capture-output", "main", cwd=worktree, stderr=PIPE, encoding="utf-8")
+        for worktree in worktrees
+    ]
+    for p in processes:
+        _, stderr = p.communicate()
+        assert p.returncode == 0, stderr
+
+    for worktree in worktrees:
+        log = check_output_lines(["git", "log", "--format=format:%s"], cwd=worktree)
+        assert log == ["A slow git-rex commit", "Initial commit"]
+        assert (worktree / "file.txt").read_text() == "File created by rex\n"
+    # Each run captured its own output, rather than truncating the other's log
+    logs = sorted((temp_git_repo / ".git" / "rex").glob("output*.log"))
+    assert len(logs) == 2
+    for path in logs:
+        assert path.read_text().splitlines()[1:] == ["Started"]
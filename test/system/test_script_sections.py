@@ -26,3 +26,27 @@ def test_sections_run_as_separate_bash_script(rex, temp_git_repo):
     assert file_txt == ["Line appended by rex-commit"]
     subdir_file_txt = open("foo/file.txt").read().splitlines()
     assert subdir_file_txt == ["New file created by rex-commit"]
+
+
+PYTHON_COMMIT_MESSAGE = """Python file manipulations
+
+```python
+from pathlib import Path
+for name in ("one", "two"):
+    Path(f"{name}.txt").write_text(f"Created {name} in python\\n")
+```
+
+```bash
+echo 'Line appended by bash' >> one.txt
+```
+"""
+
+
+def test_python_sections(rex, temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", PYTHON_COMMIT_MESSAGE])
+    COMMIT = check_output(["git", "rev-parse", "HEAD"], encoding="ascii").strip()
+    assert rex(COMMIT).wait() == 0
+
+    one_txt = open("one.txt").read().splitlines()
+    assert one_txt == ["Created one in python", "Line appended by bash"]
+    assert open("two.txt").read() == "Created two in python\n"
@@ -0,0 +1,110 @@
+import os
+from subprocess import check_call, check_output
+
+import pytest
+
+from git_rex import git
+from git_rex.api import Repository, ScriptFailed
+
+COMMIT_MESSAGE = """An example git-rex commit
+
+```bash
+echo 'Line 1' > file.txt
+```
+
+```python
+import os
+with open("cwd.txt", "w") as f:
+    print(os.path.basename(os.getcwd()), file=f)
+```
+"""
+FAILING_COMMIT_MESSAGE = """A failing git-rex commit
+
+```bash
+echo 'Line 1' > file.txt
+```
+
+```bash
+exit 3
+```
+"""
+
+
+def rev_parse(rev, cwd):
+    return check_output(["git", "rev-parse", rev], cwd=cwd, encoding="ascii").strip()
+
+
+@pytest.fixture
+def repo_and_other_dir(temp_git_repo, tmp_path_factory):
+    """The repository, with the process moved to some other directory."""
+    repo = temp_git_repo
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    other_dir = tmp_path_factory.mktemp("other")
+    os.chdir(other_dir)
+    return repo, other_dir
+
+
+def test_reexecute(repo_and_other_dir):
+    repo, other_dir = repo_and_other_dir
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE], cwd=repo)
+    check_call(["git", "checkout", "--quiet", "-b", "replay", "HEAD~"], cwd=repo)
+
+    with Repository(str(repo)) as repository:
+        result = repository.reexecute("main", use_cache=False)
+
+    assert os.getcwd() == str(other_dir)
+    assert result.commit_hash == rev_parse("HEAD", repo)
+    assert result.tree == rev_parse("HEAD^{tree}", repo)
+    assert result.changed_paths == ["cwd.txt", "file.txt"]
+    assert not result.from_cache
+    assert [(block.first_lineno, block.syntax) for block in result.blocks] == [
+        (4, "bash"),
+        (8, "python"),
+    ]
+    assert all(block.exit_code == 0 and block.duration >= 0 for block in result.blocks)
+    assert (repo / "cwd.txt").read_text() == f"{repo.name}\n"
+
+
+def test_reexecute_reuses_handle_and_cache(repo_and_other_dir):
+    repo, _ = repo_and_other_dir
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE], cwd=repo)
+
+    with Repository(str(repo)) as repository:
+        for branch in ("first", "second"):
+            check_call(["git", "checkout", "--quiet", "-b", branch, "main~"], cwd=repo)
+            result = repository.reexecute("main", plumbing=True, use_cache=True)
+            assert result.commit_hash == rev_parse(branch, repo)
+
+    assert result.from_cache
+    assert result.blocks == []
+    assert result.changed_paths == ["cwd.txt", "file.txt"]
+
+
+def test_reexecute_script_failure(repo_and_other_dir):
+    repo, _ = repo_and_other_dir
+    message = FAILING_COMMIT_MESSAGE
+    check_call(["git", "commit", "--allow-empty", "-m", message], cwd=repo)
+    check_call(["git", "checkout", "--quiet", "-b", "replay", "HEAD~"], cwd=repo)
+
+    with Repository(str(repo)) as repository:
+        with pytest.raises(ScriptFailed) as ex:
+            repository.reexecute("main")
+
+    assert ex.value.exit_code == 3
+    assert [block.exit_code for block in ex.value.blocks] == [0, 3]
+    assert rev_parse("HEAD", repo) == rev_parse("main~", repo)
+
+
+def test_reexecute_unstaged_changes(repo_and_other_dir):
+    repo, _ = repo_and_other_dir
+    check_call(["git", "commit", "--allow-empty", "-m", COMMIT_MESSAGE], cwd=repo)
+    (repo / "draft.txt").write_text("Work in progress\n")
+
+    with Repository(str(repo)) as repository:
+        with pytest.raises(git.UnstagedChanges):
+            repository.reexecute("HEAD")
+
+
+def test_not_a_repository(tmp_path):
+    with pytest.raises(git.GitFailure):
+        Repository(str(tmp_path))
@@ -1,10 +1,14 @@
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import PIPE, Popen
+from typing import List
 
 import pytest
 
 from git_rex.bash import BashScript, UserCodeError
+from git_rex.resources import TIMEOUT_EXIT_CODE, ResourceLimits
+from git_rex.timings import CommandTiming
 
 
 def test_change_directory_in_script(temp_working_dir):
@@ -99,3 +103,90 @@ def test_verbose_script_failure(temp_working_dir, capfd: pytest.CaptureFixture[s
         "+ false",
         "error: 4: 'false' returned status code 1",
     ]
+
+
+def test_command_timings(temp_working_dir, capfd: pytest.CaptureFixture[str]):
+    script = BashScript(
+        4, ("echo hi there", "sleep 0.2", "for i in 1 2; do true; done")
+    )
+    timings: List[CommandTiming] = []
+    script.execute(verbose=True, timings=timings)
+
+    assert [(t.lineno, t.command) for t in timings] == [
+        (4, "echo hi there"),
+        (5, "sleep 0.2"),
+        (6, "for i in 1 2"),
+        (6, "true"),
+        (6, "for i in 1 2"),
+        (6, "true"),
+    ]
+    assert timings[1].seconds >= 0.2
+    # Timing is recorded on a side channel, not in the set -x output
+    _, stderr = capfd.readouterr()
+    assert stderr.splitlines() == [
+        "+ echo hi there",
+        "+ sleep 0.2",
+        "+ for i in 1 2",
+        "+ true",
+        "+ for i in 1 2",
+        "+ true",
+    ]
+
+
+def test_command_timings_on_failure(temp_working_dir):
+    script = BashScript(1, ("sleep 0.1", "false", "echo unreachable"))
+    timings: List[CommandTiming] = []
+    with pytest.raises(UserCodeError):
+        script.execute(timings=timings)
+
+    assert [(t.lineno, t.command) for t in timings] == [(1, "sleep 0.1"), (2, "false")]
+
+
+def test_timeout(temp_working_dir, capfd: pytest.CaptureFixture[str]):
+    script = BashScript(3, ("sleep 5 &", "sleep 5", "touch file.txt"))
+    with pytest.raises(UserCodeError) as ex:
+        script.execute(limits=ResourceLimits(timeout=0.2))
+
+    assert ex.value.resultcode == TIMEOUT_EXIT_CODE
+    assert not os.path.exists("file.txt")
+    _, stderr = capfd.readouterr()
+    assert stderr == "error: 3: script timed out after 0.2s\n"
+
+
+def test_file_size_limit(temp_working_dir):
+    script = BashScript(1, ("head -c 100000 /dev/zero > file.bin",))
+    with pytest.raises(UserCodeError):
+        script.execute(limits=ResourceLimits(file_size=2048))
+
+    assert os.path.getsize("file.bin") == 2048
+
+
+def test_limits_from_another_thread(temp_working_dir):
+    script = BashScript(1, ("ulimit -S -f > limit.txt",))
+    limits = ResourceLimits(file_size=1000, timeout=10)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(script.execute, limits=limits).result()
+
+    # Rounded up to whole KiB, the unit of bash's ulimit
+    assert open("limit.txt").read() == "1\n"
+
+
+def test_limits_wrap_command():
+    limits = ResourceLimits(cpu_seconds=5, memory=3 * 1024 * 1024)
+    assert limits.command(["bash", "script"]) == [
+        "bash",
+        "-c",
+        'ulimit -S -t 5 && ulimit -S -v 3072 && exec "$@"',
+        "bash",
+        "bash",
+        "script",
+    ]
+    assert ResourceLimits(timeout=1).command(["bash", "script"]) == ["bash", "script"]
+
+
+def test_resource_usage(temp_working_dir):
+    script = BashScript(1, ("head -c 100000 /dev/zero | gzip > file.gz",))
+    usage = script.execute()
+
+    assert usage.wall > 0
+    assert usage.max_rss > 0
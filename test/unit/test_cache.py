@@ -0,0 +1,19 @@
+import sys
+from subprocess import Popen
+
+from git_rex import cache
+
+RECORD_HITS = """
+from git_rex import cache
+for i in range(25):
+    cache.record_hit(f"key-{i}")
+"""
+
+
+def test_concurrent_updates_are_not_lost(temp_git_repo):
+    processes = [Popen([sys.executable, "-c", RECORD_HITS]) for _ in range(4)]
+    assert [p.wait() for p in processes] == [0] * 4
+
+    usage = cache.read_usage()
+    assert usage["hits"] == 100
+    assert sorted(usage["last_used"]) == sorted(f"key-{i}" for i in range(25))
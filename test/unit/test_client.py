@@ -0,0 +1,30 @@
+import os
+from pathlib import Path
+from subprocess import check_call
+
+from git_rex import git
+from git_rex.client import find_common_dir
+
+
+def test_find_common_dir(temp_git_repo):
+    os.mkdir("subdir")
+    os.chdir("subdir")
+    common_dir = find_common_dir(os.getcwd())
+
+    assert common_dir is not None
+    assert Path(common_dir).resolve() == git.common_dir().resolve()
+
+
+def test_find_common_dir_in_worktree(temp_git_repo, tmp_path_factory):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    worktree = tmp_path_factory.mktemp("worktree") / "linked"
+    check_call(["git", "worktree", "add", "--quiet", str(worktree)])
+    os.chdir(worktree)
+    common_dir = find_common_dir(os.getcwd())
+
+    assert common_dir is not None
+    assert Path(common_dir).resolve() == (temp_git_repo / ".git").resolve()
+
+
+def test_find_common_dir_outside_repository(tmp_path):
+    assert find_common_dir(str(tmp_path)) is None
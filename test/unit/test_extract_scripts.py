@@ -3,10 +3,13 @@ import pytest
 from git_rex.messages import (
     NoScriptBlockFound,
     UnexpectedCodeBlock,
+    UnsupportedCodeAttribute,
     UnsupportedCodeSyntax,
     UnterminatedCodeBlock,
     extract_scripts,
+    script_paths,
 )
+from git_rex.python import PythonScript
 
 
 def test_no_code_block():
@@ -31,3 +34,36 @@ def test_label_on_closing_ticks():
         extract_scripts("Some commit\n\n```bash\ndo a thing\n```bash")
 
     assert ex.value.lineno == 5
+
+
+def test_python_block_keeps_indentation():
+    message = "Some commit\n\n```python\n    if True:\n        pass\n```"
+    (script,) = extract_scripts(message)
+
+    assert isinstance(script, PythonScript)
+    assert script.first_lineno == 4
+    assert script.script == ("if True:", "    pass")
+
+
+def test_paths_attribute():
+    message = "Some commit\n\n```bash paths=src,docs\nls\n```\n```python\npass\n```"
+    bash_script, python_script = extract_scripts(message)
+
+    assert bash_script.paths == ("src", "docs")
+    assert python_script.paths == ()
+    assert script_paths([bash_script, python_script]) is None
+    assert script_paths([bash_script, bash_script]) == ("src", "docs")
+
+
+def test_unsupported_attribute():
+    with pytest.raises(UnsupportedCodeAttribute) as ex:
+        extract_scripts("Some commit\n\n```bash path=src\ndo a thing\n```")
+
+    assert (ex.value.lineno, ex.value.name) == (3, "path")
+
+
+def test_attribute_on_closing_ticks():
+    with pytest.raises(UnexpectedCodeBlock) as ex:
+        extract_scripts("Some commit\n\n```bash\ndo a thing\n``` paths=src")
+
+    assert ex.value.lineno == 5
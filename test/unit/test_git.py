@@ -1,6 +1,8 @@
 import os
 import re
-from subprocess import check_call
+from subprocess import check_call, check_output, run
+
+import pytest
 
 from git_rex import git
 
@@ -21,3 +23,190 @@ def test_top_level(temp_git_repo):
     os.mkdir("subdir")
     os.chdir("subdir")
     assert git.top_level() == temp_git_repo
+
+
+def test_commit_from_annotated_tag(temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Tagged commit"])
+    check_call(["git", "tag", "-a", "-m", "A tag", "v1.0"])
+
+    c = git.Commit("v1.0")
+
+    assert c.hash == git.Commit("HEAD").hash
+    assert c.message == "Tagged commit\n"
+
+
+def test_commit_with_legacy_encoding(temp_git_repo):
+    check_call(["git", "config", "i18n.commitEncoding", "ISO-8859-1"])
+    run(
+        ["git", "commit", "--allow-empty", "-F", "-"],
+        input="Caf\xe9\n".encode("iso-8859-1"),
+        check=True,
+    )
+
+    assert git.Commit("HEAD").message == "Caf\xe9\n"
+
+
+def test_commit_parents(temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+    check_call(["git", "checkout", "--quiet", "-b", "other"])
+    check_call(["git", "commit", "--allow-empty", "-m", "Other commit"])
+    check_call(["git", "checkout", "--quiet", "main"])
+    check_call(["git", "commit", "--allow-empty", "-m", "Main commit"])
+    check_call(["git", "merge", "--quiet", "--no-edit", "other"])
+
+    def rev_parse(rev):
+        return check_output(["git", "rev-parse", rev], encoding="ascii").strip()
+
+    assert git.Commit("HEAD").parents == [rev_parse("HEAD^1"), rev_parse("HEAD^2")]
+    assert git.Commit("HEAD^1").parents == [rev_parse("HEAD~2")]
+    assert git.Commit("HEAD~2").parents == []
+
+
+def test_unknown_commit(temp_git_repo):
+    check_call(["git", "commit", "--allow-empty", "-m", "Initial commit"])
+
+    with pytest.raises(git.GitFailure) as ex:
+        git.Commit("no-such-branch").hash
+
+    assert ex.value.message == "Not a valid commit name no-such-branch"
+
+
+@pytest.fixture(params=["default", "untracked-cache"])
+def check_strategy(request, temp_git_repo):
+    if request.param == "untracked-cache":
+        check_call(["git", "config", "core.untrackedCache", "true"])
+    with open("file.txt", "w") as file:
+        print("Test file", file=file)
+    check_call(["git", "add", "file.txt"])
+    check_call(["git", "commit", "-m", "Added a test file"])
+
+
+def test_clean_repo(check_strategy):
+    assert git.is_clean_repo()
+    assert git.no_unstaged_changes()
+
+
+def test_staged_changes(check_strategy):
+    with open("file.txt", "a") as file:
+        print("Staged line", file=file)
+    check_call(["git", "add", "file.txt"])
+
+    assert not git.is_clean_repo()
+    assert git.no_unstaged_changes()
+
+
+def test_unstaged_changes(check_strategy):
+    with open("file.txt", "a") as file:
+        print("Unstaged line", file=file)
+
+    assert not git.is_clean_repo()
+    assert not git.no_unstaged_changes()
+
+
+def test_untracked_files(check_strategy):
+    os.makedirs("subdir/nested")
+    with open("subdir/nested/untracked.txt", "w") as file:
+        print("Untracked file", file=file)
+
+    assert not git.is_clean_repo()
+    assert not git.no_unstaged_changes()
+
+
+def test_ignored_files(check_strategy):
+    with open(".git/info/exclude", "a") as file:
+        print("*.log", file=file)
+    with open("ignored.log", "w") as file:
+        print("Ignored file", file=file)
+
+    assert git.is_clean_repo()
+
+
+def test_clean_check_before_first_commit(temp_git_repo):
+    assert git.is_clean_repo()
+    with open("file.txt", "w") as file:
+        print("Test file", file=file)
+    check_call(["git", "add", "file.txt"])
+    assert not git.is_clean_repo()
+    assert git.no_unstaged_changes()
+
+
+def test_stage_changes(temp_git_repo):
+    for filename in ("modified.txt", "deleted.txt", "unchanged.txt"):
+        with open(filename, "w") as file:
+            print("Test file", file=file)
+    with open(".gitignore", "w") as file:
+        print("*.log", file=file)
+    check_call(["git", "add", "-A"])
+    check_call(["git", "commit", "-m", "Added test files"])
+
+    with open("modified.txt", "a") as file:
+        print("Modified line", file=file)
+    os.remove("deleted.txt")
+    os.mkdir("subdir")
+    with open("subdir/created.txt", "w") as file:
+        print("New file", file=file)
+    with open("ignored.log", "w") as file:
+        print("Ignored file", file=file)
+    os.utime("unchanged.txt")
+
+    git.stage_changes()
+
+    status = check_output(
+        ["git", "status", "--porcelain", "--ignored"], encoding="utf-8"
+    )
+    assert status.splitlines() == [
+        "D  deleted.txt",
+        "M  modified.txt",
+        "A  subdir/created.txt",
+        "!! ignored.log",
+    ]
+
+
+def test_clean_check_in_paths(check_strategy):
+    os.mkdir("scoped")
+    with open("scoped/untracked.txt", "w") as file:
+        print("Untracked file", file=file)
+    with open("file.txt", "a") as file:
+        print("Unstaged line", file=file)
+
+    assert not git.is_clean_repo(["scoped"])
+    assert git.is_clean_repo(["other"])
+    assert not git.no_unstaged_changes(["file.txt"])
+
+
+def test_clean_check_in_paths_sees_all_staged_changes(check_strategy):
+    with open("file.txt", "a") as file:
+        print("Staged line", file=file)
+    check_call(["git", "add", "file.txt"])
+
+    assert not git.is_clean_repo(["other"])
+    assert git.no_unstaged_changes(["other"])
+
+
+def test_stage_changes_in_paths(temp_git_repo):
+    os.mkdir("scoped")
+    for filename in ("scoped/modified.txt", "outside.txt"):
+        with open(filename, "w") as file:
+            print("Test file", file=file)
+    check_call(["git", "add", "-A"])
+    check_call(["git", "commit", "-m", "Added test files"])
+
+    for filename in ("scoped/modified.txt", "outside.txt"):
+        with open(filename, "a") as file:
+            print("Modified line", file=file)
+    with open("scoped/created.txt", "w") as file:
+        print("New file", file=file)
+    with open("created.txt", "w") as file:
+        print("New file", file=file)
+    os.utime("scoped/modified.txt")
+
+    git.stage_changes(["scoped"])
+    assert git.changed_paths_outside(["scoped"]) == ["outside.txt"]
+
+    status = check_output(["git", "status", "--porcelain"], encoding="utf-8")
+    assert status.splitlines() == [
+        " M outside.txt",
+        "A  scoped/created.txt",
+        "M  scoped/modified.txt",
+        "?? created.txt",
+    ]
@@ -0,0 +1,86 @@
+from git_rex.bash import BashScript
+from git_rex.index import bash_command_names, fingerprint, python_command_names
+from git_rex.python import PythonScript
+
+
+def test_fingerprint_ignores_comments_and_whitespace():
+    script = BashScript(3, ("black .", "isort ."))
+    reformatted = BashScript(10, ("# Format", "  black .  ", "", "isort ."))
+
+    assert fingerprint(reformatted) == fingerprint(script)
+
+
+def test_fingerprint_depends_on_commands():
+    assert fingerprint(BashScript(3, ("black .",))) != fingerprint(
+        BashScript(3, ("isort .",))
+    )
+
+
+def test_fingerprint_depends_on_syntax():
+    assert fingerprint(BashScript(3, ("pass",))) != fingerprint(
+        PythonScript(3, ("pass",))
+    )
+
+
+def test_python_fingerprint_keeps_indentation():
+    script = PythonScript(3, ("if x:", "    y()", "z()"))
+    reindented = PythonScript(3, ("if x:", "    y()", "    z()"))
+
+    assert fingerprint(reindented) != fingerprint(script)
+
+
+def test_bash_command_names():
+    names = bash_command_names(
+        [
+            "if ! git diff --quiet; then",
+            "  find . -name '*.py' | xargs black",
+            "fi",
+            'echo "$(date)" > stamp.txt',
+            "while read -r line; do sed -i 's/a/b/' \"$line\"; done < files.txt",
+        ]
+    )
+
+    assert names == {"git", "find", "xargs", "black", "echo", "date", "read", "sed"}
+
+
+def test_bash_command_names_unwraps_launchers():
+    names = bash_command_names(
+        [
+            "poetry run black .",
+            "env -u HOME PYTHONPATH=src python -m isort .",
+            "sudo -u nobody time -p npx --yes prettier --write .",
+            "command exec flake8",
+        ]
+    )
+
+    assert names == {
+        "poetry",
+        "black",
+        "env",
+        "python",
+        "isort",
+        "sudo",
+        "time",
+        "npx",
+        "prettier",
+        "command",
+        "exec",
+        "flake8",
+    }
+
+
+def test_python_command_names():
+    names = python_command_names(
+        [
+            "import subprocess",
+            "subprocess.check_call(('black', '.'))",
+            "subprocess.run('isort . && flake8', shell=True)",
+            "print('not a command')",
+        ]
+    )
+
+    assert names == {"black", "isort", "flake8"}
+
+
+def test_python_command_names_syntax_error():
+    assert python_command_names(["subprocess.run(['black'"]) == set()
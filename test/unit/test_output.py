@@ -0,0 +1,38 @@
+import fcntl
+
+from git_rex.output import MAX_LINE_LENGTH, Tail, remove_finished_logs
+
+
+def test_tail_keeps_last_lines():
+    tail = Tail(3)
+    tail.add(b"one\ntwo\nth")
+    tail.add(b"ree\nfour\nfive")
+    tail.finish()
+
+    assert list(tail.lines) == [b"three", b"four", b"five"]
+    assert tail.count == 5
+
+
+def test_tail_truncates_long_lines():
+    tail = Tail(2)
+    for _ in range(100):
+        tail.add(b"x" * 10000)
+    tail.add(b"\nlast\n")
+
+    assert list(tail.lines) == [b"x" * MAX_LINE_LENGTH, b"last"]
+    assert tail.count == 2
+
+
+def test_remove_finished_logs(tmp_path):
+    for name in ("output.log", "output-111.log", "output-222.log", "output-a.log"):
+        (tmp_path / name).write_text("Some output\n")
+    with open(tmp_path / "output-222.log", "ab") as running:
+        fcntl.flock(running, fcntl.LOCK_EX)
+
+        remove_finished_logs(tmp_path / "output.log")
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "output-222.log",
+        "output-a.log",
+        "output.log",
+    ]
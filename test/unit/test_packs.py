@@ -0,0 +1,115 @@
+from pathlib import Path
+from subprocess import check_call, check_output
+
+import pytest
+
+from git_rex import git, process
+from git_rex.packs import NO_PACK_READER_ENV, PackReader, pack_reader
+
+
+def make_history(commits=20):
+    """Commits a file that grows a little each time, so packs hold deltas."""
+    for i in range(commits):
+        with open("file.txt", "a") as f:
+            print(
+                f"Line {i} of a file that is long enough to be worth deltifying", file=f
+            )
+        check_call(["git", "add", "file.txt"])
+        check_call(["git", "commit", "--quiet", "-m", f"Commit {i}\n\nBody {i}"])
+
+
+def all_objects():
+    output = check_output(
+        ["git", "cat-file", "--batch-all-objects", "--batch-check"], encoding="ascii"
+    )
+    return [line.split()[:2] for line in output.splitlines()]
+
+
+def assert_reads_like_git(reader):
+    objects = all_objects()
+    assert objects
+    for oid, object_type in objects:
+        contents = check_output(["git", "cat-file", object_type, oid])
+        assert reader.read(oid) == (object_type, contents)
+
+
+def test_loose_objects(temp_git_repo):
+    make_history(3)
+    assert_reads_like_git(PackReader(Path(".git/objects")))
+
+
+@pytest.mark.parametrize("delta_base_offset", ["true", "false"])
+def test_packed_objects(temp_git_repo, delta_base_offset):
+    make_history()
+    check_call(
+        ["git", "-c", f"repack.useDeltaBaseOffset={delta_base_offset}", "repack"]
+        + ["--quiet", "-a", "-d", "-f", "--depth=5"]
+    )
+    assert not list(Path(".git/objects").glob("??/*"))
+
+    assert_reads_like_git(PackReader(Path(".git/objects")))
+
+
+def test_packs_added_after_opening(temp_git_repo):
+    make_history(3)
+    reader = PackReader(Path(".git/objects"))
+    make_history(3)
+    check_call(["git", "repack", "--quiet", "-a", "-d"])
+
+    assert_reads_like_git(reader)
+
+
+def test_missing_object(temp_git_repo):
+    make_history(1)
+    reader = PackReader(Path(".git/objects"))
+
+    assert reader.read("0" * 40) is None
+    assert reader.commit_tree("0" * 40) is None
+
+
+@pytest.mark.parametrize("commit_graph", [False, True])
+def test_commit_tree(temp_git_repo, commit_graph):
+    make_history(5)
+    check_call(["git", "repack", "--quiet", "-a", "-d"])
+    if commit_graph:
+        check_call(["git", "commit-graph", "write", "--reachable"])
+    reader = PackReader(Path(".git/objects"))
+
+    for rev in ("HEAD", "HEAD~3"):
+        commit_hash, tree = check_output(
+            ["git", "rev-parse", rev, f"{rev}^{{tree}}"], encoding="ascii"
+        ).split()
+        assert reader.commit_tree(commit_hash) == tree
+
+
+def test_commit_reads_without_processes(temp_git_repo):
+    make_history(5)
+    check_call(["git", "gc", "--quiet"])
+    commit_hash, parent, tree = check_output(
+        ["git", "rev-parse", "HEAD", "HEAD~", "HEAD^{tree}"], encoding="ascii"
+    ).split()
+
+    process.enable()
+    try:
+        commit = git.Commit(commit_hash)
+        assert commit.hash == commit_hash
+        assert commit.message == "Commit 4\n\nBody 4\n"
+        assert commit.parents == [parent]
+        assert git.tree_of(commit_hash) == tree
+        assert process.records() == []
+    finally:
+        process._records = None
+
+
+def test_disabled_by_environment(temp_git_repo, monkeypatch):
+    assert pack_reader(str(temp_git_repo)) is not None
+    monkeypatch.setenv(NO_PACK_READER_ENV, "1")
+    assert pack_reader(str(temp_git_repo)) is None
+
+
+def test_disabled_by_replacement_objects(temp_git_repo):
+    make_history(2)
+    check_call(["git", "replace", "HEAD", "HEAD~"])
+
+    assert pack_reader(str(temp_git_repo)) is None
+    assert git.Commit("main").message == "Commit 0\n\nBody 0\n"
@@ -0,0 +1,55 @@
+import io
+from subprocess import PIPE
+
+import pytest
+
+from git_rex import git, process
+
+
+@pytest.fixture
+def records():
+    process.enable()
+    yield process.records
+    process._records = None
+
+
+def test_records_argv_and_exit_status(records):
+    p = process.Process(["sh", "-c", "exit 3"], stdout=PIPE)
+    p.communicate()
+
+    (record,) = records()
+    assert record.argv == ["sh", "-c", "exit 3"]
+    assert record.name == "sh"
+    assert record.returncode == 3
+    assert record.wall is not None and record.wall >= 0
+
+
+def test_not_recorded_unless_enabled():
+    assert not process.is_enabled()
+    assert process.call("true", shell=True) == 0
+
+
+def test_git_commands_recorded_by_subcommand(records, temp_git_repo):
+    git.git("rev-parse", "--git-dir")
+    assert not git.git_succeeds("diff", "--quiet", "--no-index", "/dev/null", __file__)
+
+    assert [(r.name, r.returncode) for r in records()] == [
+        ("git rev-parse", 0),
+        ("git diff", 1),
+    ]
+
+
+def test_print_summary(records):
+    for command in ("true", "true", "false"):
+        process.call(command, shell=True)
+
+    output = io.StringIO()
+    process.print_summary(output)
+
+    lines = output.getvalue().splitlines()
+    assert lines[0].startswith("processes: 3 started, ")
+    assert lines[1].split() == ["count", "ms", "command"]
+    assert sorted(line.split()[::2] for line in lines[2:]) == [
+        ["1", "false"],
+        ["2", "true"],
+    ]
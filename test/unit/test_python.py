@@ -0,0 +1,158 @@
+import os
+import sys
+from typing import List
+
+import pytest
+
+from git_rex.bash import UserCodeError
+from git_rex.python import PythonScript
+from git_rex.resources import TIMEOUT_EXIT_CODE, ResourceLimits
+from git_rex.timings import CommandTiming
+
+
+def test_change_directory_in_script(temp_working_dir):
+    script = PythonScript(
+        1,
+        (
+            "import os",
+            "os.mkdir('foo')",
+            "os.chdir('foo')",
+            "open('file.txt', 'w').write('New file created by rex-commit\\n')",
+        ),
+    )
+    script.execute()
+
+    # Verify the working directory was restored afterwards
+    assert os.getcwd() == str(temp_working_dir)
+    assert not os.path.exists("file.txt")
+    file_txt = open("foo/file.txt").read().splitlines()
+    assert file_txt == ["New file created by rex-commit"]
+
+
+def test_environment_restored(temp_working_dir):
+    script = PythonScript(1, ("import os", "os.environ['REX_TEST_VARIABLE'] = '1'"))
+    script.execute()
+
+    assert "REX_TEST_VARIABLE" not in os.environ
+
+
+def test_indentation_preserved(temp_working_dir, capfd: pytest.CaptureFixture[str]):
+    script = PythonScript(1, ("for i in range(2):", "    print(i)", "print('done')"))
+    script.execute()
+    stdout, _ = capfd.readouterr()
+    assert stdout == "0\n1\ndone\n"
+
+
+def test_error_output_first_line_5(temp_working_dir, capfd: pytest.CaptureFixture[str]):
+    script = PythonScript(5, ("print('hi there')", "x = {}", "x['missing']"))
+    with pytest.raises(UserCodeError) as ex:
+        script.execute()
+    assert ex.value.resultcode == 1
+    stdout, stderr = capfd.readouterr()
+    assert stderr == "error: 7: KeyError: 'missing'\n"
+    assert stdout == "hi there\n"
+
+
+def test_syntax_error_line(temp_working_dir, capfd: pytest.CaptureFixture[str]):
+    script = PythonScript(3, ("pass", "if True"))
+    with pytest.raises(UserCodeError):
+        script.execute()
+    _, stderr = capfd.readouterr()
+    assert stderr.startswith("error: 4: SyntaxError: ")
+
+
+def test_exit_code(temp_working_dir):
+    script = PythonScript(1, ("import sys", "sys.exit(3)"))
+    with pytest.raises(UserCodeError) as ex:
+        script.execute()
+    assert ex.value.resultcode == 3
+
+
+def test_exit_zero(temp_working_dir):
+    PythonScript(1, ("import sys", "sys.exit(0)")).execute()
+
+
+def test_no_interactive_prompts(temp_working_dir):
+    script = PythonScript(1, ("import sys", "assert sys.stdin.read() == ''"))
+    script.execute()
+
+
+def test_verbose_script(temp_working_dir, capfd: pytest.CaptureFixture[str]):
+    script = PythonScript(1, ("for i in range(2):", "    print(i)"))
+    script.execute(verbose=True)
+    stdout, stderr = (o.splitlines() for o in capfd.readouterr())
+    assert stdout == ["0", "1"]
+    assert stderr == [
+        "+ for i in range(2):",
+        "+ print(i)",
+        "+ for i in range(2):",
+        "+ print(i)",
+        "+ for i in range(2):",
+    ]
+
+
+def test_line_timings(temp_working_dir):
+    script = PythonScript(
+        2, ("import time", "for i in range(2):", "    time.sleep(0.1)", "x = 1")
+    )
+    timings: List[CommandTiming] = []
+    script.execute(timings=timings)
+
+    assert [(t.lineno, t.command) for t in timings] == [
+        (2, "import time"),
+        (3, "for i in range(2):"),
+        (4, "time.sleep(0.1)"),
+        (3, "for i in range(2):"),
+        (4, "time.sleep(0.1)"),
+        (3, "for i in range(2):"),
+        (5, "x = 1"),
+    ]
+    assert all(t.seconds >= 0.1 for t in timings if t.lineno == 4)
+
+
+def test_timeout(temp_working_dir, capfd: pytest.CaptureFixture[str]):
+    script = PythonScript(
+        3,
+        (
+            "import time",
+            "try:",
+            "    time.sleep(5)",
+            "except Exception:",
+            "    pass",
+            "open('file.txt', 'w')",
+        ),
+    )
+    with pytest.raises(UserCodeError) as ex:
+        script.execute(limits=ResourceLimits(timeout=0.2))
+
+    assert ex.value.resultcode == TIMEOUT_EXIT_CODE
+    assert not os.path.exists("file.txt")
+    _, stderr = capfd.readouterr()
+    assert stderr == "error: 5: script timed out after 0.2s\n"
+
+
+def test_resource_usage(temp_working_dir):
+    script = PythonScript(1, ("sum(range(100000))",))
+    usage = script.execute()
+
+    assert usage.wall > 0
+    assert usage.user >= 0
+
+
+def test_imports_from_working_directory(temp_working_dir):
+    with open("helper.py", "w") as f:
+        print("VALUE = 'first'", file=f)
+    script = PythonScript(
+        1, ("import helper", "open('value.txt', 'w').write(helper.VALUE)")
+    )
+    script.execute()
+    assert open("value.txt").read() == "first"
+    assert "" not in sys.path
+    assert "helper" not in sys.modules
+    assert not os.path.exists("__pycache__")
+
+    # A later script sees the module as it is then
+    with open("helper.py", "w") as f:
+        print("VALUE = 'second'", file=f)
+    script.execute()
+    assert open("value.txt").read() == "second"
@@ -0,0 +1,64 @@
+import pytest
+
+from git_rex.messages import summarize_parsed_scripts, summarize_scripts
+
+MESSAGES = [
+    "Some commit\n\nNo code",
+    "Some commit\n\nInline ```bash``` ticks",
+    "Some commit\n\n```bash\ndo a thing\n```",
+    "Some commit\n\n  ```bash  \ndo a thing\n  ```\n\n```python\npass\n```\n",
+    "Some commit\n\n```bash\ndo a thing",
+    "Some commit\n\n```\ndo a thing\n```",
+    "Some commit\n\n```bash\ndo a thing\n```bash",
+    "Some commit\n\n```bash\nls\n```\n```sh\nls\n```\n",
+    "Some commit\r\n\r\n```bash\r\ndo a thing\r\n```\r\n",
+    "Some commit\n\n```bash\fdo a thing\n```\n",
+    "Some commit\n\n```bash paths=src,docs\ndo a thing\n```\n",
+    "Some commit\n\n```bash path=src\ndo a thing\n```\n",
+    "Some commit\n\n```bash\ndo a thing\n``` paths=src\n",
+    "Some commit\n\n``` paths=src\ndo a thing\n```\n",
+]
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_matches_parse_message(message):
+    fast = summarize_scripts(message)
+    slow = summarize_parsed_scripts(message)
+
+    if slow is None:
+        assert fast is None
+    else:
+        assert fast is not None
+        assert (fast.blocks, fast.error) == (slow.blocks, slow.error)
+
+
+def test_blocks():
+    summary = summarize_scripts(MESSAGES[3])
+
+    assert summary.blocks == [(3, "bash"), (7, "python")]
+    assert summary.error is None
+
+
+def test_no_code_blocks():
+    assert summarize_scripts(MESSAGES[1]) is None
+
+
+def test_unterminated_code_block():
+    summary = summarize_scripts(MESSAGES[4])
+
+    assert summary.blocks == []
+    assert summary.error == "Code block not terminated in commit message"
+
+
+def test_label_on_closing_ticks():
+    summary = summarize_scripts(MESSAGES[6])
+
+    assert summary.blocks == []
+    assert summary.error == "5: Unexpected start of new code section"
+
+
+def test_unsupported_attribute():
+    summary = summarize_scripts(MESSAGES[11])
+
+    assert summary.blocks == []
+    assert summary.error == "3: Unsupported code section attribute path"